@@ -0,0 +1,265 @@
+"""Benchmarks for the overhead of testhdl itself.
+
+Everything runs against the `fake` simulator backend, so that the numbers
+don't depend on any EDA tool being installed. Results are written to a JSON
+file, to compare them between versions:
+
+    python benchmarks/bench_harness.py --output bench_results.json
+"""
+
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import argparse
+import tempfile
+import contextlib
+import datetime as dt
+
+sys.path.insert(0, Path(__file__).absolute().parent.parent.as_posix())
+
+from testhdl import TestHDL, utils  # noqa: E402
+from testhdl.logging import setup_logging, stop_logging  # noqa: E402
+from testhdl.models import TestCase  # noqa: E402
+from testhdl.simulator_fake import SimulatorFake, fake_tool  # noqa: E402
+from testhdl.test_framework import TestFrameworkUVM, TestFrameworkVHDL  # noqa: E402
+
+
+def make_testhdl(root: Path, argv: List[str]) -> TestHDL:
+    args = TestHDL.get_argument_parser().parse_args(argv)
+    th = TestHDL(args, root / "logs")
+    th.set_workdir(root / "build")
+    th.set_cachedir(root / "cache")
+    th.set_simulator("fake")
+    th.set_default_seed(1)
+    return th
+
+
+def make_sources(root: Path, count: int) -> List[Path]:
+    path_rtl = root / "rtl"
+    path_rtl.mkdir(parents=True, exist_ok=True)
+
+    paths = []
+    for i in range(count):
+        path = path_rtl / f"module_{i}.sv"
+        path.write_text(f"module module_{i}; endmodule\n")
+        paths.append(path)
+
+    return paths
+
+
+def timed(function: Callable[[], None]) -> float:
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            time_start = time.perf_counter()
+            function()
+            return time.perf_counter() - time_start
+
+
+def bench_compile(root: Path, libraries: int, source_lists: int) -> Dict:
+    """Compile orchestration: many libraries, each made of many source lists."""
+    th = make_testhdl(root, ["--compile-only"])
+    sources = make_sources(root, source_lists)
+
+    for i in range(libraries):
+        library = th.add_library(f"lib_{i}")
+        for path in sources:
+            library.add_systemverilog_sources(path)
+
+    th.add_test("Test")
+    elapsed = timed(th.run)
+    invocations = libraries * (source_lists + 1)
+
+    return {
+        "params": {"libraries": libraries, "source_lists": source_lists},
+        "seconds": elapsed,
+        "metrics": {"seconds_per_invocation": elapsed / invocations},
+    }
+
+
+def bench_run_program(root: Path, lines: int, line_length: int) -> Dict:
+    """Streaming throughput of `utils.run_program` on a chatty simulation."""
+    root.mkdir(parents=True, exist_ok=True)
+    args = [
+        *fake_tool("vsim"),
+        f"+fake_lines={lines}",
+        f"+fake_line_length={line_length}",
+    ]
+    path_log = root / "simulator.log"
+
+    elapsed = timed(lambda: utils.run_program(args, root, path_log))
+    size = path_log.stat().st_size
+
+    return {
+        "params": {"lines": lines, "line_length": line_length},
+        "seconds": elapsed,
+        "metrics": {
+            "lines_per_second": lines / elapsed,
+            "megabytes_per_second": size / elapsed / 1024 / 1024,
+        },
+    }
+
+
+def bench_verdict(root: Path, lines: int, style: str) -> Dict:
+    """Verdict parsing: `did_error_happen` plus the framework error count."""
+    root.mkdir(parents=True, exist_ok=True)
+    path_log = root / "simulator.log"
+    args = [
+        *fake_tool("vsim"),
+        f"+fake_lines={lines}",
+        f"+fake_style={style}",
+        "+fake_error_rate=0.001",
+    ]
+    timed(lambda: utils.run_program(args, root, path_log))
+
+    simulator = SimulatorFake(root, root)
+    if style == "uvm":
+        framework = TestFrameworkUVM("top")
+    else:
+        framework = TestFrameworkVHDL()
+    test = TestCase("Test", [], [], [])
+
+    def verdict():
+        simulator.did_error_happen(path_log)
+        framework.get_number_of_errors(test, path_log)
+
+    elapsed = timed(verdict)
+
+    return {
+        "params": {"lines": lines, "style": style},
+        "seconds": elapsed,
+        "metrics": {"lines_per_second": lines / elapsed},
+    }
+
+
+def bench_scheduler(root: Path, tests: int, jobs: int) -> Dict:
+    """End to end makespan of a regression of near-instant tests."""
+    th = make_testhdl(root, ["--all", "--jobs", str(jobs)])
+    library = th.add_library("work")
+    library.add_systemverilog_sources(*make_sources(root, 1))
+
+    for i in range(tests):
+        th.add_test(f"Test{i}", runtime_args=["+fake_lines=10"])
+
+    elapsed = timed(th.run)
+
+    return {
+        "params": {"tests": tests, "jobs": jobs},
+        "seconds": elapsed,
+        "metrics": {
+            "tests_per_second": tests / elapsed,
+            "overhead_per_test": elapsed * jobs / tests,
+        },
+    }
+
+
+def bench_logging(root: Path, records: int, background: bool) -> Dict:
+    """Cost of a log record going through the configured handlers. With
+    `background`, the time to drain the queue is reported separately, as it
+    is not spent by the thread logging."""
+    setup_logging(root, background=background)
+    log = logging.getLogger("bench")
+
+    def emit():
+        for i in range(records):
+            log.debug("Record %d", i, extra={"test": "bench"})
+
+    elapsed = timed(emit)
+
+    time_start = time.perf_counter()
+    stop_logging()
+    drained = time.perf_counter() - time_start
+
+    return {
+        "params": {"records": records, "background": background},
+        "seconds": elapsed,
+        "metrics": {
+            "records_per_second": records / elapsed,
+            "records_per_second_drained": records / (elapsed + drained),
+        },
+    }
+
+
+def get_version() -> str:
+    try:
+        from importlib.metadata import version
+
+        return version("testhdl")
+    except Exception:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-o", "--output", type=Path, default=Path("bench_results.json")
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="run only the smaller sizes"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1,
+        help="workers for the scheduler benchmark",
+    )
+    args = parser.parse_args()
+
+    if args.quick:
+        test_counts = [1, 10, 100]
+        lines = 10_000
+    else:
+        test_counts = [1, 10, 100, 1_000, 10_000]
+        lines = 1_000_000
+
+    benchmarks = [
+        ("compile", lambda root: bench_compile(root, 10, 10)),
+        ("run_program", lambda root: bench_run_program(root, lines, 80)),
+        ("verdict_vhdl", lambda root: bench_verdict(root, lines, "vhdl")),
+        ("verdict_uvm", lambda root: bench_verdict(root, lines, "uvm")),
+    ]
+    for count in test_counts:
+        benchmarks.append(
+            (
+                f"scheduler_{count}",
+                lambda root, count=count: bench_scheduler(root, count, args.jobs),
+            )
+        )
+    # Last, since it configures logging for the whole process
+    benchmarks.append(
+        ("logging_sync", lambda root: bench_logging(root, lines // 10, False))
+    )
+    benchmarks.append(
+        ("logging_queued", lambda root: bench_logging(root, lines // 10, True))
+    )
+
+    results = []
+    for name, benchmark in benchmarks:
+        with tempfile.TemporaryDirectory(prefix="testhdl_bench_") as tmpdir:
+            result = benchmark(Path(tmpdir) / name)
+        result["benchmark"] = name
+        results.append(result)
+        print(f"{name:>20}: {result['seconds']:8.3f}s {result['metrics']}")
+
+    report = {
+        "metadata": {
+            "version": get_version(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": dt.datetime.now(tz=dt.timezone.utc).isoformat(),
+        },
+        "results": results,
+    }
+
+    with open(args.output, "w") as outfile:
+        json.dump(report, outfile, indent=2)
+
+    print(f"Results written to {args.output.as_posix()}")
+
+
+if __name__ == "__main__":
+    main()
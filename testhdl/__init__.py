@@ -1,3 +1,3 @@
 from testhdl.test_hdl import TestHDL
-from testhdl.hooks import TestHook
+from testhdl.hooks import GeneratorHook, TestHook
 from testhdl.errors import TestRunError
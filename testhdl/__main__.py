@@ -0,0 +1,5 @@
+from testhdl.cli import main
+
+import sys
+
+sys.exit(main())
@@ -0,0 +1,112 @@
+"""Command line tools that work on the results of past runs, without the
+run script of a project:
+
+    testhdl search --id MY_ID --tests
+"""
+
+from pathlib import Path
+from typing import List, Optional
+
+from testhdl.message_index import MESSAGE_INDEX_FILENAME, MessageIndex
+
+import sys
+import argparse
+
+
+def _format_time(sim_time: Optional[float], time_unit: Optional[str]) -> str:
+    if sim_time is None:
+        return "-"
+    return f"{sim_time:g}{time_unit or ''}"
+
+
+def search(args: argparse.Namespace) -> int:
+    path_db = args.logs / MESSAGE_INDEX_FILENAME
+    if not path_db.exists():
+        sys.stderr.write(
+            f"No message index in {args.logs.as_posix()}, "
+            "enable it with enable_message_index() and run the tests\n"
+        )
+        return 1
+
+    index = MessageIndex(path_db)
+    try:
+        run = index.resolve_run(args.run)
+    except KeyError:
+        sys.stderr.write(f"Cannot find run {args.run}\n")
+        return 1
+
+    filters = {
+        "message_id": args.id,
+        "component": args.component,
+        "severity": args.severity,
+        "test": args.test,
+        "text": args.text,
+    }
+
+    if args.tests:
+        for test, count in index.count_by_test(run, **filters):
+            print(f"{test}: {count}")
+        return 0
+
+    messages = index.search(
+        run, first_per_test=args.first, limit=args.limit, **filters
+    )
+    for found in messages:
+        message = found.message
+        message_id = f"[{message.message_id}] " if message.message_id else ""
+        print(
+            f"{found.test} {message.severity} "
+            f"@ {_format_time(message.sim_time, message.time_unit)} "
+            f"{message.component or '-'} {message_id}{message.text} "
+            f"({found.path}:{message.offset})"
+        )
+
+    return 0
+
+
+def get_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="testhdl")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_search = subparsers.add_parser(
+        "search", help="search the messages of the tests of a run"
+    )
+    parser_search.set_defaults(function=search)
+    parser_search.add_argument(
+        "--logs", type=Path, default=Path("logs"), help="the logs folder"
+    )
+    parser_search.add_argument(
+        "--run",
+        type=int,
+        default=-1,
+        help="the run to search. Negative numbers count from the latest run (-1)",
+    )
+    parser_search.add_argument("--id", help="message ID, e.g. the UVM ID")
+    parser_search.add_argument(
+        "--component", help="prefix of the component or instance path"
+    )
+    parser_search.add_argument(
+        "--severity", help="e.g. error, matches both UVM_ERROR and Error"
+    )
+    parser_search.add_argument("--test", help="only messages of this test")
+    parser_search.add_argument("--text", help="part of the message text")
+    parser_search.add_argument(
+        "--first",
+        action="store_true",
+        help="only the first matching message of every test",
+    )
+    parser_search.add_argument(
+        "--tests",
+        action="store_true",
+        help="only list the tests with matching messages, and how many",
+    )
+    parser_search.add_argument(
+        "--limit", type=int, default=100, help="maximum number of messages shown"
+    )
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = get_argument_parser().parse_args(argv)
+    return args.function(args)
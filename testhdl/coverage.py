@@ -0,0 +1,168 @@
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from testhdl import utils
+from testhdl.simulator_base import SimulatorBase
+from testhdl.tracing import Tracer
+from testhdl.resource_pools import ResourcePools
+
+import os
+import logging
+import threading
+
+log = logging.getLogger("coverage")
+
+
+class CoverageMerger:
+    """Merges coverage databases incrementally, while tests are still
+    running.
+
+    Every time `batch_size` databases are waiting, they get merged together
+    in the background into an intermediate database, which is itself queued
+    to be merged again. This builds a merge tree whose last level, done by
+    `finish`, is small no matter how many tests ran.
+
+    The final database is written to a temporary file and then renamed, so
+    an interrupted merge never leaves a broken database behind.
+    """
+
+    simulator: SimulatorBase
+    path_dest: Path
+    path_mergedir: Path
+    batch_size: int
+
+    pending: List[Path]
+    futures: Set[Future]
+    merges_done: int
+
+    def __init__(
+        self,
+        simulator: SimulatorBase,
+        path_dest: Path,
+        jobs: int = 1,
+        batch_size: int = 16,
+        tracer: Optional[Tracer] = None,
+        pools: Optional[ResourcePools] = None,
+        resources: Optional[Dict[str, float]] = None,
+        background_nice: int = 0,
+    ):
+        self.simulator = simulator
+        self.tracer = tracer if tracer is not None else Tracer()
+        # Resources taken from the pools by every merge
+        self.pools = pools if pools is not None else ResourcePools({})
+        self.resources = resources if resources is not None else {}
+        self.path_dest = path_dest
+        self.path_mergedir = path_dest / "coverage_merge"
+        self.batch_size = max(2, batch_size)
+
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=jobs,
+            initializer=utils.set_thread_nice,
+            initargs=(background_nice,),
+        )
+        self.pending = []
+        self.futures = set()
+        self.merges_done = 0
+
+        utils.rmdir_if_exists(self.path_mergedir)
+        self.path_mergedir.mkdir(parents=True)
+
+    def add(self, path_database: Path):
+        """Queue a database to be merged."""
+        with self.lock:
+            self.pending.append(path_database)
+
+            if len(self.pending) < self.batch_size:
+                return
+
+            batch = self.pending[: self.batch_size]
+            del self.pending[: self.batch_size]
+
+            path_merged = self.path_mergedir / f"partial_{self.merges_done}"
+            path_merged = path_merged.with_suffix(
+                Path(self.simulator.coverage_filename).suffix
+            )
+            self.merges_done += 1
+
+            future = self.executor.submit(self._merge_batch, path_merged, batch)
+            self.futures.add(future)
+
+    def _merge_batch(self, path_merged: Path, batch: List[Path]):
+        try:
+            with self.pools.use(self.resources), self.tracer.span(
+                "coverage merge", "coverage", databases=len(batch)
+            ):
+                self.simulator.merge_coverage_files(path_merged, batch)
+        except Exception:
+            log.exception("Intermediate coverage merge failed, will retry at the end")
+            with self.lock:
+                self.pending += batch
+            return
+
+        for path in batch:
+            # Intermediate databases are not needed once merged
+            if path.parent == self.path_mergedir:
+                path.unlink()
+
+        self.add(path_merged)
+
+    def finish(self):
+        """Waits for the merges in progress, then merges everything that is
+        left into the destination folder."""
+
+        while True:
+            with self.lock:
+                futures = set(self.futures)
+                self.futures = set()
+
+            if len(futures) == 0:
+                break
+
+            wait(futures)
+
+        self.executor.shutdown()
+
+        if len(self.pending) == 0:
+            log.warning("No coverage database to merge")
+            return
+
+        path_final = self.path_dest / self.simulator.coverage_filename
+        path_temp = self.path_mergedir / f"final{path_final.suffix}"
+        with self.pools.use(self.resources), self.tracer.span(
+            "coverage merge", "coverage", databases=len(self.pending), final=True
+        ):
+            self.simulator.merge_coverage_files(path_temp, self.pending)
+        os.replace(path_temp, path_final)
+
+        utils.rmdir_if_exists(self.path_mergedir)
+        self.pending = []
+
+
+def parse_ranktest_output(path_report: Path, databases: List[Path]) -> List[Path]:
+    """Parses the report of a coverage ranking, returning the databases that
+    contribute to the total coverage in the order they were ranked.
+
+    Lines are matched against the paths of the databases, as given to the
+    ranking tool, or against the test names (the names of their folders).
+    Everything after the list of non contributing tests is ignored.
+    """
+    by_token: Dict[str, Path] = {}
+    for database in databases:
+        by_token[database.as_posix()] = database
+        by_token[database.parent.name] = database
+
+    ranked: List[Path] = []
+    with open(path_report, "r") as report:
+        for line in report:
+            if "non-contributing" in line.lower():
+                break
+
+            for token in line.split():
+                database = by_token.get(token)
+                if database is not None and database not in ranked:
+                    ranked.append(database)
+                    break
+
+    return ranked
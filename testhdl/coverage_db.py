@@ -0,0 +1,186 @@
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from testhdl.run_database import RunDatabase
+
+import re
+
+MERGED_SCOPE = "merged"
+
+# In the logs folder, kept by --clean so that the trend survives it
+COVERAGE_DB_FILENAME = "coverage.db"
+
+# Rows of the coverage tables in text reports, e.g.
+#     Branches                        10         8         2    80.00%
+re_coverage_row = re.compile(
+    r"^\s*(Statements|Branches|Conditions|Expressions|Toggles|Toggle Bins|"
+    r"FSM States|FSM Transitions|Covergroups|Covergroup Bins|Assertions|Directives)"
+    r"\s+([0-9]+)\s+([0-9]+)\s+([0-9]+)\s+[0-9.]+%"
+)
+re_instance = re.compile(r"^=+\s*Instance:\s*(\S+)")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS coverage (
+    run INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    scope TEXT NOT NULL,
+    instance TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    bins INTEGER NOT NULL,
+    hits INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coverage_by_run ON coverage (run, scope);
+"""
+
+
+@dataclass
+class CoverageMetric:
+    instance: str
+    metric: str
+    bins: int
+    hits: int
+
+    @property
+    def percentage(self) -> float:
+        if self.bins == 0:
+            return 100.0
+        return 100.0 * self.hits / self.bins
+
+
+@dataclass
+class CoverageDiff:
+    instance: str
+    metric: str
+    before: Optional[CoverageMetric]
+    after: Optional[CoverageMetric]
+
+    @property
+    def hits_delta(self) -> int:
+        before = self.before.hits if self.before is not None else 0
+        after = self.after.hits if self.after is not None else 0
+        return after - before
+
+
+def parse_coverage_report(path_report: Path) -> List[CoverageMetric]:
+    """Parses a text coverage report by instance (e.g. the output of
+    `vcover report -byinstance`) into a list of metrics. Only the first
+    table row of every metric for an instance is kept, as detailed reports
+    repeat the summary."""
+    metrics: List[CoverageMetric] = []
+    seen = set()
+    instance = "/"
+
+    with open(path_report, "r") as report:
+        for line in report:
+            match = re_instance.match(line)
+            if match:
+                instance = match.group(1)
+                continue
+
+            match = re_coverage_row.match(line)
+            if match is None:
+                continue
+
+            key = (instance, match.group(1))
+            if key in seen:
+                continue
+            seen.add(key)
+
+            metrics.append(
+                CoverageMetric(
+                    instance=instance,
+                    metric=match.group(1),
+                    bins=int(match.group(2)),
+                    hits=int(match.group(3)),
+                )
+            )
+
+    return metrics
+
+
+class CoverageDatabase(RunDatabase):
+    """Coverage summaries of every run, stored in a SQLite database.
+
+    Every regression creates a run, and each run holds the metrics of every
+    test (scoped by test name) and of the merged coverage (scoped as
+    `MERGED_SCOPE`).
+    """
+
+    schema = SCHEMA
+
+    def add(self, run: int, scope: str, metrics: List[CoverageMetric]):
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM coverage WHERE run = ? AND scope = ?", (run, scope)
+            )
+            connection.executemany(
+                "INSERT INTO coverage (run, scope, instance, metric, bins, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (run, scope, m.instance, m.metric, m.bins, m.hits)
+                    for m in metrics
+                ],
+            )
+
+    def query(
+        self,
+        run: int,
+        scope: str = MERGED_SCOPE,
+        *,
+        instance: Optional[str] = None,
+        metric: Optional[str] = None,
+    ) -> List[CoverageMetric]:
+        """Returns the metrics of a scope in a run, optionally filtered by
+        instance path (a prefix) and metric name."""
+        sql = (
+            "SELECT instance, metric, bins, hits FROM coverage "
+            "WHERE run = ? AND scope = ?"
+        )
+        params: List = [run, scope]
+
+        if instance is not None:
+            sql += " AND instance LIKE ?"
+            params.append(instance + "%")
+        if metric is not None:
+            sql += " AND metric = ?"
+            params.append(metric)
+
+        with self._connect() as connection:
+            rows = connection.execute(sql + " ORDER BY instance, metric", params)
+            return [CoverageMetric(*row) for row in rows.fetchall()]
+
+    def totals(
+        self, run: int, scope: str = MERGED_SCOPE
+    ) -> Dict[str, Tuple[int, int]]:
+        """Returns (bins, hits) for every metric, summed over all instances."""
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT metric, SUM(bins), SUM(hits) FROM coverage "
+                "WHERE run = ? AND scope = ? GROUP BY metric ORDER BY metric",
+                (run, scope),
+            ).fetchall()
+        return {metric: (bins, hits) for metric, bins, hits in rows}
+
+    def diff(
+        self, run_before: int, run_after: int, scope: str = MERGED_SCOPE
+    ) -> List[CoverageDiff]:
+        """Returns the metrics whose hits or bins differ between two runs."""
+        before = {(m.instance, m.metric): m for m in self.query(run_before, scope)}
+        after = {(m.instance, m.metric): m for m in self.query(run_after, scope)}
+
+        diffs = []
+        for key in sorted(set(before) | set(after)):
+            metric_before = before.get(key)
+            metric_after = after.get(key)
+
+            if (
+                metric_before is not None
+                and metric_after is not None
+                and metric_before.bins == metric_after.bins
+                and metric_before.hits == metric_after.hits
+            ):
+                continue
+
+            diffs.append(CoverageDiff(key[0], key[1], metric_before, metric_after))
+
+        return diffs
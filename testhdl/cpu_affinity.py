@@ -0,0 +1,49 @@
+from typing import Dict, List
+
+import os
+import threading
+
+
+def get_available_cpus() -> List[int]:
+    """The CPUs this process is allowed to run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+
+    return list(range(os.cpu_count() or 1))
+
+
+def get_thread_budget(cores: int, jobs: int, threads: int) -> int:
+    """How many threads every simulation can use, so that the simulations
+    running at the same time don't use more cores than there are."""
+    return max(1, min(threads, cores // max(1, jobs)))
+
+
+class CpuAllocator:
+    """Hands out sets of CPUs to the simulations running at the same time.
+
+    Every set is made of the CPUs used by the fewest simulations, lowest
+    first, so that sets don't overlap as long as there are enough CPUs and
+    stay mostly contiguous."""
+
+    cpus: List[int]
+    users: Dict[int, int]
+
+    def __init__(self, cpus: List[int]):
+        self.cpus = cpus
+        self.users = {cpu: 0 for cpu in cpus}
+        self.lock = threading.Lock()
+
+    def allocate(self, count: int) -> List[int]:
+        with self.lock:
+            count = max(1, min(count, len(self.cpus)))
+            # The sort is stable, so ties are broken by CPU number
+            chosen = sorted(self.cpus, key=lambda cpu: self.users[cpu])[:count]
+            for cpu in chosen:
+                self.users[cpu] += 1
+
+        return sorted(chosen)
+
+    def release(self, cpus: List[int]):
+        with self.lock:
+            for cpu in cpus:
+                self.users[cpu] -= 1
@@ -0,0 +1,252 @@
+"""Stand-in EDA tools that mimic the output of vsim, xsim, vlog and friends.
+
+They are used by `SimulatorFake` and by the benchmarks to measure the
+overhead of testhdl itself, without any real simulator in the way. This
+module only depends on the standard library, so that it can be run as a
+plain script: `python fake_tools.py <tool> [args...]`.
+
+The behaviour of a simulation is configured with plusargs, falling back to
+environment variables (e.g. `+fake_lines=100` or `TESTHDL_FAKE_LINES=100`):
+
+- `fake_lines`: number of log lines to emit (default 100)
+- `fake_line_length`: approximate length of every line (default 80)
+- `fake_duration`: wall time in seconds the simulation should take (default 0)
+- `fake_progress_every`: emit a `{N ns}` timestamp every N lines (default 10)
+- `fake_error_rate`: probability of every line being an error (default 0)
+- `fake_fatal_rate`: probability of every line being a fatal, which also
+  stops the simulation (default 0)
+- `fake_style`: `vhdl` or `uvm`, the flavour of the messages (default vhdl)
+"""
+
+from pathlib import Path
+from typing import Dict, List
+
+import os
+import re
+import sys
+import time
+import stat
+import random
+
+TOOLS = [
+    "vlib",
+    "vdel",
+    "vlog",
+    "vcom",
+    "vsim",
+    "vcover",
+    "xvlog",
+    "xelab",
+    "xsim",
+]
+
+DEFAULTS = {
+    "fake_lines": "100",
+    "fake_line_length": "80",
+    "fake_duration": "0",
+    "fake_progress_every": "10",
+    "fake_error_rate": "0",
+    "fake_fatal_rate": "0",
+    "fake_style": "vhdl",
+}
+
+SIMULATION_TOOLS = ["vsim", "xsim"]
+
+
+def get_options(args: List[str]) -> Dict[str, str]:
+    options = {}
+    for key, default in DEFAULTS.items():
+        options[key] = os.environ.get(f"TESTHDL_{key.upper()}", default)
+
+    for arg in args:
+        match = re.match(r"^\+(fake_[a-z_]+)=(.*)$", arg)
+        if match and match.group(1) in DEFAULTS:
+            options[match.group(1)] = match.group(2)
+
+    return options
+
+
+def get_seed(args: List[str]) -> int:
+    for i, arg in enumerate(args):
+        if arg == "-sv_seed" and i + 1 < len(args):
+            return int(args[i + 1])
+        match = re.match(r"^\+(?:seed|verilator\+seed\+)=?([0-9]+)$", arg)
+        if match:
+            return int(match.group(1))
+
+    return 0
+
+
+def touch_outputs(tool: str, args: List[str]):
+    """Creates the files the real tool would create, so that the harness
+    finds what it expects on disk."""
+
+    if tool == "vlib":
+        for arg in args:
+            Path(arg).mkdir(parents=True, exist_ok=True)
+    elif tool == "vcover" and len(args) >= 2 and args[0] == "merge":
+        Path(args[1]).write_bytes(b"FAKE UCDB\n")
+    elif tool == "vcover" and "-output" in args and args[0] == "report":
+        write_coverage_report(Path(args[args.index("-output") + 1]), args[-1])
+    elif tool == "vsim":
+        for arg in args:
+            match = re.search(r"coverage save .* (\S+\.ucdb)$", arg)
+            if match:
+                Path(match.group(1)).write_bytes(b"FAKE UCDB\n")
+            match = re.search(r"profile report .*-file (\S+)$", arg)
+            if match:
+                write_profile_report(Path(match.group(1)))
+        if "-wave" in args:
+            Path(args[args.index("-wave") + 1]).write_bytes(b"FAKE WLF\n")
+
+
+def write_profile_report(path_report: Path):
+    instances = [
+        ("/top", 1000, 100.0, 50, 5.0),
+        ("/top/dut", 300, 30.0, 300, 30.0),
+        ("/top/env", 650, 65.0, 50, 5.0),
+        ("/top/env/monitor", 150, 15.0, 150, 15.0),
+        ("/top/env/scoreboard", 450, 45.0, 450, 45.0),
+    ]
+
+    with open(path_report, "w") as report:
+        report.write("Hierarchical profile\n")
+        report.write("Name                 Under(raw) Under(%) In(raw) In(%)\n")
+        for name, under, under_percent, inside, in_percent in instances:
+            indent = "  " * name.count("/")
+            report.write(
+                f"{indent}{name:<20} {under:>8} {under_percent:>7.1f}% "
+                f"{inside:>6} {in_percent:>5.1f}%\n"
+            )
+
+
+def write_coverage_report(path_report: Path, database: str):
+    # Hits depend on the database name, so that different tests differ
+    rng = random.Random(database)
+
+    with open(path_report, "w") as report:
+        for instance in ["/top", "/top/dut"]:
+            report.write(f"=== Instance: {instance}\n")
+            report.write("    Enabled Coverage   Bins   Hits   Misses  Coverage\n")
+            for metric in ["Statements", "Branches", "Toggles", "FSM States"]:
+                hits = rng.randrange(0, 101)
+                report.write(
+                    f"    {metric:<18} {100:>6} {hits:>6} {100 - hits:>8} {hits:>8}.00%\n"
+                )
+
+
+def emit_simulation(tool: str, args: List[str]) -> int:
+    options = get_options(args)
+    rng = random.Random(get_seed(args))
+
+    lines = int(options["fake_lines"])
+    line_length = int(options["fake_line_length"])
+    duration = float(options["fake_duration"])
+    progress_every = max(1, int(options["fake_progress_every"]))
+    error_rate = float(options["fake_error_rate"])
+    fatal_rate = float(options["fake_fatal_rate"])
+    uvm = options["fake_style"] == "uvm"
+
+    prefix = "# " if tool == "vsim" else ""
+    padding = "x" * max(0, line_length - 40)
+    out = sys.stdout
+    errors = 0
+    fatals = 0
+
+    time_start = time.perf_counter()
+    for i in range(lines):
+        sim_time = i * 10
+
+        if (i + 1) % progress_every == 0:
+            out.write(f"{prefix}{{{sim_time} ns}} progress {padding}\n")
+            # The harness reads line by line, so timestamps must not be
+            # held back in a buffer
+            out.flush()
+        elif rng.random() < fatal_rate:
+            fatals += 1
+            if uvm:
+                out.write(f"{prefix}UVM_FATAL fake.sv(1) @ {sim_time}: fake [FAKE] fatal\n")
+            else:
+                out.write(f"{prefix}** Fatal: fake fatal at {sim_time} ns\n")
+            break
+        elif rng.random() < error_rate:
+            errors += 1
+            if uvm:
+                out.write(f"{prefix}UVM_ERROR fake.sv(1) @ {sim_time}: fake [FAKE] error\n")
+            else:
+                out.write(f"{prefix}** Error: fake error at {sim_time} ns\n")
+        elif uvm:
+            out.write(f"{prefix}UVM_INFO fake.sv(1) @ {sim_time}: fake [FAKE] {padding}\n")
+        else:
+            out.write(f"{prefix}** Note: fake message {i} {padding}\n")
+
+        if duration > 0:
+            # Spread the lines evenly over the requested duration
+            target = time_start + duration * (i + 1) / lines
+            delay = target - time.perf_counter()
+            if delay > 0:
+                out.flush()
+                time.sleep(delay)
+
+    if uvm:
+        out.write(f"{prefix}--- UVM Report Summary ---\n")
+        out.write(f"{prefix}** Report counts by severity\n")
+        out.write(f"{prefix}UVM_INFO : {lines}\n")
+        out.write(f"{prefix}UVM_WARNING : 0\n")
+        out.write(f"{prefix}UVM_ERROR : {errors}\n")
+        out.write(f"{prefix}UVM_FATAL : {fatals}\n")
+
+    out.flush()
+    return 0
+
+
+def main(argv: List[str]) -> int:
+    if len(argv) < 1 or argv[0] not in TOOLS:
+        sys.stderr.write(f"usage: fake_tools.py <{'|'.join(TOOLS)}> [args...]\n")
+        return 2
+
+    tool, args = argv[0], argv[1:]
+    touch_outputs(tool, args)
+
+    if tool in SIMULATION_TOOLS:
+        return emit_simulation(tool, args)
+
+    if tool == "vcover" and len(args) >= 1 and args[0] == "ranktest":
+        # Pretend that the first half of the databases covers everything
+        databases = [arg for arg in args if arg.endswith(".ucdb")]
+        half = (len(databases) + 1) // 2
+        sys.stdout.write("Contributing tests:\n")
+        for i, database in enumerate(databases[:half]):
+            sys.stdout.write(f"  {i + 1} {database}\n")
+        sys.stdout.write("Non-contributing tests:\n")
+        for database in databases[half:]:
+            sys.stdout.write(f"  {database}\n")
+
+    if tool in ["vlog", "vcom", "xvlog"]:
+        for arg in args:
+            if not arg.startswith("-") and not arg.startswith("+"):
+                sys.stdout.write(f"-- Compiling {arg}\n")
+
+    return 0
+
+
+def install_fake_tools(directory: Path) -> Path:
+    """Writes executable shims named like the real tools in the given
+    directory. Prepending it to PATH makes the real simulator backends run
+    against the stand-ins."""
+
+    directory.mkdir(parents=True, exist_ok=True)
+    path_script = Path(__file__).absolute().as_posix()
+
+    for tool in TOOLS:
+        path_shim = directory / tool
+        with open(path_shim, "w") as shim:
+            shim.write("#!/bin/sh\n")
+            shim.write(f'exec "{sys.executable}" "{path_script}" {tool} "$@"\n')
+        path_shim.chmod(path_shim.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP)
+
+    return directory
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,170 @@
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from testhdl import utils
+from testhdl.errors import TestRunError
+from testhdl.hooks import GeneratorHook
+
+import os
+import json
+import inspect
+import logging
+import threading
+
+log = logging.getLogger("testhdl")
+
+GENERATORS_DIRNAME = "generators"
+
+# Cached outputs kept of every generator besides those used by the run
+KEEP_ENTRIES = 4
+
+
+def get_generator_key(hook: GeneratorHook, seed: int) -> str:
+    """Hash of everything the outputs of a generator depend on."""
+    kind = f"{type(hook).__module__}.{type(hook).__qualname__}"
+    parameters = json.dumps(hook.parameters, sort_keys=True, default=str)
+    extra = [kind, parameters, *hook.outputs, str(hook.get_seed(seed))]
+
+    # The code of generate, e.g. when the hook is defined in the run script
+    scripts = list(hook.scripts)
+    try:
+        path_source = inspect.getsourcefile(type(hook))
+    except TypeError:
+        path_source = None
+    if path_source is not None:
+        scripts.append(Path(path_source))
+
+    return utils.fingerprint(scripts, extra)
+
+
+def _generate(hook: GeneratorHook, seed: int, path_dir: Path) -> List[str]:
+    """Runs in a worker process. The outputs are written to a temporary
+    folder, renamed once complete, so that an interrupted generator never
+    leaves a partial cache entry behind.
+
+    :return: the outputs the generator did not write
+    """
+    path_partial = path_dir.with_name(f"{path_dir.name}.partial{os.getpid()}")
+    utils.rmdir_if_exists(path_partial)
+    path_partial.mkdir(parents=True)
+
+    try:
+        hook.generate(path_partial, hook.get_seed(seed))
+    except BaseException:
+        utils.rmdir_if_exists(path_partial)
+        raise
+
+    missing = [
+        output for output in hook.outputs if not (path_partial / output).exists()
+    ]
+    if len(missing) > 0:
+        utils.rmdir_if_exists(path_partial)
+        return missing
+
+    try:
+        os.replace(path_partial, path_dir)
+    except OSError:
+        # Generated by another run in the meantime
+        utils.rmdir_if_exists(path_partial)
+
+    return []
+
+
+class GeneratorPool:
+    """Runs the generator hooks of the tests in a process pool, and caches
+    their outputs in `generators` in the cache folder.
+
+    Generators with the same key, e.g. shared by several tests, only run
+    once. Those whose outputs are cached don't run at all. At the end of the
+    run, the outputs of every generator are evicted from the cache, except
+    the ones used by the run and the `keep_entries` most recently used.
+    """
+
+    path_cache: Path
+    jobs: int
+    keep_entries: int
+    futures: Dict[Path, Future]
+    names: Set[str]
+    executor: Optional[ProcessPoolExecutor]
+
+    def __init__(
+        self, path_cachedir: Path, jobs: int = 1, keep_entries: int = KEEP_ENTRIES
+    ):
+        self.path_cache = path_cachedir / GENERATORS_DIRNAME
+        self.jobs = jobs
+        self.keep_entries = keep_entries
+        # Outputs used by the run, by folder
+        self.futures = {}
+        self.names = set()
+        # Only started once a generator needs to run
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def get_path(self, hook: GeneratorHook, seed: int) -> Path:
+        return self.path_cache / f"{hook.name}_{get_generator_key(hook, seed)}"
+
+    def submit(self, hook: GeneratorHook, seed: int) -> Future:
+        path_dir = self.get_path(hook, seed)
+
+        with self.lock:
+            future = self.futures.get(path_dir)
+            if future is not None:
+                return future
+
+            self.names.add(hook.name)
+            if path_dir.exists():
+                # Marks it as recently used, see _evict
+                os.utime(path_dir)
+                future = Future()
+                future.set_result([])
+            else:
+                log.debug("Generating %s", path_dir.name)
+                if self.executor is None:
+                    self.path_cache.mkdir(parents=True, exist_ok=True)
+                    self.executor = ProcessPoolExecutor(max_workers=self.jobs)
+                future = self.executor.submit(_generate, hook, seed, path_dir)
+
+            self.futures[path_dir] = future
+            return future
+
+    def wait(self, hook: GeneratorHook, seed: int) -> List[Path]:
+        """Waits for the outputs of a generator, starting it if needed.
+
+        :return: the paths of the outputs
+        """
+        future = self.submit(hook, seed)
+        try:
+            missing = future.result()
+        except Exception as e:
+            raise TestRunError(f"Generator {hook.name} failed: {e}") from e
+
+        if len(missing) > 0:
+            raise TestRunError(
+                f"Generator {hook.name} did not write {', '.join(missing)}"
+            )
+
+        return self.get_outputs(hook, seed)
+
+    def get_outputs(self, hook: GeneratorHook, seed: int) -> List[Path]:
+        """The paths of the outputs of a generator, whether they were
+        generated yet or not."""
+        path_dir = self.get_path(hook, seed)
+        return [path_dir / output for output in hook.outputs]
+
+    def shutdown(self):
+        """Waits for the generators that are running, and drops the others."""
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+        for name in self.names:
+            self._evict(name)
+
+    def _evict(self, name: str):
+        entries = utils.find_cache_entries(self.path_cache, name)
+        entries.sort(key=lambda path: path.stat().st_mtime, reverse=True)
+
+        unused = [path for path in entries if path not in self.futures]
+        for path in unused[self.keep_entries :]:
+            log.debug("Evicting %s", path.name)
+            utils.rmdir_if_exists(path)
@@ -1,9 +1,76 @@
-from typing import TYPE_CHECKING
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
 if TYPE_CHECKING:
     from testhdl.run_config import RunConfig
 
+# Seed given to generators that don't declare that they use it
+UNSEEDED = 0
+
 
 class TestHook:
     def run_hook(self, config: "RunConfig"):
         pass
+
+
+class GeneratorHook(TestHook, ABC):
+    """A pre-hook generating files for a test, e.g. stimulus and reference
+    files from a Python model, declared with the inputs they depend on.
+
+    The outputs are cached, keyed on a hash of the inputs: the class of the
+    hook and the file defining it, its parameters, the content of its
+    scripts and, if `uses_seed`, the seed of the test. As the seed changes
+    on every run unless it is set, outputs that depend on it are rarely
+    reused, so by default it is not part of the key and `generate` gets
+    `UNSEEDED` instead. Only the most recently used outputs are kept.
+
+    Missing outputs are generated in a process pool while the design
+    compiles, and every test only waits for its own. They are then staged
+    like the files given to `TestHDL.add_test`, in the folder the
+    simulation runs in: the working directory, where other hooks write too,
+    except with Verilator and Icarus which run in the output folder of the
+    test.
+
+    `generate` runs in another process, so the hook must be picklable, e.g.
+    an instance of a class defined at the top level of a module.
+    """
+
+    name: str
+    # Names of the files that generate writes
+    outputs: List[str]
+    # Files the outputs depend on, e.g. the Python model
+    scripts: List[Path]
+    # Values the outputs depend on, serialized to JSON for the cache key
+    parameters: Dict[str, Any]
+    uses_seed: bool
+
+    def __init__(
+        self,
+        outputs: List[str],
+        *,
+        scripts: Optional[List[str | Path]] = None,
+        parameters: Optional[Dict[str, Any]] = None,
+        uses_seed: bool = False,
+        name: Optional[str] = None,
+    ):
+        self.name = name if name is not None else type(self).__name__
+        self.outputs = list(outputs)
+        self.scripts = [Path(script) for script in scripts or []]
+        self.parameters = dict(parameters) if parameters is not None else {}
+        self.uses_seed = uses_seed
+
+    def get_seed(self, seed: int) -> int:
+        """The seed to generate with, given the seed of the test."""
+        return seed if self.uses_seed else UNSEEDED
+
+    @abstractmethod
+    def generate(self, path_outdir: Path, seed: int):
+        """Writes every file in `outputs` in `path_outdir`."""
+        pass
+
+    def run_hook(self, config: "RunConfig"):
+        # Only pre-hooks are cached and run in parallel. Anywhere else the
+        # outputs are generated in the working directory, where the outputs
+        # of pre-hooks are staged for the simulators that run in it
+        self.generate(config.path_workdir, self.get_seed(config.seed))
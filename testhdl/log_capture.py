@@ -0,0 +1,204 @@
+from pathlib import Path
+from dataclasses import dataclass, field
+from collections import deque
+from typing import IO, Deque, List, Optional, Union
+
+import json
+import logging
+
+log = logging.getLogger("testhdl")
+
+# Error sites recorded in the sidecar of a log, the others are only counted
+MAX_RECORDED_SITES = 1000
+
+
+@dataclass
+class LogCapture:
+    """How the output of a simulation is written to its log file.
+
+    Lines matching any of `patterns` are the ones that matter for the
+    verdict. Their byte offsets are recorded in a sidecar file next to the
+    log, together with the offset of the first line matching
+    `summary_pattern`, so that failures can be reported without scanning
+    the log again.
+
+    If `head_bytes` and `tail_bytes` are set, only the first `head_bytes`
+    and the last `tail_bytes` of the output are kept, plus the lines
+    matching `patterns`.
+    """
+
+    patterns: List[str] = field(default_factory=list)
+    summary_pattern: Optional[str] = None
+    head_bytes: Optional[int] = None
+    tail_bytes: Optional[int] = None
+
+
+@dataclass
+class LogSites:
+    """Content of the sidecar of a log."""
+
+    sites: List[int]
+    total_sites: int
+    summary: Optional[int]
+
+    def save(self, path: Path):
+        with open(path, "w") as outfile:
+            json.dump(
+                {
+                    "sites": self.sites,
+                    "total_sites": self.total_sites,
+                    "summary": self.summary,
+                },
+                outfile,
+            )
+
+    @staticmethod
+    def load(path: Path) -> "LogSites":
+        with open(path, "r") as infile:
+            data = json.load(infile)
+        return LogSites(data["sites"], data["total_sites"], data["summary"])
+
+
+def get_sites_path(path_log: Path) -> Path:
+    return path_log.with_name(path_log.name + ".sites.json")
+
+
+class LogWriter:
+    """Writes the output of a program to a log file as described by a
+    `LogCapture`, recording the offsets of the lines matching its patterns.
+
+    When capped, lines that fall out of the tail window are dropped, except
+    those matching the patterns, so that checking the log for errors gives
+    the same result as with the full output. Each gap left by dropped lines
+    is marked by a line saying how much was dropped. The order of the lines
+    is always preserved.
+
+    It must be written one line at a time, as done by `utils.copy_output`.
+    """
+
+    file_out: IO[bytes]
+    path_sites: Path
+    capture: LogCapture
+
+    offset: int
+    sites: LogSites
+
+    head_left: Optional[int]
+    tail: Deque[bytes]
+    tail_size: int
+
+    dropped_lines: int
+    dropped_bytes: int
+    total_dropped_lines: int
+    total_dropped_bytes: int
+
+    def __init__(self, file_out: IO[bytes], path_sites: Path, capture: LogCapture):
+        self.file_out = file_out
+        self.path_sites = path_sites
+        self.capture = capture
+        self.patterns = [pattern.encode("utf-8") for pattern in capture.patterns]
+        self.summary_pattern = None
+        if capture.summary_pattern is not None:
+            self.summary_pattern = capture.summary_pattern.encode("utf-8")
+
+        self.offset = 0
+        self.sites = LogSites([], 0, None)
+
+        self.head_left = capture.head_bytes
+        self.tail = deque()
+        self.tail_size = 0
+
+        self.dropped_lines = 0
+        self.dropped_bytes = 0
+        self.total_dropped_lines = 0
+        self.total_dropped_bytes = 0
+
+    def _matches(self, line: bytes) -> bool:
+        return any(pattern in line for pattern in self.patterns)
+
+    def _emit(self, line: bytes, matches: bool):
+        # Lines in the summary only count the errors above it, they are
+        # not error sites themselves
+        if matches and self.sites.summary is None:
+            if self.summary_pattern is not None and self.summary_pattern in line:
+                self.sites.summary = self.offset
+            else:
+                if self.sites.total_sites < MAX_RECORDED_SITES:
+                    self.sites.sites.append(self.offset)
+                self.sites.total_sites += 1
+
+        self.file_out.write(line)
+        self.offset += len(line)
+
+    def write(self, line: bytes):
+        if self.head_left is None:
+            self._emit(line, self._matches(line))
+            return
+
+        if self.head_left > 0:
+            self.head_left -= len(line)
+            self._emit(line, self._matches(line))
+            return
+
+        self.tail.append(line)
+        self.tail_size += len(line)
+
+        tail_bytes = self.capture.tail_bytes or 0
+        while self.tail_size > tail_bytes and len(self.tail) > 0:
+            evicted = self.tail.popleft()
+            self.tail_size -= len(evicted)
+
+            if self._matches(evicted):
+                # Everything still in the tail is newer, so writing it now
+                # keeps the lines in order
+                self._write_gap()
+                self._emit(evicted, True)
+            else:
+                self.dropped_lines += 1
+                self.dropped_bytes += len(evicted)
+
+    def _write_gap(self):
+        if self.dropped_lines == 0:
+            return
+
+        gap = (
+            f"[testhdl] ... {self.dropped_lines} lines "
+            f"({self.dropped_bytes} bytes) dropped by the log cap ...\n"
+        )
+        self._emit(gap.encode("utf-8"), False)
+        self.total_dropped_lines += self.dropped_lines
+        self.total_dropped_bytes += self.dropped_bytes
+        self.dropped_lines = 0
+        self.dropped_bytes = 0
+
+    def flush(self):
+        self.file_out.flush()
+
+    def close(self):
+        self._write_gap()
+        for line in self.tail:
+            self._emit(line, self._matches(line))
+        self.tail.clear()
+        self.tail_size = 0
+
+        if self.total_dropped_lines > 0:
+            log.info(
+                "Log capped, dropped %d lines (%.1f MB)",
+                self.total_dropped_lines,
+                self.total_dropped_bytes / 1024 / 1024,
+            )
+
+        self.file_out.close()
+        self.sites.save(self.path_sites)
+
+
+def open_log_writer(
+    path: Path, capture: Optional[LogCapture] = None
+) -> Union[IO[bytes], LogWriter]:
+    """Opens a log file to copy the output of a program into, as described
+    by the capture if one is given."""
+    file_out = open(path, "wb")
+    if capture is None:
+        return file_out
+
+    return LogWriter(file_out, get_sites_path(path), capture)
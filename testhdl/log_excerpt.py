@@ -0,0 +1,112 @@
+from pathlib import Path
+from typing import IO, List, Tuple
+
+from testhdl import utils
+from testhdl.log_capture import LogSites, get_sites_path
+
+import sys
+
+# Bytes read backwards from an error site for every line of context
+CONTEXT_BYTES_PER_LINE = 1024
+
+# Lines of the report summary printed at most
+SUMMARY_MAX_LINES = 40
+
+
+def _read_before(
+    logfile: IO[bytes], offset: int, lines: int, not_before: int
+) -> List[Tuple[int, bytes]]:
+    """Returns up to `lines` lines, with their offsets, that end right
+    before `offset` and start after `not_before`."""
+    if lines <= 0 or offset <= not_before:
+        return []
+
+    start = max(not_before, offset - CONTEXT_BYTES_PER_LINE * lines)
+    logfile.seek(start)
+    block = logfile.read(offset - start)
+
+    result = []
+    position = start
+    for line in block.splitlines(keepends=True):
+        result.append((position, line))
+        position += len(line)
+
+    if start > not_before and len(result) > 0:
+        # The first line is probably cut
+        result = result[1:]
+
+    return result[-lines:]
+
+
+def _read_after(logfile: IO[bytes], offset: int, lines: int) -> List[Tuple[int, bytes]]:
+    logfile.seek(offset)
+    result = []
+    position = offset
+    for _ in range(lines):
+        line = logfile.readline()
+        if not line:
+            break
+        result.append((position, line))
+        position += len(line)
+
+    return result
+
+
+def _write(line: bytes, marker: str = "  "):
+    sys.stdout.write(marker + line.decode("utf-8", errors="replace").rstrip("\n") + "\n")
+
+
+def print_failure_excerpt(path_log: Path, max_sites: int = 5, context_lines: int = 3):
+    """Prints the first `max_sites` error sites of a log with some lines of
+    context around them, plus the report summary, followed by the path of the
+    full log.
+
+    The sites are read from the sidecar written while the simulation ran, so
+    the log is only read around them. Logs without a sidecar (e.g. from
+    compilation) or without any site or summary (e.g. after a crash) are
+    printed with `utils.print_file`."""
+    path_sites = get_sites_path(path_log)
+    if not path_sites.exists():
+        utils.print_file(path_log)
+        return
+
+    sites = LogSites.load(path_sites)
+    if len(sites.sites) == 0 and sites.summary is None:
+        # Nothing the verdict looks for, e.g. a crash, so show all of it
+        utils.print_file(path_log)
+        return
+
+    with utils.open_log(path_log, "rb") as logfile:
+        shown = sites.sites[:max_sites]
+        if len(shown) > 0:
+            print(
+                f"First {len(shown)} of {sites.total_sites} error sites "
+                f"in {path_log.as_posix()}:"
+            )
+
+        site_offsets = set(shown)
+        printed_until = 0
+        for offset in shown:
+            if offset < printed_until:
+                # Already printed as the context of the previous site
+                continue
+
+            before = _read_before(logfile, offset, context_lines, printed_until)
+            after = _read_after(logfile, offset, context_lines + 1)
+
+            first = before[0][0] if len(before) > 0 else offset
+            if first > printed_until:
+                print("  ...")
+
+            for _, line in before:
+                _write(line)
+            for position, line in after:
+                _write(line, "> " if position in site_offsets else "  ")
+                printed_until = position + len(line)
+
+        if sites.summary is not None:
+            print("Report summary:")
+            for _, line in _read_after(logfile, sites.summary, SUMMARY_MAX_LINES):
+                _write(line)
+
+    print(f"Full log: {path_log.absolute().as_posix()}")
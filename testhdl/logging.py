@@ -1,10 +1,14 @@
 import logging
 import logging.config
+import logging.handlers
 import datetime as dt
 import json
-import logging
+import copy
+import queue
+import atexit
 
 from pathlib import Path
+from typing import Optional
 
 # fmt: off
 def get_logging_config(logdir: Path):
@@ -37,7 +41,7 @@ def get_logging_config(logdir: Path):
                 "stream": "ext://sys.stdout",
             },
             "file": {
-                "class": "logging.handlers.RotatingFileHandler",
+                "class": "testhdl.logging.BatchedRotatingFileHandler",
                 "formatter": "json",
                 "level": "DEBUG",
                 "filename": (logdir / "testhdl_logs.jsonl").as_posix(),
@@ -72,17 +76,27 @@ class CustomColorFormatter(logging.Formatter):
         logging.CRITICAL: bold_red + log_format + reset,
     }
 
+    def __init__(self):
+        super().__init__()
+        # Built once, formatting is on the path of every record
+        self.formatters = {
+            level: logging.Formatter(log_fmt) for level, log_fmt in self.FORMATS.items()
+        }
+        self.success_formatters = {
+            level: logging.Formatter(self.green + log_fmt + self.reset)
+            for level, log_fmt in self.FORMATS.items()
+        }
+        self.default_formatter = logging.Formatter(None)
+
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
+        if record.__dict__.get("success"):
+            formatter = self.success_formatters.get(record.levelno)
+        else:
+            formatter = self.formatters.get(record.levelno)
 
-        if (
-            log_fmt is not None
-            and "success" in record.__dict__
-            and record.__dict__["success"]
-        ):
-            log_fmt = self.green + log_fmt + self.reset
+        if formatter is None:
+            formatter = self.default_formatter
 
-        formatter = logging.Formatter(log_fmt)
         return formatter.format(record)
 
 
@@ -136,6 +150,9 @@ class MyJSONFormatter(logging.Formatter):
         }
         if record.exc_info is not None:
             always_fields["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Already formatted by JSONQueueHandler
+            always_fields["exc_info"] = record.exc_text
 
         if record.stack_info is not None:
             always_fields["stack_info"] = self.formatStack(record.stack_info)
@@ -167,8 +184,100 @@ class MyJSONFormatter(logging.Formatter):
         return message
 
 
-def setup_logging(log_dir: Path):
+class BatchedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """A rotating file handler that, when `batched`, doesn't flush after
+    every record. The queue listener flushes it once there are no more
+    records waiting, so bursts of records end up in a few big writes."""
+
+    batched = False
+
+    def flush(self):
+        if not self.batched:
+            super().flush()
+
+    def flush_batch(self):
+        super().flush()
+
+    def close(self):
+        self.flush_batch()
+        super().close()
+
+
+class JSONQueueHandler(logging.handlers.QueueHandler):
+    """Hands the records over to the background thread, leaving the extra
+    fields in place for the JSON formatter."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+
+        if record.exc_info is not None:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """Flushes the handlers whenever the queue is drained."""
+
+    def dequeue(self, block: bool):
+        try:
+            return self.queue.get(block=False)
+        except queue.Empty:
+            for handler in self.handlers:
+                if isinstance(handler, BatchedRotatingFileHandler):
+                    handler.flush_batch()
+            return self.queue.get(block=block)
+
+
+_listener: Optional[BatchingQueueListener] = None
+
+
+def stop_logging():
+    """Writes the records still waiting in the queue and stops the background
+    thread writing them."""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def setup_logging(log_dir: Path, background: bool = True):
+    """Configures logging to the terminal and to a JSONL file in `log_dir`.
+
+    With `background`, records for the file are only queued by the thread
+    logging them, and formatted and written by a background thread."""
     if not log_dir.exists():
         log_dir.mkdir()
 
+    stop_logging()
     logging.config.dictConfig(config=get_logging_config(log_dir))
+
+    if not background:
+        return
+
+    root = logging.getLogger()
+    handler_file = next(
+        handler for handler in root.handlers if handler.get_name() == "file"
+    )
+    root.removeHandler(handler_file)
+    if isinstance(handler_file, BatchedRotatingFileHandler):
+        handler_file.batched = True
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler_queue = JSONQueueHandler(records)
+    handler_queue.setLevel(handler_file.level)
+    root.addHandler(handler_queue)
+
+    global _listener
+    _listener = BatchingQueueListener(records, handler_file, respect_handler_level=True)
+    _listener.start()
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,330 @@
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from testhdl import utils
+from testhdl.run_database import RunDatabase
+
+import re
+import sqlite3
+import logging
+
+log = logging.getLogger("testhdl")
+
+MESSAGE_INDEX_FILENAME = "messages.db"
+
+# Messages are inserted in batches of this many rows
+INSERT_BATCH_SIZE = 10_000
+
+# Longer message texts are truncated in the index
+MAX_TEXT_LENGTH = 200
+
+# UVM_ERROR /path/file.sv(12) @ 1500: uvm_test_top.env [MY_ID] message
+re_uvm_message = re.compile(
+    rb"(UVM_INFO|UVM_WARNING|UVM_ERROR|UVM_FATAL)\s+(?:\S+\([0-9]+\)\s+)?"
+    rb"@\s*([0-9.]+)\s*([a-z]*)\s*:\s*(\S+)\s+\[([^\]]*)\]\s?(.*)"
+)
+# ** Error: message (QuestaSim), Error: message (xsim)
+re_vhdl_report = re.compile(
+    rb"^(?:#\s*)?(?:\*\*\s+)?(Note|Warning|Error|Failure|Fatal):\s?(.*)"
+)
+# Time: 100 ns  Iteration: 0  Instance: /top/dut (the line after a report)
+re_vhdl_location = re.compile(
+    rb"^(?:#\s*)?\s*Time:\s*([0-9.]+)\s*([a-z]*)\s.*?(?:Instance|Process):\s*(\S+)"
+)
+# file.vhd:12:5:@100ns:(assertion error): message (GHDL)
+re_ghdl_report = re.compile(
+    rb"^(\S+?):[0-9]+:[0-9]+:@([0-9.]+)([a-z]*):\((?:assertion|report) (\w+)\):\s?(.*)"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    test TEXT NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    log INTEGER NOT NULL REFERENCES logs(id) ON DELETE CASCADE,
+    severity TEXT NOT NULL,
+    message_id TEXT,
+    component TEXT,
+    sim_time REAL,
+    time_unit TEXT,
+    offset INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_id ON messages (message_id);
+CREATE INDEX IF NOT EXISTS messages_by_log ON messages (log, offset);
+CREATE INDEX IF NOT EXISTS logs_by_run ON logs (run, test);
+"""
+
+
+@dataclass
+class LogMessage:
+    severity: str
+    message_id: Optional[str]
+    component: Optional[str]
+    sim_time: Optional[float]
+    time_unit: Optional[str]
+    offset: int
+    text: str
+
+
+@dataclass
+class IndexedMessage:
+    test: str
+    path: str
+    message: LogMessage
+
+
+def _decode(data: bytes) -> str:
+    return data.decode("utf-8", errors="replace").strip()[:MAX_TEXT_LENGTH]
+
+
+def parse_log_messages(path_log: Path) -> Iterator[LogMessage]:
+    """Extracts the UVM messages and the VHDL assertion reports (as printed
+    by QuestaSim, xsim and GHDL) from a log, with their byte offsets."""
+    offset = 0
+    # A VHDL report waiting for the line with its time and instance
+    pending: Optional[LogMessage] = None
+
+    with utils.open_log(path_log, "rb") as logfile:
+        for line in logfile:
+            line_offset = offset
+            offset += len(line)
+
+            if pending is not None:
+                match = re_vhdl_location.match(line)
+                if match:
+                    pending.sim_time = float(match.group(1))
+                    pending.time_unit = _decode(match.group(2)) or None
+                    pending.component = _decode(match.group(3))
+                yield pending
+                pending = None
+                if match:
+                    continue
+
+            match = re_uvm_message.search(line)
+            if match:
+                yield LogMessage(
+                    severity=_decode(match.group(1)),
+                    message_id=_decode(match.group(5)),
+                    component=_decode(match.group(4)),
+                    sim_time=float(match.group(2)),
+                    time_unit=_decode(match.group(3)) or None,
+                    offset=line_offset,
+                    text=_decode(match.group(6)),
+                )
+                continue
+
+            match = re_ghdl_report.match(line)
+            if match:
+                yield LogMessage(
+                    severity=_decode(match.group(4)).capitalize(),
+                    message_id=None,
+                    component=_decode(match.group(1)),
+                    sim_time=float(match.group(2)),
+                    time_unit=_decode(match.group(3)) or None,
+                    offset=line_offset,
+                    text=_decode(match.group(5)),
+                )
+                continue
+
+            match = re_vhdl_report.match(line)
+            if match:
+                pending = LogMessage(
+                    severity=_decode(match.group(1)),
+                    message_id=None,
+                    component=None,
+                    sim_time=None,
+                    time_unit=None,
+                    offset=line_offset,
+                    text=_decode(match.group(2)),
+                )
+
+    if pending is not None:
+        yield pending
+
+
+class MessageIndex(RunDatabase):
+    """Messages from the logs of every test, stored in a SQLite database,
+    so that they can be searched across a regression without reading the
+    logs again. Every regression creates a run, like in the coverage
+    database."""
+
+    schema = SCHEMA
+
+    def add_log(self, run: int, test: str, path_log: Path) -> int:
+        """Indexes the messages of the log of a test. Returns how many
+        messages were indexed."""
+        count = 0
+
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM logs WHERE run = ? AND test = ?", (run, test)
+            )
+            cursor = connection.execute(
+                "INSERT INTO logs (run, test, path) VALUES (?, ?, ?)",
+                (run, test, path_log.as_posix()),
+            )
+            log_id = cursor.lastrowid
+
+            batch: List[Tuple] = []
+            for message in parse_log_messages(path_log):
+                batch.append(
+                    (
+                        log_id,
+                        message.severity,
+                        message.message_id,
+                        message.component,
+                        message.sim_time,
+                        message.time_unit,
+                        message.offset,
+                        message.text,
+                    )
+                )
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    self._insert(connection, batch)
+                    count += len(batch)
+                    batch = []
+
+            self._insert(connection, batch)
+            count += len(batch)
+
+        return count
+
+    def _insert(self, connection: sqlite3.Connection, batch: List[Tuple]):
+        connection.executemany(
+            "INSERT INTO messages (log, severity, message_id, component, sim_time, "
+            "time_unit, offset, text) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            batch,
+        )
+
+    def _where(
+        self,
+        run: int,
+        message_id: Optional[str] = None,
+        component: Optional[str] = None,
+        severity: Optional[str] = None,
+        test: Optional[str] = None,
+        text: Optional[str] = None,
+    ) -> Tuple[str, List]:
+        conditions = ["logs.run = ?"]
+        params: List = [run]
+
+        if message_id is not None:
+            conditions.append("messages.message_id = ?")
+            params.append(message_id)
+        if component is not None:
+            conditions.append("messages.component LIKE ?")
+            params.append(component + "%")
+        if severity is not None:
+            # "error" matches both UVM_ERROR and Error
+            conditions.append("messages.severity LIKE ?")
+            params.append(f"%{severity}")
+        if test is not None:
+            conditions.append("logs.test = ?")
+            params.append(test)
+        if text is not None:
+            conditions.append("messages.text LIKE ?")
+            params.append(f"%{text}%")
+
+        return " AND ".join(conditions), params
+
+    def search(
+        self,
+        run: int,
+        *,
+        first_per_test: bool = False,
+        limit: Optional[int] = None,
+        **filters,
+    ) -> List[IndexedMessage]:
+        """Returns the messages of a run matching all the given filters:
+        `message_id`, `component` (a prefix of the component path),
+        `severity`, `test` and `text` (a part of the message). With
+        `first_per_test`, only the first matching message of every test is
+        returned."""
+        where, params = self._where(run, **filters)
+        columns = (
+            "logs.test, logs.path, messages.severity, messages.message_id, "
+            "messages.component, messages.sim_time, messages.time_unit, "
+            "messages.offset, messages.text"
+        )
+
+        if first_per_test:
+            # SQLite returns the other columns from the row with the minimum
+            sql = (
+                f"SELECT {columns}, MIN(messages.offset) FROM messages "
+                f"JOIN logs ON messages.log = logs.id WHERE {where} "
+                "GROUP BY logs.id ORDER BY logs.test"
+            )
+        else:
+            sql = (
+                f"SELECT {columns} FROM messages JOIN logs ON messages.log = logs.id "
+                f"WHERE {where} ORDER BY logs.test, messages.offset"
+            )
+
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._connect() as connection:
+            rows = connection.execute(sql, params).fetchall()
+
+        return [
+            IndexedMessage(row[0], row[1], LogMessage(*row[2:9])) for row in rows
+        ]
+
+    def count_by_test(self, run: int, **filters) -> List[Tuple[str, int]]:
+        """Returns, for every test with messages matching the filters (see
+        `search`), how many it has."""
+        where, params = self._where(run, **filters)
+        sql = (
+            "SELECT logs.test, COUNT(*) FROM messages "
+            f"JOIN logs ON messages.log = logs.id WHERE {where} "
+            "GROUP BY logs.test ORDER BY logs.test"
+        )
+
+        with self._connect() as connection:
+            return connection.execute(sql, params).fetchall()
+
+
+class MessageIndexer:
+    """Indexes the logs of the tests in the background, as they finish.
+    Logs are indexed one at a time, so that a single connection writes to
+    the database."""
+
+    index: MessageIndex
+    run: int
+    futures: List[Future]
+
+    def __init__(self, path_db: Path, label: str, background_nice: int = 0):
+        self.index = MessageIndex(path_db)
+        self.run = self.index.new_run(label)
+        self.executor = ThreadPoolExecutor(
+            max_workers=1,
+            initializer=utils.set_thread_nice,
+            initargs=(background_nice,),
+        )
+        self.futures = []
+
+    def add(self, test: str, path_log: Path):
+        self.futures.append(self.executor.submit(self._index_log, test, path_log))
+
+    def _index_log(self, test: str, path_log: Path):
+        try:
+            try:
+                count = self.index.add_log(self.run, test, path_log)
+            except FileNotFoundError:
+                # Compressed by the retention policy while being opened
+                count = self.index.add_log(self.run, test, path_log)
+        except Exception:
+            log.exception("Could not index the log of test %s", test)
+            return
+
+        log.debug("Indexed %d messages of test %s", count, test)
+
+    def finish(self):
+        self.executor.shutdown(wait=True)
@@ -1,10 +1,14 @@
 from enum import Enum
 from pathlib import Path
-from dataclasses import dataclass
-from typing import List, Optional
+from dataclasses import asdict, dataclass, field, fields
+from typing import Dict, List, Optional
+
+import json
 
 from testhdl.hooks import TestHook
 
+RESULT_FILENAME = "result.json"
+
 
 class HardwareLanguage(Enum):
     VHDL = "vhdl"
@@ -22,6 +26,9 @@ class RunAction(Enum):
     DUMP_FILESETS = 6
     SHOW_WAVES = 7
     SHOW_COVERAGE = 8
+    RANK_COVERAGE = 9
+    COVERAGE_DIFF = 10
+    REVERDICT = 11
 
 
 @dataclass
@@ -34,14 +41,116 @@ class SourceList:
     incdir: Optional[Path]
 
 
+@dataclass
+class Warmup:
+    name: str
+    duration: str
+    runtime_args: List[str]
+    seed: int
+
+
+@dataclass
+class RetentionPolicy:
+    compress_passing: bool
+    keep_runs: int
+    disk_budget_bytes: Optional[int]
+
+
+@dataclass
+class ScratchPolicy:
+    # Folder on a fast local disk or a RAM disk, e.g. /dev/shm
+    path: Path
+    # Waves of passing tests are dropped unless this is set
+    keep_passing_waves: bool
+
+
+@dataclass
+class CpuAffinity:
+    # Cores left to testhdl itself, e.g. to read the output of simulations
+    reserved_cores: int
+    # Added to the niceness of background work, e.g. coverage merges
+    background_nice: int
+
+
+@dataclass
+class ResourceUsage:
+    """Resources used by a program together with all its children. For
+    several programs run one after the other, the times and bytes add up
+    while the peak memory is the highest of them."""
+
+    cpu_seconds: float = 0.0
+    peak_rss_bytes: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
+
+    def add(self, other: "ResourceUsage"):
+        self.cpu_seconds += other.cpu_seconds
+        self.peak_rss_bytes = max(self.peak_rss_bytes, other.peak_rss_bytes)
+        self.read_bytes += other.read_bytes
+        self.write_bytes += other.write_bytes
+
+    @staticmethod
+    def from_dict(data: dict) -> "ResourceUsage":
+        known = {field.name for field in fields(ResourceUsage)}
+        return ResourceUsage(**{k: v for k, v in data.items() if k in known})
+
+
+@dataclass
+class SimMetrics:
+    """Throughput of a simulation, from the `{N ns}` progress stamps in its
+    output. `throughput` samples the run as `[wall seconds, simulated ns]`
+    pairs."""
+
+    sim_time_ns: float = 0.0
+    startup_seconds: float = 0.0
+    wall_seconds: float = 0.0
+    ns_per_second: Optional[float] = None
+    throughput: List[List[float]] = field(default_factory=list)
+
+    @staticmethod
+    def from_dict(data: dict) -> "SimMetrics":
+        known = {field.name for field in fields(SimMetrics)}
+        return SimMetrics(**{k: v for k, v in data.items() if k in known})
+
+
 @dataclass
 class TestCase:
     name: str
     runtime_args: List[str]
     pre_hooks: List[TestHook]
     post_hooks: List[TestHook]
+    warmup: Optional[Warmup] = None
+    seed: Optional[int] = None
+    # Amount used from every resource pool while the test runs
+    resources: Dict[str, float] = field(default_factory=dict)
+    # Staged in the folder the simulation runs in only while the test runs
+    files: List[Path] = field(default_factory=list)
 
 
 @dataclass
 class TestCaseResult:
-    pass
+    name: str
+    seed: int
+    passed: bool = False
+    errors: int = 0
+    elapsed: float = 0.0
+    usage: Optional[ResourceUsage] = None
+    simulation: Optional[SimMetrics] = None
+
+    def save(self, path: Path):
+        with open(path, "w") as outfile:
+            json.dump(asdict(self), outfile, indent=2)
+
+    @staticmethod
+    def load(path: Path) -> "TestCaseResult":
+        with open(path, "r") as infile:
+            data = json.load(infile)
+
+        # Ignore fields written by other versions
+        known = {field.name for field in fields(TestCaseResult)}
+        result = TestCaseResult(**{k: v for k, v in data.items() if k in known})
+        if result.usage is not None:
+            result.usage = ResourceUsage.from_dict(data["usage"])
+        if result.simulation is not None:
+            result.simulation = SimMetrics.from_dict(data["simulation"])
+        return result
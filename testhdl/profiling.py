@@ -0,0 +1,144 @@
+from pathlib import Path
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from testhdl import utils
+
+import re
+import json
+
+PROFILE_FILENAME = "profile.json"
+
+# Report written by the simulator in the output folder of the test
+PROFILE_REPORT_FILENAME = "profile_report.txt"
+
+# Hot spots printed after every profiled test
+PROFILE_TOP = 10
+
+# Vivado xsim -stats: "Simulation Memory Usage: 7263984 KB (Peak: 7264012 KB),
+# Simulation CPU Usage: 28360 ms"
+re_xsim_memory = re.compile(
+    r"Simulation Memory Usage:\s*([0-9.]+)\s*KB\s*\(Peak:\s*([0-9.]+)\s*KB\)"
+)
+re_xsim_cpu = re.compile(r"Simulation CPU Usage:\s*([0-9.]+)\s*ms")
+
+
+@dataclass
+class ProfileEntry:
+    """Time spent in an instance or process of the design, as a percentage
+    of the profiled time. `total_percent` includes the instances below it,
+    `self_percent` does not."""
+
+    name: str
+    total_percent: float
+    self_percent: float
+    samples: int
+
+
+@dataclass
+class Profile:
+    entries: List[ProfileEntry] = field(default_factory=list)
+    statistics: Dict[str, float] = field(default_factory=dict)
+
+    def get_hot_spots(self, top: int = PROFILE_TOP) -> List[ProfileEntry]:
+        ranked = sorted(self.entries, key=lambda entry: entry.self_percent, reverse=True)
+        return ranked[:top]
+
+    def save(self, path: Path):
+        with open(path, "w") as outfile:
+            json.dump(asdict(self), outfile, indent=2)
+
+    @staticmethod
+    def load(path: Path) -> "Profile":
+        with open(path, "r") as infile:
+            data = json.load(infile)
+
+        return Profile(
+            entries=[ProfileEntry(**entry) for entry in data["entries"]],
+            statistics=data["statistics"],
+        )
+
+
+def _parse_number(token: str) -> Optional[float]:
+    try:
+        return float(token.rstrip("%"))
+    except ValueError:
+        return None
+
+
+def parse_questa_profile(path_report: Path) -> Profile:
+    """Parses the report written by QuestaSim's `profile report
+    -hierarchical`, where every instance or process is followed by the
+    samples and the percentage spent under it, then in it:
+
+        /top/env/scoreboard      1200  40.0%   900  30.0%
+
+    Reports with a single samples and percentage pair (e.g. `-ranked`) are
+    read as time spent in the instance itself."""
+    profile = Profile()
+
+    with open(path_report, "r", errors="replace") as report:
+        for line in report:
+            tokens = line.lstrip("# ").split()
+            if len(tokens) < 3:
+                continue
+
+            numbers = [_parse_number(token) for token in tokens[1:]]
+            if any(number is None for number in numbers):
+                # Headers and anything else that isn't a row
+                continue
+
+            values: List[float] = [number for number in numbers if number is not None]
+            if len(values) >= 4:
+                under_samples, under_percent, _, in_percent = values[-4:]
+            elif len(values) >= 2:
+                under_samples, under_percent = values[-2:]
+                in_percent = under_percent
+            else:
+                continue
+
+            profile.entries.append(
+                ProfileEntry(
+                    name=tokens[0],
+                    total_percent=under_percent,
+                    self_percent=in_percent,
+                    samples=int(under_samples),
+                )
+            )
+
+    return profile
+
+
+def parse_xsim_stats(path_simlogs: Path) -> Profile:
+    """Reads the statistics printed by `xsim -stats` at the end of a
+    simulation. xsim has no per instance breakdown, so the profile only
+    has statistics."""
+    profile = Profile()
+
+    with utils.open_log(path_simlogs) as logfile:
+        for line in logfile:
+            match = re_xsim_memory.search(line)
+            if match:
+                profile.statistics["memory_kb"] = float(match.group(1))
+                profile.statistics["peak_memory_kb"] = float(match.group(2))
+
+            match = re_xsim_cpu.search(line)
+            if match:
+                profile.statistics["cpu_ms"] = float(match.group(1))
+
+    return profile
+
+
+def print_profile_summary(test: str, profile: Profile, top: int = PROFILE_TOP):
+    hot_spots = profile.get_hot_spots(top)
+    if len(hot_spots) > 0:
+        print(f"Hot spots of test {test}:")
+        print(f"  {'self':>6} {'total':>6}  instance")
+        for entry in hot_spots:
+            print(
+                f"  {entry.self_percent:>5.1f}% {entry.total_percent:>5.1f}%  "
+                f"{entry.name}"
+            )
+
+    for name, value in profile.statistics.items():
+        print(f"  {name}: {value:g}")
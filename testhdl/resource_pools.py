@@ -0,0 +1,80 @@
+from typing import Dict, Iterator
+from contextlib import contextmanager
+
+import threading
+
+# Pool of gigabytes of memory. Tests that don't declare how much they use
+# are assumed to need the peak memory of their previous run
+MEMORY_POOL = "mem_gb"
+
+# Steps of a run that can declare the resources they consume
+RESOURCE_STEPS = ["test", "compile", "coverage_merge"]
+
+
+class ResourcePools:
+    """Named pools of resources with a limited capacity, e.g. licence seats
+    or gigabytes of memory, shared by the work running at the same time.
+
+    A request for resources not in any pool is always granted. A request
+    bigger than the capacity of a pool is granted once nothing else uses
+    the pool, so that it runs alone instead of never running."""
+
+    capacities: Dict[str, float]
+    used: Dict[str, float]
+
+    def __init__(self, capacities: Dict[str, float]):
+        self.capacities = dict(capacities)
+        self.used = {name: 0.0 for name in capacities}
+        self.condition = threading.Condition()
+
+    def _fits(self, request: Dict[str, float]) -> bool:
+        for name, amount in request.items():
+            if name not in self.capacities or amount <= 0:
+                continue
+
+            used = self.used[name]
+            if used > 0 and used + amount > self.capacities[name]:
+                return False
+
+        return True
+
+    def try_acquire(self, request: Dict[str, float]) -> bool:
+        """Takes the resources if they are all available, without waiting.
+
+        :return: whether they were taken
+        """
+        with self.condition:
+            if not self._fits(request):
+                return False
+
+            self._take(request)
+            return True
+
+    def acquire(self, request: Dict[str, float]):
+        """Waits until all the resources are available, then takes them."""
+        with self.condition:
+            while not self._fits(request):
+                self.condition.wait()
+
+            self._take(request)
+
+    def _take(self, request: Dict[str, float]):
+        for name, amount in request.items():
+            if name in self.used and amount > 0:
+                self.used[name] += amount
+
+    def release(self, request: Dict[str, float]):
+        with self.condition:
+            for name, amount in request.items():
+                if name in self.used and amount > 0:
+                    self.used[name] -= amount
+            self.condition.notify_all()
+
+    @contextmanager
+    def use(self, request: Dict[str, float]) -> Iterator[None]:
+        """Holds the resources for the duration of the block."""
+        self.acquire(request)
+        try:
+            yield
+        finally:
+            self.release(request)
@@ -0,0 +1,296 @@
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from contextlib import contextmanager
+
+from testhdl.models import ResourceUsage, SimMetrics
+
+import os
+import json
+import logging
+import threading
+import subprocess
+
+log = logging.getLogger("testhdl")
+
+TEST_STATS_FILENAME = "test_stats.json"
+
+# Seconds between two samples of a running process tree
+SAMPLE_INTERVAL = 0.5
+
+PATH_PROC = Path("/proc")
+
+
+def _read_proc(pid: int, name: str) -> Optional[str]:
+    try:
+        with open(PATH_PROC / str(pid) / name, "r") as infile:
+            return infile.read()
+    except OSError:
+        # Exited, or not ours to read
+        return None
+
+
+def _get_children(pid: int) -> List[int]:
+    children = []
+    path_tasks = PATH_PROC / str(pid) / "task"
+    try:
+        tasks = list(path_tasks.iterdir())
+    except OSError:
+        return children
+
+    for path_task in tasks:
+        try:
+            with open(path_task / "children", "r") as infile:
+                children += [int(child) for child in infile.read().split()]
+        except OSError:
+            pass
+
+    return children
+
+
+def _get_tree(pid: int) -> List[int]:
+    tree = [pid]
+    seen: Set[int] = {pid}
+    i = 0
+    while i < len(tree):
+        for child in _get_children(tree[i]):
+            if child not in seen:
+                seen.add(child)
+                tree.append(child)
+        i += 1
+
+    return tree
+
+
+def _get_rss(pid: int) -> int:
+    status = _read_proc(pid, "status")
+    if status is None:
+        return 0
+
+    for line in status.splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1]) * 1024
+
+    return 0
+
+
+def _get_io(pid: int) -> Optional[Tuple[int, int]]:
+    io = _read_proc(pid, "io")
+    if io is None:
+        return None
+
+    fields = dict(line.split(": ", 1) for line in io.splitlines() if ": " in line)
+    return int(fields.get("read_bytes", 0)), int(fields.get("write_bytes", 0))
+
+
+class ProcessSampler:
+    """Samples the memory and I/O of a process and of all its descendants
+    from /proc while it runs. Once the process is done, `wait` reaps it with
+    `os.wait4`, whose rusage adds the exact CPU time of the whole tree.
+
+    Without /proc (e.g. not on Linux), only the rusage is used."""
+
+    pid: int
+    peak_rss_bytes: int
+    io: Dict[int, Tuple[int, int]]
+
+    def __init__(self, pid: int, interval: float = SAMPLE_INTERVAL):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss_bytes = 0
+        # Last I/O figures of every process seen, also those that exited
+        self.io = {}
+
+        self.stopped = threading.Event()
+        self.thread = None
+        if PATH_PROC.exists():
+            self.thread = threading.Thread(target=self._sample_loop, daemon=True)
+            self.thread.start()
+
+    def _sample_loop(self):
+        while True:
+            self._sample()
+            if self.stopped.wait(self.interval):
+                return
+
+    def _sample(self):
+        rss = 0
+        for pid in _get_tree(self.pid):
+            rss += _get_rss(pid)
+            io = _get_io(pid)
+            if io is not None:
+                self.io[pid] = io
+
+        self.peak_rss_bytes = max(self.peak_rss_bytes, rss)
+
+    def wait(self, proc: subprocess.Popen) -> Tuple[int, ResourceUsage]:
+        """Waits for the process to exit, and returns its return code and
+        the resources used by it and its children."""
+        if not hasattr(os, "wait4"):
+            rc = proc.wait()
+            self.stop()
+            return rc, self._get_usage(None)
+
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        self.stop()
+        return proc.returncode, self._get_usage(rusage)
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _get_usage(self, rusage) -> ResourceUsage:
+        read_bytes = sum(io[0] for io in self.io.values())
+        write_bytes = sum(io[1] for io in self.io.values())
+        usage = ResourceUsage(
+            peak_rss_bytes=self.peak_rss_bytes,
+            read_bytes=read_bytes,
+            write_bytes=write_bytes,
+        )
+
+        if rusage is not None:
+            usage.cpu_seconds = rusage.ru_utime + rusage.ru_stime
+            # Largest single process, in kilobytes on Linux. Catches peaks
+            # between two samples
+            usage.peak_rss_bytes = max(usage.peak_rss_bytes, rusage.ru_maxrss * 1024)
+            usage.read_bytes = max(usage.read_bytes, rusage.ru_inblock * 512)
+            usage.write_bytes = max(usage.write_bytes, rusage.ru_oublock * 512)
+
+        return usage
+
+
+_tracked = threading.local()
+
+
+@contextmanager
+def track_usage() -> Iterator[ResourceUsage]:
+    """Adds up the resources used by the programs that `utils.run_program`
+    runs from the current thread within the block. Blocks can be nested,
+    the outer one includes the inner ones."""
+    usage = ResourceUsage()
+    previous = getattr(_tracked, "usage", None)
+    _tracked.usage = usage
+    try:
+        yield usage
+    finally:
+        _tracked.usage = previous
+        if previous is not None:
+            previous.add(usage)
+
+
+def get_tracked_usage() -> Optional[ResourceUsage]:
+    return getattr(_tracked, "usage", None)
+
+
+class ResourceStats:
+    """The resources used by every test and every library the last time
+    they ran, and the throughput of the simulation of every test, kept
+    across runs in `test_stats.json` in the logs folder."""
+
+    path: Path
+    tests: Dict[str, ResourceUsage]
+    libraries: Dict[str, ResourceUsage]
+    simulations: Dict[str, SimMetrics]
+    run_tests: List[str]
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.tests = {}
+        self.libraries = {}
+        self.simulations = {}
+        # Tests that ran in this run, for the summary
+        self.run_tests = []
+        self.lock = threading.Lock()
+
+        if path.exists():
+            try:
+                with open(path, "r") as infile:
+                    data = json.load(infile)
+                self.tests = {
+                    name: ResourceUsage.from_dict(usage)
+                    for name, usage in data.get("tests", {}).items()
+                }
+                self.libraries = {
+                    name: ResourceUsage.from_dict(usage)
+                    for name, usage in data.get("libraries", {}).items()
+                }
+                self.simulations = {
+                    name: SimMetrics.from_dict(metrics)
+                    for name, metrics in data.get("simulations", {}).items()
+                }
+            except (OSError, ValueError):
+                log.warning("Ignoring unreadable %s", path.as_posix())
+
+    def get_peak_rss(self, test: str) -> int:
+        """Peak memory of a test the last time it ran, 0 if unknown."""
+        with self.lock:
+            usage = self.tests.get(test)
+        return usage.peak_rss_bytes if usage is not None else 0
+
+    def add_test(self, test: str, usage: ResourceUsage):
+        with self.lock:
+            self.tests[test] = usage
+            self.run_tests.append(test)
+
+    def get_simulation(self, test: str) -> Optional[SimMetrics]:
+        """Throughput of the simulation of a test the last time it ran."""
+        with self.lock:
+            return self.simulations.get(test)
+
+    def add_simulation(self, test: str, metrics: SimMetrics):
+        with self.lock:
+            self.simulations[test] = metrics
+
+    def add_library(self, library: str, usage: ResourceUsage):
+        with self.lock:
+            self.libraries[library] = usage
+
+    def save(self):
+        with self.lock:
+            data = {
+                "tests": {name: vars(usage) for name, usage in self.tests.items()},
+                "libraries": {
+                    name: vars(usage) for name, usage in self.libraries.items()
+                },
+                # The samples are only kept in the result of every test
+                "simulations": {
+                    name: {**vars(metrics), "throughput": []}
+                    for name, metrics in self.simulations.items()
+                },
+            }
+
+        path_temp = self.path.with_name(self.path.name + ".partial")
+        with open(path_temp, "w") as outfile:
+            json.dump(data, outfile, indent=2)
+        os.replace(path_temp, self.path)
+
+    def log_summary(self, top: int = 5):
+        """Logs the resources used by the tests that ran, and the ones that
+        needed the most memory."""
+        with self.lock:
+            usages = [(name, self.tests[name]) for name in self.run_tests]
+
+        if len(usages) == 0:
+            return
+
+        total = ResourceUsage()
+        for _, usage in usages:
+            total.add(usage)
+
+        log.info(
+            "Tests used %.1f CPU seconds, read %.1f MB and wrote %.1f MB",
+            total.cpu_seconds,
+            total.read_bytes / 1024 / 1024,
+            total.write_bytes / 1024 / 1024,
+        )
+
+        usages.sort(key=lambda item: item[1].peak_rss_bytes, reverse=True)
+        for name, usage in usages[:top]:
+            log.info(
+                "  %s: peak memory %.1f MB, %.1f CPU seconds",
+                name,
+                usage.peak_rss_bytes / 1024 / 1024,
+                usage.cpu_seconds,
+            )
+
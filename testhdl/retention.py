@@ -0,0 +1,161 @@
+from pathlib import Path
+from typing import List, Set
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from testhdl import utils
+from testhdl.models import RESULT_FILENAME, RetentionPolicy, TestCaseResult
+
+import os
+import logging
+import threading
+import datetime as dt
+
+log = logging.getLogger("retention")
+
+HISTORY_DIRNAME = "history"
+
+# Artefacts of passing tests that get compressed
+COMPRESSED_PATTERNS = ["*.log", "*.vcd"]
+
+
+class ArtifactRetention:
+    """Keeps the logs folder within bounds.
+
+    - The logs and VCDs of passing tests are compressed in the background.
+      They can still be read with `utils.open_log`.
+    - Instead of being deleted when a test runs again, the previous
+      artefacts of a test are moved to `history/<test>/<timestamp>`, where
+      the last `keep_runs` runs of every test are kept. Older runs are
+      deleted, unless they failed.
+    - If the whole logs folder is bigger than the disk budget, the oldest
+      runs in the history are evicted first, failed or not. The artefacts
+      of the current run are never evicted.
+    """
+
+    policy: RetentionPolicy
+    path_logsdir: Path
+    path_history: Path
+    futures: Set[Future]
+
+    def __init__(
+        self,
+        policy: RetentionPolicy,
+        path_logsdir: Path,
+        jobs: int = 1,
+        background_nice: int = 0,
+    ):
+        self.policy = policy
+        self.path_logsdir = path_logsdir
+        self.path_history = path_logsdir / HISTORY_DIRNAME
+
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=jobs,
+            initializer=utils.set_thread_nice,
+            initargs=(background_nice,),
+        )
+        self.futures = set()
+
+    def archive(self, path_outdir: Path):
+        """Clears the folder of a test before it runs, keeping its previous
+        artefacts in the history if the policy asks for it."""
+        if not path_outdir.exists():
+            return
+
+        if self.policy.keep_runs <= 0:
+            utils.rmdir_if_exists(path_outdir)
+            return
+
+        path_result = path_outdir / RESULT_FILENAME
+        path_stamp = path_result if path_result.exists() else path_outdir
+        stamp = dt.datetime.fromtimestamp(path_stamp.stat().st_mtime)
+
+        path_test_history = self.path_history / path_outdir.name
+        path_test_history.mkdir(parents=True, exist_ok=True)
+        path_archived = path_test_history / stamp.strftime("%Y%m%d_%H%M%S_%f")
+        os.replace(path_outdir, path_archived)
+
+        self._prune(path_test_history)
+
+    def _prune(self, path_test_history: Path):
+        runs = sorted(path_test_history.iterdir(), reverse=True)
+
+        for path_run in runs[self.policy.keep_runs :]:
+            if self._has_failed(path_run):
+                continue
+            log.debug("Removing old artefacts %s", path_run.as_posix())
+            utils.rmdir_if_exists(path_run)
+
+    def _has_failed(self, path_run: Path) -> bool:
+        path_result = path_run / RESULT_FILENAME
+        if not path_result.exists():
+            # Interrupted before the verdict, worth keeping like a failure
+            return True
+
+        try:
+            return not TestCaseResult.load(path_result).passed
+        except Exception:
+            return True
+
+    def compress(self, path_outdir: Path):
+        """Compresses the artefacts of a passing test in the background."""
+        if not self.policy.compress_passing:
+            return
+
+        with self.lock:
+            future = self.executor.submit(self._compress_test, path_outdir)
+            self.futures.add(future)
+
+    def _compress_test(self, path_outdir: Path):
+        for pattern in COMPRESSED_PATTERNS:
+            for path in path_outdir.glob(pattern):
+                try:
+                    utils.compress_file(path)
+                except OSError:
+                    log.exception("Could not compress %s", path.as_posix())
+
+    def finish(self):
+        """Waits for the background compression, then enforces the disk
+        budget."""
+        with self.lock:
+            futures = set(self.futures)
+            self.futures = set()
+
+        wait(futures)
+        self.executor.shutdown()
+
+        if self.policy.disk_budget_bytes is not None:
+            self._enforce_budget(self.policy.disk_budget_bytes)
+
+    def _enforce_budget(self, budget: int):
+        total = utils.get_size(self.path_logsdir)
+        if total <= budget:
+            return
+
+        runs: List[Path] = []
+        if self.path_history.exists():
+            for path_test_history in self.path_history.iterdir():
+                runs += path_test_history.iterdir()
+
+        # Folders are named after their timestamp, oldest first
+        runs.sort(key=lambda path: path.name)
+
+        for path_run in runs:
+            if total <= budget:
+                break
+
+            size = utils.get_size(path_run)
+            log.debug("Evicting %s (%d bytes)", path_run.as_posix(), size)
+            utils.rmdir_if_exists(path_run)
+            total -= size
+
+            if not any(path_run.parent.iterdir()):
+                path_run.parent.rmdir()
+
+        if total > budget:
+            log.warning(
+                "Logs take %.1f MB, over the disk budget of %.1f MB, "
+                "even with no history left",
+                total / 1024 / 1024,
+                budget / 1024 / 1024,
+            )
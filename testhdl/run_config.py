@@ -1,19 +1,23 @@
 from pathlib import Path
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Dict, List, Optional
 from collections.abc import Callable
 
 from testhdl.source_library import SourceLibrary
 from testhdl.test_framework import TestFrameworkBase
 from testhdl.simulator_base import SimulatorBase
 from testhdl.linter_frontend import Linter
-from testhdl.models import TestCase
+from testhdl.log_capture import LogCapture
+from testhdl.models import CpuAffinity, RetentionPolicy, TestCase
+from testhdl.scratch import ScratchArea
+from testhdl.tracing import Tracer
 
 
 @dataclass
 class RunConfig:
     path_workdir: Path
     path_logsdir: Path
+    path_cachedir: Path
 
     seed: int
 
@@ -39,6 +43,27 @@ class RunConfig:
     additional_files: List[Path]
 
     coverage_enabled: bool
+    coverage_export: bool
+    coverage_diff: Optional[List[int]]
+
+    profile: bool
+
+    message_index: bool
 
     resolution: str
+    stop_time: Optional[str]
     verbose: bool
+
+    selection_name: Optional[str]
+
+    jobs: int
+    use_sessions: bool
+    simulator_threads: int
+    cpu_affinity: Optional[CpuAffinity]
+
+    scratch: Optional[ScratchArea]
+    retention: Optional[RetentionPolicy]
+    log_capture: Optional[LogCapture]
+    resource_pools: Dict[str, float]
+    step_resources: Dict[str, Dict[str, float]]
+    tracer: Tracer
@@ -0,0 +1,77 @@
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Iterator, List
+from contextlib import contextmanager
+
+import sqlite3
+import datetime as dt
+
+RUNS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    label TEXT NOT NULL,
+    created TEXT NOT NULL
+);
+"""
+
+
+@dataclass
+class DatabaseRun:
+    id: int
+    label: str
+    created: str
+
+
+class RunDatabase:
+    """A SQLite database holding results of many regressions side by side.
+    Every regression creates a run, that the tables given in `schema`
+    reference with `REFERENCES runs(id) ON DELETE CASCADE`."""
+
+    path: Path
+    # Tables of the database besides the runs
+    schema: str = ""
+
+    def __init__(self, path: Path):
+        self.path = path
+        with self._connect() as connection:
+            connection.executescript(RUNS_SCHEMA + self.schema)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Short lived connections, so that threads never share one
+        connection = sqlite3.connect(self.path.as_posix(), timeout=30)
+        try:
+            connection.execute("PRAGMA foreign_keys = ON")
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def new_run(self, label: str) -> int:
+        created = dt.datetime.now(tz=dt.timezone.utc).isoformat()
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "INSERT INTO runs (label, created) VALUES (?, ?)", (label, created)
+            )
+            assert cursor.lastrowid is not None
+            return cursor.lastrowid
+
+    def runs(self) -> List[DatabaseRun]:
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT id, label, created FROM runs ORDER BY id"
+            ).fetchall()
+        return [DatabaseRun(*row) for row in rows]
+
+    def resolve_run(self, run: int) -> int:
+        """Returns the id of a run. Negative numbers count from the last
+        run, so -1 is the latest run."""
+        runs = self.runs()
+        if run < 0:
+            if -run > len(runs):
+                raise KeyError(run)
+            return runs[run].id
+
+        if run not in [known.id for known in runs]:
+            raise KeyError(run)
+        return run
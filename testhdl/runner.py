@@ -1,31 +1,193 @@
-from os import RTLD_NODELETE
 from testhdl import utils
-from testhdl.errors import TestRunError, ValidationError
-from testhdl.models import RunAction, TestCase
+from testhdl.coverage import CoverageMerger
+from testhdl.coverage_db import (
+    COVERAGE_DB_FILENAME,
+    MERGED_SCOPE,
+    CoverageDatabase,
+    parse_coverage_report,
+)
+from testhdl.errors import SimulatorError, TestRunError, ValidationError
+from testhdl.models import (
+    RESULT_FILENAME,
+    RunAction,
+    TestCase,
+    TestCaseResult,
+    Warmup,
+)
+from testhdl.retention import HISTORY_DIRNAME, ArtifactRetention
+from testhdl.generators import GeneratorPool
+from testhdl.hooks import GeneratorHook
+from testhdl.message_index import MESSAGE_INDEX_FILENAME, MessageIndexer
+from testhdl.resource_usage import (
+    TEST_STATS_FILENAME,
+    ResourceStats,
+    track_usage,
+)
+from testhdl.sim_progress import get_slowdown, track_progress
+from testhdl.resource_pools import MEMORY_POOL, ResourcePools
+from testhdl.cpu_affinity import CpuAllocator, get_available_cpus, get_thread_budget
+from testhdl.selection import SELECTIONS_DIRNAME, Selection, save_selection
+from testhdl.staging import StagingArea
 from testhdl.run_config import RunConfig
+from testhdl.profiling import PROFILE_FILENAME, print_profile_summary
+from testhdl.tracing import TRACE_FILENAME
 
-from typing import Optional
+from typing import Dict, List, Optional, Set
+from pathlib import Path
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 
 import time
-import shutil
+import dataclasses
 import logging
+import threading
 import webbrowser
 
 log = logging.getLogger("testhdl")
 
+# What the logs folder keeps across runs, that no build or run can recreate.
+# --clean leaves them alone
+CROSS_RUN_LOGS = {
+    COVERAGE_DB_FILENAME,
+    SELECTIONS_DIRNAME,
+    TEST_STATS_FILENAME,
+    MESSAGE_INDEX_FILENAME,
+    HISTORY_DIRNAME,
+}
+
+
+def _get_plusarg(args: List[str], name: str) -> Optional[str]:
+    """Value of the last `+name=value` argument, None if there is none."""
+    value = None
+    for arg in args:
+        if arg.startswith(f"+{name}="):
+            value = arg[len(name) + 2 :]
+
+    return value
+
 
 class Runner:
     config: RunConfig
+    checkpoint_lock: threading.Lock
+    coverage_merger: Optional[CoverageMerger]
+    coverage_db: Optional[CoverageDatabase]
+    coverage_run: int
+    retention: Optional[ArtifactRetention]
+    message_indexer: Optional[MessageIndexer]
+    resource_stats: Optional[ResourceStats]
+    pools: ResourcePools
+    cpu_allocator: Optional[CpuAllocator]
+    cpus_per_test: int
+    generators: Optional[GeneratorPool]
+    staging: StagingArea
 
     def __init__(self, config: RunConfig):
         self.config = config
+        self.checkpoint_lock = threading.Lock()
+        self.coverage_merger = None
+        self.coverage_db = None
+        self.coverage_run = 0
+        self.retention = None
+        self.message_indexer = None
+        self.resource_stats = None
+        self.pools = ResourcePools(config.resource_pools)
+        self.cpu_allocator = None
+        self.cpus_per_test = config.simulator_threads
+        self.generators = None
+        self.staging = StagingArea(config.path_workdir, config.additional_files)
+
+    def _get_background_nice(self) -> int:
+        if self.config.cpu_affinity is None:
+            return 0
+        return self.config.cpu_affinity.background_nice
+
+    def _start_cpu_affinity(self):
+        affinity = self.config.cpu_affinity
+        if affinity is None:
+            return
+
+        cpus = get_available_cpus()
+        if len(cpus) > affinity.reserved_cores:
+            cpus = cpus[affinity.reserved_cores :]
+        self.cpu_allocator = CpuAllocator(cpus)
+
+        jobs = self.config.jobs if self.config.test_to_run is None else 1
+        # The threads of the simulations are left alone, as models are built
+        # for a thread count, and they would be rebuilt whenever -j changes
+        threads = get_thread_budget(len(cpus), jobs, self.config.simulator_threads)
+        if threads < self.config.simulator_threads:
+            log.warning(
+                "Simulations with %d threads get %d cores each, so that %d of them "
+                "fit on %d cores",
+                self.config.simulator_threads,
+                threads,
+                jobs,
+                len(cpus),
+            )
+        self.cpus_per_test = threads
+
+    def _start_generators(self, tests: List[TestCase]):
+        """Starts generating the outputs of the generator hooks of the
+        tests, while the design compiles."""
+        self.generators = GeneratorPool(self.config.path_cachedir, self.config.jobs)
+
+        for test in tests:
+            seed = test.seed if test.seed is not None else self.config.seed
+            for hook in test.pre_hooks:
+                if isinstance(hook, GeneratorHook):
+                    self.generators.submit(hook, seed)
+
+    def _finish_generators(self):
+        if self.generators is not None:
+            self.generators.shutdown()
+
+    def _get_stage_dir(self, test: TestCase) -> Path:
+        """Folder the simulation of a test runs in, see _run_test_phases."""
+        path_rundir = self.config.path_logsdir / test.name
+        if self.config.scratch is not None:
+            path_rundir = self.config.scratch.get_test_dir(test.name)
+
+        return self.config.simulator.get_run_dir(path_rundir)
+
+    def _get_staged_files(self, test: TestCase) -> List[Path]:
+        """Files staged for a test, including the outputs of its generator
+        hooks, that may not be generated yet."""
+        seed = test.seed if test.seed is not None else self.config.seed
+        files = list(test.files)
+        for hook in test.pre_hooks:
+            if isinstance(hook, GeneratorHook):
+                assert self.generators is not None
+                files += self.generators.get_outputs(hook, seed)
+
+        return files
+
+    def _get_generated_files(self, test: TestCase, seed: int) -> List[Path]:
+        """Waits for the outputs of the generator hooks of a test."""
+        files: List[Path] = []
+        for hook in test.pre_hooks:
+            if not isinstance(hook, GeneratorHook):
+                continue
+
+            assert self.generators is not None
+            with self.config.tracer.span(
+                f"generator {hook.name}", "hooks", test=test.name
+            ):
+                files += self.generators.wait(hook, seed)
+
+        return files
 
     def _compile(self):
         log.info("Starting compilation")
         time_start_compile = time.perf_counter()
 
         for library in self.config.libraries:
-            self.config.simulator.compile(library, self.config)
+            resources = self.config.step_resources.get("compile", {})
+            with self.pools.use(resources):
+                with self.config.tracer.span(f"library {library.name}", "compile"):
+                    with track_usage() as usage:
+                        self.config.simulator.compile(library, self.config)
+
+            if self.resource_stats is not None:
+                self.resource_stats.add_library(library.name, usage)
 
         elapsed = time.perf_counter() - time_start_compile
         log.info("Compilation done; took %.2f seconds", elapsed)
@@ -36,77 +198,513 @@ class Runner:
 
         for linter in self.config.linters:
             for config in linter.configs:
-                linter.linter.lint(self.config, config.library, config.top_entity)
+                with self.config.tracer.span(
+                    f"lint {config.top_entity}",
+                    "lint",
+                    linter=type(linter.linter).__name__,
+                    library=config.library.name,
+                ):
+                    linter.linter.lint(self.config, config.library, config.top_entity)
 
         elapsed = time.perf_counter() - time_start_linting
         log.info("Linting done! Took %.2f seconds", elapsed)
 
         pass
 
+    def _get_test_resources(self, test: TestCase) -> Dict[str, float]:
+        resources = {
+            **self.config.step_resources.get("test", {}),
+            **test.resources,
+        }
+
+        if MEMORY_POOL not in resources and self.resource_stats is not None:
+            # Tests that don't say how much memory they need are expected
+            # to use as much as the last time they ran
+            peak_rss = self.resource_stats.get_peak_rss(test.name)
+            resources[MEMORY_POOL] = peak_rss / 1024**3
+
+        return resources
+
     def _run_test(self, test: TestCase):
+        self.staging.acquire(self._get_stage_dir(test), self._get_staged_files(test))
+        resources = self._get_test_resources(test)
+        self.pools.acquire(resources)
+        self._run_test_acquired(test, resources)
+
+    def _run_test_acquired(self, test: TestCase, resources: Dict[str, float]):
+        """Runs a test whose resources were already taken from the pools,
+        and whose files were claimed in the staging area, and gives them
+        back."""
+        cpus = None
+        if self.cpu_allocator is not None:
+            cpus = self.cpu_allocator.allocate(self.cpus_per_test)
+
+        try:
+            with self.config.tracer.span(
+                f"test {test.name}", "test", test=test.name, cpus=cpus
+            ), utils.process_context(cpus=cpus):
+                self._run_test_phases(test)
+        finally:
+            if self.cpu_allocator is not None and cpus is not None:
+                self.cpu_allocator.release(cpus)
+            self.pools.release(resources)
+
+    def _run_test_phases(self, test: TestCase):
+        tracer = self.config.tracer
         time_test_start = time.perf_counter()
-        log.info("Running test %s", test.name)
+        log.info("Running test %s", test.name, extra={"test": test.name})
+
+        config = self.config
+        if test.seed is not None:
+            config = dataclasses.replace(self.config, seed=test.seed)
+
+        # Claimed before the test started, see _launch_tests
+        path_stagedir = self._get_stage_dir(test)
+        staged = self._get_staged_files(test)
+
+        try:
+            with tracer.span("pre-hooks", "hooks", test=test.name):
+                for test_hook in test.pre_hooks:
+                    # Generated in the background, see _get_generated_files
+                    if not isinstance(test_hook, GeneratorHook):
+                        test_hook.run_hook(config)
+
+            path_outdir = config.path_logsdir / test.name
+            if self.retention is not None:
+                self.retention.archive(path_outdir)
+            else:
+                utils.rmdir_if_exists(path_outdir)
+            path_outdir.mkdir(parents=True)
+
+            # Where the simulation writes, the outdir unless in a scratch area
+            path_rundir = path_outdir
+            if config.scratch is not None:
+                path_rundir = config.scratch.start_test(test.name)
+        except BaseException:
+            self.staging.release(path_stagedir, staged)
+            raise
+
+        expected_ns = None
+        if self.resource_stats is not None:
+            previous = self.resource_stats.get_simulation(test.name)
+            if previous is not None:
+                expected_ns = previous.sim_time_ns
+
+        result = TestCaseResult(test.name, config.seed)
+        try:
+            # Staged where the simulator runs, so that the testbench opens
+            # the files by name
+            self._get_generated_files(test, config.seed)
+            self.staging.stage(path_stagedir, staged)
+
+            with track_usage() as usage, track_progress(expected_ns) as progress:
+                result.usage = usage
+                try:
+                    self._simulate_test(test, path_rundir, result, config)
+                finally:
+                    result.simulation = progress.finish()
+            result.passed = True
+        except (TestRunError, SimulatorError) as e:
+            # The scratch folder is gone by the time the error is reported
+            if e.logs_file is not None and e.logs_file.is_relative_to(path_rundir):
+                e.logs_file = path_outdir / e.logs_file.relative_to(path_rundir)
+            raise
+        finally:
+            self.staging.release(path_stagedir, staged)
+
+            if config.scratch is not None:
+                with tracer.span("scratch sync", "scratch", test=test.name):
+                    config.scratch.finish_test(path_rundir, path_outdir, result.passed)
+
+            result.elapsed = time.perf_counter() - time_test_start
+            result.save(path_outdir / RESULT_FILENAME)
+            self._add_stats(result)
+            log.debug(
+                "Test %s finished",
+                test.name,
+                extra={
+                    "test": test.name,
+                    "passed": result.passed,
+                    "elapsed": result.elapsed,
+                },
+            )
 
-        for test_hook in test.pre_hooks:
-            test_hook.run_hook(self.config)
+            path_simlogs = path_outdir / "simulator.log"
+            if self.message_indexer is not None and path_simlogs.exists():
+                self.message_indexer.add(test.name, path_simlogs)
 
-        path_outdir = self.config.path_logsdir / test.name
-        utils.rmdir_if_exists(path_outdir)
-        path_outdir.mkdir(parents=True)
+        log.info(
+            "Test successful! Took %.2f seconds",
+            result.elapsed,
+            extra={"success": True, "test": test.name},
+        )
 
-        top_entity = self.config.test_framework.get_top_entity(test)
-        args = self.config.test_framework.get_arguments(test)
+        path_coverage = path_outdir / config.simulator.coverage_filename
+        if config.coverage_enabled and path_coverage.exists():
+            if self.coverage_merger is not None:
+                self.coverage_merger.add(path_coverage)
+            with tracer.span("coverage export", "coverage", test=test.name):
+                self._export_coverage(test.name, path_coverage)
+
+        with tracer.span("post-hooks", "hooks", test=test.name):
+            for test_hook in test.post_hooks:
+                test_hook.run_hook(config)
+
+        if self.retention is not None:
+            self.retention.compress(path_outdir)
+
+    def _add_stats(self, result: TestCaseResult):
+        stats = self.resource_stats
+        if stats is None:
+            return
+
+        if result.usage is not None:
+            stats.add_test(result.name, result.usage)
+
+        # Failed tests may have stopped early, their throughput says little
+        if result.simulation is None or not result.passed:
+            return
+
+        previous = stats.get_simulation(result.name)
+        if previous is not None:
+            slowdown = get_slowdown(previous, result.simulation)
+            if slowdown is not None:
+                log.warning(
+                    "Test %s simulated %.1fx slower than in its previous run "
+                    "(%.3g ns/s instead of %.3g ns/s)",
+                    result.name,
+                    slowdown,
+                    result.simulation.ns_per_second,
+                    previous.ns_per_second,
+                )
+
+        stats.add_simulation(result.name, result.simulation)
+
+    def _simulate_test(
+        self,
+        test: TestCase,
+        path_outdir: Path,
+        result: TestCaseResult,
+        config: RunConfig,
+    ):
+        top_entity = config.test_framework.get_top_entity(test)
+        args = config.test_framework.get_arguments(test)
 
         path_simlogs = path_outdir / "simulator.log"
-        self.config.simulator.run_simulation(
-            top_entity, path_outdir, path_simlogs, args, self.config
-        )
+        if test.warmup is not None and config.simulator.supports_checkpoints:
+            path_checkpoint = self._get_checkpoint(test.warmup, top_entity)
+            # A restored simulation keeps the seed of the warmup
+            result.seed = test.warmup.seed
+            with config.tracer.span("simulation", "simulation", test=test.name):
+                config.simulator.run_from_checkpoint(
+                    path_checkpoint, path_outdir, path_simlogs, args, config
+                )
+        else:
+            with config.tracer.span("simulation", "simulation", test=test.name):
+                config.simulator.run_simulation(
+                    top_entity, path_outdir, path_simlogs, args, config
+                )
 
         if not path_simlogs.exists():
             raise TestRunError("Log file not created", None)
 
-        if self.config.simulator.did_error_happen(path_simlogs):
-            raise TestRunError(f"Error during simulation ({test.name})", path_simlogs)
+        if config.profile:
+            self._save_profile(test, path_outdir, path_simlogs)
 
-        errors = self.config.test_framework.get_number_of_errors(test, path_simlogs)
+        with config.tracer.span("verdict", "verdict", test=test.name):
+            if config.simulator.did_error_happen(path_simlogs):
+                raise TestRunError(
+                    f"Error during simulation ({test.name})", path_simlogs
+                )
+
+            errors = config.test_framework.get_number_of_errors(test, path_simlogs)
+            result.errors = errors
 
         if errors > 0:
             raise TestRunError(
                 f"Simulation finished with {errors} errors ({test.name})", path_simlogs
             )
 
-        test_elapsed = time.perf_counter() - time_test_start
-        log.info(
-            "Test successful! Took %.2f seconds", test_elapsed, extra={"success": True}
-        )
+    def _save_profile(self, test: TestCase, path_outdir: Path, path_simlogs: Path):
+        profile = self.config.simulator.collect_profile(path_outdir, path_simlogs)
+        if profile is None:
+            log.warning("No profile was written for test %s", test.name)
+            return
+
+        profile.save(path_outdir / PROFILE_FILENAME)
+        print_profile_summary(test.name, profile)
+
+    def _get_checkpoint(self, warmup: Warmup, top_entity: str) -> Path:
+        """Returns the checkpoint at the end of the warmup, simulating it if
+        no checkpoint for the current design is cached."""
 
-        for test_hook in test.post_hooks:
-            test_hook.run_hook(self.config)
+        sources: List[Path] = []
+        source_args: List[str] = []
+        for library in self.config.libraries:
+            source_args.append(library.name)
+            for source_list in library.source_lists:
+                sources += source_list.paths
+                source_args += source_list.compile_args + source_list.defines
+                if source_list.incdir is not None:
+                    sources.append(source_list.incdir)
+
+        # fmt: off
+        checkpoint_id = utils.fingerprint(sources, [
+            top_entity, warmup.duration, str(warmup.seed), self.config.resolution,
+            str(self.config.coverage_enabled),
+            *warmup.runtime_args, *source_args,
+            *self.config.compile_args, *self.config.runtime_args,
+        ])
+        # fmt: on
+
+        path_cache = self.config.path_cachedir / "checkpoints"
+        path_dir = path_cache / f"{warmup.name}_{checkpoint_id}"
+        path_checkpoint = path_dir / "checkpoint.cpt"
+
+        with self.checkpoint_lock:
+            if path_checkpoint.exists():
+                log.debug("Reusing checkpoint for warmup %s", warmup.name)
+                return path_checkpoint
+
+            log.info("Running warmup %s", warmup.name)
+            time_start = time.perf_counter()
+
+            path_dir.mkdir(parents=True, exist_ok=True)
+            path_simlogs = self.config.path_logsdir / f"warmup_{warmup.name}.log"
+            with self.config.tracer.span(f"warmup {warmup.name}", "simulation"):
+                self.config.simulator.save_checkpoint(
+                    top_entity, warmup, path_checkpoint, path_simlogs, self.config
+                )
+
+            if self.config.simulator.did_error_happen(path_simlogs):
+                utils.rmdir_if_exists(path_dir)
+                raise SimulatorError(f"Error during warmup {warmup.name}", path_simlogs)
+
+            for path_old in utils.find_cache_entries(path_cache, warmup.name):
+                if path_old != path_dir:
+                    utils.rmdir_if_exists(path_old)
+
+            elapsed = time.perf_counter() - time_start
+            log.info("Warmup done! Took %.2f seconds", elapsed)
+
+        return path_checkpoint
 
     def _run_all_tests(self):
         time_start = time.perf_counter()
 
-        for i, test in enumerate(self.config.tests):
-            log.info("Running test %d/%d", i + 1, len(self.config.tests))
-            self._run_test(test)
+        if self.config.coverage_enabled:
+            self.coverage_merger = CoverageMerger(
+                self.config.simulator,
+                self.config.path_logsdir,
+                self.config.jobs,
+                tracer=self.config.tracer,
+                pools=self.pools,
+                resources=self.config.step_resources.get("coverage_merge", {}),
+                background_nice=self._get_background_nice(),
+            )
 
-        elapsed = time.perf_counter() - time_start
-        log.info("All tests ran! Took %.2f seconds", elapsed)
+        try:
+            if self.config.jobs <= 1:
+                for i, test in enumerate(self.config.tests):
+                    log.info("Running test %d/%d", i + 1, len(self.config.tests))
+                    self._run_test(test)
+            else:
+                self._run_tests_parallel()
+
+            elapsed = time.perf_counter() - time_start
+            log.info("All tests ran! Took %.2f seconds", elapsed)
+        except BaseException:
+            # Even if the regression was interrupted, the tests that
+            # completed still make up a valid merged database
+            try:
+                self._finish_coverage()
+            except Exception:
+                log.exception("Could not merge the coverage of the completed tests")
+            raise
+
+        self._finish_coverage()
+
+    def _finish_coverage(self):
+        if self.coverage_merger is None:
+            return
+
+        merger = self.coverage_merger
+        self.coverage_merger = None
+        merger.finish()
 
-        if self.config.coverage_enabled:
-            coverage_files = []
-            for test in self.config.tests:
-                coverage_files.append(self.config.path_logsdir / test.name)
-            self.config.simulator.merge_coverages(
-                self.config.path_logsdir, coverage_files
+        log.info(
+            'Coverage info merged in folder "%s"',
+            self.config.path_logsdir.as_posix(),
+        )
+
+        simulator = self.config.simulator
+        path_coverage = self.config.path_logsdir / simulator.coverage_filename
+        if path_coverage.exists():
+            self._export_coverage(MERGED_SCOPE, path_coverage)
+
+    def _start_coverage_export(self):
+        if not self.config.coverage_export:
+            return
+
+        path_db = self.config.path_logsdir / COVERAGE_DB_FILENAME
+        self.coverage_db = CoverageDatabase(path_db)
+        label = f"seed {self.config.seed}"
+        self.coverage_run = self.coverage_db.new_run(label)
+        log.debug("Exporting coverage as run %d", self.coverage_run)
+
+    def _start_message_index(self):
+        if not self.config.message_index:
+            return
+
+        self.message_indexer = MessageIndexer(
+            self.config.path_logsdir / MESSAGE_INDEX_FILENAME,
+            f"seed {self.config.seed}",
+            background_nice=self._get_background_nice(),
+        )
+
+    def _finish_message_index(self):
+        if self.message_indexer is None:
+            return
+
+        indexer = self.message_indexer
+        self.message_indexer = None
+        indexer.finish()
+
+    def _start_resource_stats(self):
+        self.resource_stats = ResourceStats(
+            self.config.path_logsdir / TEST_STATS_FILENAME
+        )
+
+    def _finish_resource_stats(self):
+        if self.resource_stats is None:
+            return
+
+        stats = self.resource_stats
+        self.resource_stats = None
+        stats.save()
+        stats.log_summary()
+
+    def _start_retention(self):
+        if self.config.retention is None:
+            return
+
+        self.retention = ArtifactRetention(
+            self.config.retention,
+            self.config.path_logsdir,
+            self.config.jobs,
+            background_nice=self._get_background_nice(),
+        )
+
+    def _finish_retention(self):
+        if self.retention is None:
+            return
+
+        retention = self.retention
+        self.retention = None
+        retention.finish()
+
+    def _export_coverage(self, scope: str, path_coverage: Path):
+        if self.coverage_db is None:
+            return
+
+        path_report = path_coverage.parent / "coverage_report.txt"
+        self.config.simulator.report_coverage(path_coverage, path_report)
+        metrics = parse_coverage_report(path_report)
+        self.coverage_db.add(self.coverage_run, scope, metrics)
+
+    def _coverage_diff(self, run_a: int, run_b: int):
+        path_db = self.config.path_logsdir / COVERAGE_DB_FILENAME
+        if not path_db.exists():
+            raise ValidationError("No coverage database, enable coverage export first")
+
+        coverage_db = CoverageDatabase(path_db)
+        try:
+            run_before = coverage_db.resolve_run(run_a)
+            run_after = coverage_db.resolve_run(run_b)
+        except KeyError as e:
+            runs = "\n".join(
+                f"- {run.id}: {run.label} ({run.created})" for run in coverage_db.runs()
             )
-            log.info(
-                'Coverage info merged in folder "%s"',
-                self.config.path_logsdir.as_posix(),
+            raise ValidationError(f"Cannot find run {e}. Available runs:\n{runs}")
+
+        print(f"Coverage diff between run {run_before} and run {run_after}")
+        totals_before = coverage_db.totals(run_before)
+        totals_after = coverage_db.totals(run_after)
+        for metric in sorted(set(totals_before) | set(totals_after)):
+            bins_before, hits_before = totals_before.get(metric, (0, 0))
+            bins_after, hits_after = totals_after.get(metric, (0, 0))
+            print(
+                f"  {metric:<18} {hits_before:>8}/{bins_before:<8} -> "
+                f"{hits_after:>8}/{bins_after:<8} ({hits_after - hits_before:+d})"
             )
 
+        diffs = coverage_db.diff(run_before, run_after)
+        if len(diffs) > 0:
+            print("Changed instances:")
+        for diff in diffs:
+            before = f"{diff.before.hits}/{diff.before.bins}" if diff.before else "-"
+            after = f"{diff.after.hits}/{diff.after.bins}" if diff.after else "-"
+            print(f"  {diff.instance} {diff.metric}: {before} -> {after}")
+
+    def _run_tests_parallel(self):
+        log.info(
+            "Running %d tests on %d workers", len(self.config.tests), self.config.jobs
+        )
+
+        pending = list(self.config.tests)
+        running: Set[Future] = set()
+        done = 0
+
+        executor = ThreadPoolExecutor(max_workers=self.config.jobs)
+        try:
+            while len(pending) > 0 or len(running) > 0:
+                self._launch_tests(executor, pending, running)
+
+                completed, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    # Re-raises the first failure, which stops the whole run
+                    future.result()
+                    done += 1
+                    log.info("Finished test %d/%d", done, len(self.config.tests))
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _launch_tests(
+        self,
+        executor: ThreadPoolExecutor,
+        pending: List[TestCase],
+        running: Set[Future],
+    ):
+        """Starts the first pending tests whose resources and files are available,
+        skipping over those that don't fit for now, until all workers are
+        busy."""
+        for test in list(pending):
+            if len(running) >= self.config.jobs:
+                return
+
+            # Files only conflict with those of running tests, so a test
+            # that can't stage them waits without holding any resources
+            path_stagedir = self._get_stage_dir(test)
+            files = self._get_staged_files(test)
+            if not self.staging.try_acquire(path_stagedir, files):
+                continue
+
+            resources = self._get_test_resources(test)
+            if len(running) == 0:
+                # Nothing would free the pools but the other steps, e.g.
+                # coverage merges, so wait for them
+                self.pools.acquire(resources)
+            elif not self.pools.try_acquire(resources):
+                self.staging.release(path_stagedir, files)
+                continue
+
+            pending.remove(test)
+            running.add(executor.submit(self._run_test_acquired, test, resources))
+
     def _show_waves(self, test: TestCase):
         path_outdir = self.config.path_logsdir / test.name
+        # Gone if it was in a scratch area that was wiped since
+        self.config.path_workdir.mkdir(parents=True, exist_ok=True)
 
         self.config.simulator.show_waves(path_outdir, self.config)
 
@@ -119,20 +717,140 @@ class Runner:
         self.config.simulator.show_coverage(path_logs)
 
     def _setup(self):
-        utils.rmdir_if_exists(self.config.path_workdir)
-        self.config.path_workdir.mkdir(parents=True)
+        with self.config.tracer.span("setup", "setup"):
+            self._setup_workdir()
+            self._start_scratch()
+
+    def _start_scratch(self):
+        scratch = self.config.scratch
+        if scratch is None:
+            return
+
+        log.info('Running in scratch folder "%s"', scratch.path.as_posix())
+        scratch.load_cache()
+
+    def _finish_scratch(self):
+        scratch = self.config.scratch
+        if scratch is None or not scratch.cache_loaded:
+            return
+
+        with self.config.tracer.span("cache sync", "scratch"):
+            scratch.save_cache()
+
+    def _setup_workdir(self):
+        # Staged files are kept, so that the unchanged ones aren't staged again
+        additional_files = self.config.additional_files
+        staged = {file.name for file in additional_files}
+        utils.clear_dir(self.config.path_workdir, staged)
         self.config.path_logsdir.mkdir(parents=True, exist_ok=True)
 
-        for file in self.config.additional_files:
-            path_new = self.config.path_workdir / file.name
-            shutil.copyfile(file, path_new)
+        utils.stage_files(additional_files, self.config.path_workdir)
 
         self.config.simulator.setup()
 
+    def _rank_coverage(self, selection_name: str):
+        simulator = self.config.simulator
+        databases = []
+        seeds = {}
+
+        for test in self.config.tests:
+            path_outdir = self.config.path_logsdir / test.name
+            path_result = path_outdir / RESULT_FILENAME
+            path_coverage = path_outdir / simulator.coverage_filename
+
+            if not path_result.exists() or not path_coverage.exists():
+                log.warning("No coverage for test %s, run it first", test.name)
+                continue
+
+            result = TestCaseResult.load(path_result)
+            if not result.passed:
+                log.warning("Test %s failed, ignoring its coverage", test.name)
+                continue
+
+            databases.append(path_coverage)
+            seeds[path_coverage] = result.seed
+
+        if len(databases) == 0:
+            raise ValidationError("No coverage databases to rank")
+
+        log.info("Ranking the coverage of %d tests", len(databases))
+        ranked = simulator.rank_coverage(databases, self.config.path_logsdir)
+
+        selection = Selection(selection_name, [])
+        for path_coverage in ranked:
+            selection.add(path_coverage.parent.name, seeds[path_coverage])
+
+        path_selection = save_selection(self.config.path_logsdir, selection)
+
+        print(f"Minimal test set ({len(ranked)}/{len(databases)} tests):")
+        for entry in selection.entries:
+            print(f" - {entry.name} (seed {entry.seed})")
+
+        log.info(
+            'Selection "%s" saved in "%s"', selection_name, path_selection.as_posix()
+        )
+
+    def _reverdict_test(self, test: TestCase) -> Optional[TestCaseResult]:
+        path_outdir = self.config.path_logsdir / test.name
+        path_result = path_outdir / RESULT_FILENAME
+        path_simlogs = path_outdir / "simulator.log"
+
+        if not path_result.exists() or utils.find_log(path_simlogs) is None:
+            log.warning("No log for test %s, run it first", test.name)
+            return None
+
+        result = TestCaseResult.load(path_result)
+        if self.config.simulator.did_error_happen(path_simlogs):
+            result.passed = False
+        else:
+            result.errors = self.config.test_framework.get_number_of_errors(
+                test, path_simlogs
+            )
+            result.passed = result.errors == 0
+
+        result.save(path_result)
+        return result
+
+    def _reverdict(self):
+        """Evaluates again the verdict of every test from its log, e.g.
+        after changing what counts as an error, and updates its result."""
+        tests = self.config.tests
+        log.info("Re-evaluating the verdict of %d tests", len(tests))
+
+        previous = {}
+        for test in tests:
+            path_result = self.config.path_logsdir / test.name / RESULT_FILENAME
+            if path_result.exists():
+                previous[test.name] = TestCaseResult.load(path_result).passed
+
+        with ThreadPoolExecutor(max_workers=self.config.jobs) as executor:
+            results = list(executor.map(self._reverdict_test, tests))
+
+        failed = []
+        for result in results:
+            if result is None:
+                continue
+
+            if previous.get(result.name) != result.passed:
+                verdict = "passes" if result.passed else "fails"
+                print(f" - {result.name} now {verdict} ({result.errors} errors)")
+            if not result.passed:
+                failed.append(result.name)
+
+        evaluated = len([result for result in results if result is not None])
+        log.info("%d/%d tests passed", evaluated - len(failed), evaluated)
+
+        if len(failed) > 0:
+            raise TestRunError(f"{len(failed)} tests failed: {', '.join(failed)}")
+
     def _clean(self):
         log.info("Cleaning...")
         utils.rmdir_if_exists(self.config.path_workdir)
-        utils.rmdir_if_exists(self.config.path_logsdir)
+        utils.rmdir_if_exists(self.config.path_cachedir)
+        if self.config.path_logsdir.exists():
+            utils.clear_dir(self.config.path_logsdir, CROSS_RUN_LOGS)
+        if self.config.scratch is not None:
+            self.config.scratch.clean()
 
     def _list_tests(self):
         print("Available tests:")
@@ -150,15 +868,112 @@ class Runner:
                     print(path.absolute().as_posix())
 
     def run(self, action: RunAction):
+        if action in [RunAction.RUN_ALL, RunAction.RUN_SINGLE_TEST]:
+            self._warn_unsupported_warmups()
+            self._check_warmups()
+            self._warn_unsupported_profiling()
+            self._warn_unsupported_stop_time()
+
+        try:
+            self._run_action(action)
+        finally:
+            try:
+                self._finish_generators()
+                self._finish_message_index()
+                self._finish_retention()
+                self._finish_resource_stats()
+                self._finish_scratch()
+            finally:
+                self.config.simulator.teardown()
+                self._save_trace()
+
+    def _save_trace(self):
+        if not self.config.tracer.enabled or not self.config.path_logsdir.exists():
+            return
+
+        path_trace = self.config.path_logsdir / TRACE_FILENAME
+        self.config.tracer.save(path_trace)
+        log.info('Trace saved in "%s"', path_trace.as_posix())
+
+    def _warn_unsupported_profiling(self):
+        if self.config.profile and not self.config.simulator.supports_profiling:
+            log.warning("Simulator does not support profiling, --profile is ignored")
+
+    def _warn_unsupported_stop_time(self):
+        simulator = self.config.simulator
+        if self.config.stop_time is not None and not simulator.supports_stop_time:
+            log.warning(
+                "Simulator does not support a stop time, simulations run until "
+                "the testbench finishes"
+            )
+
+    def _check_warmups(self):
+        """A test restored from the checkpoint of its warmup keeps the seed
+        and the UVM test of the warmup, whatever its own arguments."""
+        if not self.config.simulator.supports_checkpoints:
+            return
+
+        tests = self.config.tests
+        if self.config.test_to_run is not None:
+            tests = [self.config.test_to_run]
+
+        reseeded = []
+        for test in tests:
+            warmup = test.warmup
+            if warmup is None:
+                continue
+
+            args = self.config.test_framework.get_arguments(test)
+            testname = _get_plusarg(args, "UVM_TESTNAME")
+            if testname is not None and testname != _get_plusarg(
+                warmup.runtime_args + self.config.runtime_args, "UVM_TESTNAME"
+            ):
+                raise ValidationError(
+                    f"Test {test.name} runs UVM test {testname}, but restores "
+                    f"warmup {warmup.name} which runs another one. Add "
+                    f"+UVM_TESTNAME={testname} to the runtime arguments of the warmup"
+                )
+
+            seed = test.seed if test.seed is not None else self.config.seed
+            if seed != warmup.seed:
+                reseeded.append(test.name)
+
+        if len(reseeded) > 0:
+            log.warning(
+                "%d tests run with the seed of their warmup instead of their own: %s",
+                len(reseeded),
+                ", ".join(reseeded),
+            )
+
+    def _warn_unsupported_warmups(self):
+        if self.config.simulator.supports_checkpoints:
+            return
+
+        if any(test.warmup is not None for test in self.config.tests):
+            log.warning(
+                "Simulator does not support checkpoints, tests will run their warmup"
+            )
+
+    def _run_action(self, action: RunAction):
         if action == RunAction.CLEAN:
             self._clean()
         elif action == RunAction.LIST_TESTS:
             self._list_tests()
         elif action == RunAction.COMPILE_ONLY:
             self._setup()
+            self._start_resource_stats()
+            self._start_cpu_affinity()
             self._compile()
         elif action == RunAction.LINT_ONLY:
             self._lint()
+        elif action == RunAction.RANK_COVERAGE:
+            assert self.config.selection_name is not None
+            self._rank_coverage(self.config.selection_name)
+        elif action == RunAction.REVERDICT:
+            self._reverdict()
+        elif action == RunAction.COVERAGE_DIFF:
+            assert self.config.coverage_diff is not None
+            self._coverage_diff(*self.config.coverage_diff)
         elif action == RunAction.SHOW_COVERAGE:
             self._show_coverage(self.config.test_to_run)
         elif action == RunAction.DUMP_FILESETS:
@@ -166,11 +981,23 @@ class Runner:
         elif action == RunAction.RUN_SINGLE_TEST:
             assert self.config.test_to_run is not None
             self._setup()
+            self._start_resource_stats()
+            self._start_cpu_affinity()
+            self._start_generators([self.config.test_to_run])
             self._compile()
+            self._start_coverage_export()
+            self._start_message_index()
+            self._start_retention()
             self._run_test(self.config.test_to_run)
         elif action == RunAction.RUN_ALL:
             self._setup()
+            self._start_resource_stats()
+            self._start_cpu_affinity()
+            self._start_generators(self.config.tests)
             self._compile()
+            self._start_coverage_export()
+            self._start_message_index()
+            self._start_retention()
             self._run_all_tests()
         elif action == RunAction.SHOW_WAVES:
             assert self.config.test_to_run is not None
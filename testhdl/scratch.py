@@ -0,0 +1,101 @@
+from pathlib import Path
+
+from testhdl import utils
+from testhdl.models import ScratchPolicy
+
+import shutil
+import hashlib
+import logging
+
+log = logging.getLogger("testhdl")
+
+# Artefacts of passing tests that are not synced back, unless asked for
+WAVE_PATTERNS = ["*.wlf", "*.vcd", "*.fst", "*.lxt2", "*.ghw", "*.wdb"]
+
+
+class ScratchArea:
+    """Runs the build and the simulations in a folder on a fast local disk
+    or a RAM disk, instead of the current folder, e.g. on NFS.
+
+    - The build folder is in the scratch area. Like `build`, it is kept
+      until the next run.
+    - Every test runs in a folder of its own in the scratch area. When it
+      finishes, its artefacts are moved to its folder in the logs folder,
+      except the waves of passing tests, and the scratch folder is deleted.
+    - The cache folder in the scratch area mirrors the persistent one. It
+      is synced from it when the run starts and back to it when the run
+      ends, so that elaborated models and checkpoints are reused across
+      runs, also when the RAM disk was wiped in between.
+
+    The scratch area of a project is always the same folder, named after
+    the path of its build folder, so that a mirror still in the RAM disk
+    from a previous run is up to date and needs no copy.
+    """
+
+    policy: ScratchPolicy
+    path: Path
+    path_workdir: Path
+    path_cachedir: Path
+    path_tests: Path
+    path_persistent_cachedir: Path
+    cache_loaded: bool
+
+    def __init__(self, policy: ScratchPolicy, path_workdir: Path, path_cachedir: Path):
+        self.policy = policy
+
+        project = path_workdir.absolute().as_posix().encode("utf-8")
+        digest = hashlib.sha1(project).hexdigest()[:12]
+        self.path = policy.path / f"testhdl_{digest}"
+
+        self.path_workdir = self.path / path_workdir.name
+        self.path_cachedir = self.path / "cache"
+        self.path_tests = self.path / "tests"
+        self.path_persistent_cachedir = path_cachedir
+        self.cache_loaded = False
+
+    def load_cache(self):
+        self.cache_loaded = True
+        if not self.path_persistent_cachedir.exists():
+            return
+
+        copied = utils.sync_dir(self.path_persistent_cachedir, self.path_cachedir)
+        log.debug("Copied %d files of the cache to the scratch area", copied)
+
+    def save_cache(self):
+        # A mirror that was not synced in this run may be stale
+        if not self.cache_loaded or not self.path_cachedir.exists():
+            return
+
+        copied = utils.sync_dir(self.path_cachedir, self.path_persistent_cachedir)
+        log.debug("Copied %d files of the cache from the scratch area", copied)
+
+    def get_test_dir(self, test: str) -> Path:
+        return self.path_tests / test
+
+    def start_test(self, test: str) -> Path:
+        """Returns an empty folder for the test to run in."""
+        path_rundir = self.get_test_dir(test)
+        utils.rmdir_if_exists(path_rundir)
+        path_rundir.mkdir(parents=True)
+        return path_rundir
+
+    def finish_test(self, path_rundir: Path, path_outdir: Path, passed: bool):
+        """Moves the artefacts of a test to its folder in the logs folder,
+        and deletes its scratch folder."""
+        keep_waves = not passed or self.policy.keep_passing_waves
+
+        for path in sorted(path_rundir.rglob("*")):
+            if not path.is_file():
+                continue
+            if not keep_waves and any(path.match(p) for p in WAVE_PATTERNS):
+                continue
+
+            target = path_outdir / path.relative_to(path_rundir)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(path, target)
+
+        utils.rmdir_if_exists(path_rundir)
+
+    def clean(self):
+        utils.rmdir_if_exists(self.path)
+        utils.rmdir_if_exists(self.path_persistent_cachedir)
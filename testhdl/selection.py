@@ -0,0 +1,56 @@
+from pathlib import Path
+from dataclasses import asdict, dataclass
+from typing import List
+
+from testhdl.errors import ValidationError
+
+import json
+
+
+@dataclass
+class SelectionEntry:
+    name: str
+    seed: int
+
+
+@dataclass
+class Selection:
+    """A named subset of the tests, each with the seed it must run with."""
+
+    name: str
+    entries: List[SelectionEntry]
+
+    def add(self, name: str, seed: int):
+        self.entries.append(SelectionEntry(name, seed))
+
+
+# In the logs folder, kept by --clean
+SELECTIONS_DIRNAME = "selections"
+
+
+def get_selection_path(path_logsdir: Path, name: str) -> Path:
+    return path_logsdir / SELECTIONS_DIRNAME / f"{name}.json"
+
+
+def save_selection(path_logsdir: Path, selection: Selection) -> Path:
+    path_selection = get_selection_path(path_logsdir, selection.name)
+    path_selection.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(path_selection, "w") as outfile:
+        json.dump(asdict(selection), outfile, indent=2)
+
+    return path_selection
+
+
+def load_selection(path_logsdir: Path, name: str) -> Selection:
+    path_selection = get_selection_path(path_logsdir, name)
+    if not path_selection.exists():
+        raise ValidationError(f"Cannot find selection {name}")
+
+    with open(path_selection, "r") as infile:
+        data = json.load(infile)
+
+    entries = [
+        SelectionEntry(entry["name"], entry["seed"]) for entry in data["entries"]
+    ]
+    return Selection(data["name"], entries)
@@ -0,0 +1,117 @@
+from typing import Iterator, Optional
+from contextlib import contextmanager
+
+from testhdl.models import SimMetrics
+
+import time
+import threading
+
+# Wall seconds between two samples of the throughput
+SAMPLE_INTERVAL = 1.0
+
+# Samples kept of a run, every other one is dropped past this
+MAX_SAMPLES = 200
+
+# A test is reported as slower when its throughput drops by this factor
+SLOWDOWN_FACTOR = 2.0
+
+
+def _format_seconds(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds // 60:.0f}m{seconds % 60:02.0f}s"
+    return f"{seconds // 3600:.0f}h{seconds % 3600 // 60:02.0f}m"
+
+
+class SimProgress:
+    """Turns the `{N ns}` progress stamps of a simulation into throughput
+    metrics. When the simulated time of the test is known from a previous
+    run, the progress line also shows how far along it is and an ETA."""
+
+    expected_ns: Optional[float]
+    time_start: float
+    time_first_stamp: Optional[float]
+    time_last_sample: float
+    metrics: SimMetrics
+
+    def __init__(self, expected_ns: Optional[float] = None):
+        self.expected_ns = expected_ns
+        self.time_start = time.perf_counter()
+        self.time_first_stamp = None
+        self.time_last_sample = self.time_start
+        self.metrics = SimMetrics()
+
+    def update(self, sim_time_ns: float) -> str:
+        """Records a progress stamp, and returns the progress line to show."""
+        now = time.perf_counter()
+        metrics = self.metrics
+
+        if self.time_first_stamp is None:
+            self.time_first_stamp = now
+            metrics.startup_seconds = now - self.time_start
+
+        metrics.sim_time_ns = max(metrics.sim_time_ns, sim_time_ns)
+        metrics.wall_seconds = now - self.time_start
+
+        running = now - self.time_first_stamp
+        if running > 0:
+            metrics.ns_per_second = metrics.sim_time_ns / running
+
+        if now - self.time_last_sample >= SAMPLE_INTERVAL:
+            self.time_last_sample = now
+            metrics.throughput.append([metrics.wall_seconds, metrics.sim_time_ns])
+            if len(metrics.throughput) > MAX_SAMPLES:
+                metrics.throughput = metrics.throughput[::2]
+
+        status = f"Last timestamp: {{{sim_time_ns:g} ns}}"
+        if self.expected_ns and metrics.ns_per_second:
+            done = min(1.0, metrics.sim_time_ns / self.expected_ns)
+            remaining = (self.expected_ns - metrics.sim_time_ns) / metrics.ns_per_second
+            status += f" {done:4.0%}, ETA {_format_seconds(max(0.0, remaining))}"
+
+        return status
+
+    def finish(self) -> Optional[SimMetrics]:
+        """Returns the metrics of the simulation, or None if it printed no
+        progress stamp."""
+        if self.time_first_stamp is None:
+            return None
+
+        metrics = self.metrics
+        metrics.wall_seconds = time.perf_counter() - self.time_start
+        metrics.throughput.append([metrics.wall_seconds, metrics.sim_time_ns])
+        return metrics
+
+
+_tracked = threading.local()
+
+
+@contextmanager
+def track_progress(expected_ns: Optional[float] = None) -> Iterator[SimProgress]:
+    """Records the progress stamps that `utils.copy_output` reads from the
+    current thread within the block."""
+    progress = SimProgress(expected_ns)
+    previous = getattr(_tracked, "progress", None)
+    _tracked.progress = progress
+    try:
+        yield progress
+    finally:
+        _tracked.progress = previous
+
+
+def get_tracked_progress() -> Optional[SimProgress]:
+    return getattr(_tracked, "progress", None)
+
+
+def get_slowdown(previous: SimMetrics, current: SimMetrics) -> Optional[float]:
+    """Returns by how much the throughput dropped since the previous run, if
+    it dropped by at least `SLOWDOWN_FACTOR`."""
+    if not previous.ns_per_second or not current.ns_per_second:
+        return None
+
+    slowdown = previous.ns_per_second / current.ns_per_second
+    if slowdown < SLOWDOWN_FACTOR:
+        return None
+
+    return slowdown
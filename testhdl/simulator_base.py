@@ -1,7 +1,10 @@
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import List, TYPE_CHECKING
+from typing import List, Optional, TYPE_CHECKING
 
+from testhdl.errors import UnimplementedError
+from testhdl.models import Warmup
+from testhdl.profiling import Profile
 from testhdl.source_library import SourceLibrary
 
 if TYPE_CHECKING:
@@ -12,6 +15,22 @@ class SimulatorBase(ABC):
     workdir: Path
     logsdir: Path
 
+    # Whether save_checkpoint and run_from_checkpoint are implemented
+    supports_checkpoints: bool = False
+
+    # Whether simulations can run with the profiler, see collect_profile
+    supports_profiling: bool = False
+
+    # Whether simulations stop at the stop time, see TestHDL.set_stop_time
+    supports_stop_time: bool = False
+
+    # Name of the coverage database saved in the output folder of every test
+    coverage_filename: str = "coverage.ucdb"
+
+    # Text of the log lines did_error_happen looks for. The log cap never
+    # drops lines containing any of them
+    verdict_patterns: List[str] = []
+
     def __init__(self, workdir: Path, logsdir: Path):
         self.workdir = workdir
         self.logsdir = logsdir
@@ -19,12 +38,22 @@ class SimulatorBase(ABC):
     def validate(self):
         pass
 
+    def get_run_dir(self, path_outdir: Path) -> Path:
+        """Folder the simulation of a test runs in, given its output folder.
+        The files of the test are staged there."""
+        return self.workdir
+
     def setup(self):
         pass
 
     def clean(self):
         pass
 
+    def teardown(self):
+        """Called once all the tests have run, to release any resource the
+        simulator kept around between tests."""
+        pass
+
     def show_coverage(self, path_logsdir: Path):
         pass
 
@@ -41,11 +70,60 @@ class SimulatorBase(ABC):
     ):
         pass
 
+    def save_checkpoint(
+        self,
+        top_entity: str,
+        warmup: Warmup,
+        path_checkpoint: Path,
+        path_simlogs: Path,
+        config: "RunConfig",
+    ):
+        """Simulates the warmup phase of the top entity, then saves the state
+        of the simulation in `path_checkpoint`."""
+        raise UnimplementedError(f"{type(self).__name__} save_checkpoint")
+
+    def run_from_checkpoint(
+        self,
+        path_checkpoint: Path,
+        path_outdir: Path,
+        path_simlogs: Path,
+        extra_args: List[str],
+        config: "RunConfig",
+    ):
+        """Same as run_simulation, but starts from a checkpoint created by
+        save_checkpoint instead of time 0."""
+        raise UnimplementedError(f"{type(self).__name__} run_from_checkpoint")
+
     def did_error_happen(self, path_logs: Path) -> bool:
         return False
 
+    def collect_profile(self, path_outdir: Path, path_simlogs: Path) -> Optional[Profile]:
+        """Reads the profile of a simulation run with `config.profile`.
+        Returns None if the simulator wrote none."""
+        return None
+
     def merge_coverages(self, path_dest: Path, path_sources: List[Path]):
-        pass
+        """Merges the coverage databases in the `path_sources` folders into
+        one in the `path_dest` folder."""
+        self.merge_coverage_files(
+            path_dest / self.coverage_filename,
+            [source / self.coverage_filename for source in path_sources],
+        )
+
+    def merge_coverage_files(self, path_dest: Path, path_sources: List[Path]):
+        """Merges the coverage databases `path_sources` into `path_dest`."""
+        raise UnimplementedError(f"{type(self).__name__} merge_coverage_files")
+
+    def report_coverage(self, path_database: Path, path_report: Path):
+        """Writes a text report of the coverage database by instance, in the
+        format understood by `coverage_db.parse_coverage_report`."""
+        raise UnimplementedError(f"{type(self).__name__} report_coverage")
+
+    def rank_coverage(self, path_sources: List[Path], path_outdir: Path) -> List[Path]:
+        """Ranks the coverage databases `path_sources`, and returns the ones
+        that together reach the same coverage as all of them, in order of
+        contribution. Reports can be saved in `path_outdir`."""
+        raise UnimplementedError(f"{type(self).__name__} rank_coverage")
 
     def show_waves(self, path_logs: Path, config: "RunConfig"):
         pass
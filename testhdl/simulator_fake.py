@@ -0,0 +1,183 @@
+from pathlib import Path
+from typing import List, Optional
+from testhdl import utils, fake_tools
+from testhdl.coverage import parse_ranktest_output
+from testhdl.errors import SimulatorError, UnimplementedError
+from testhdl.models import HardwareLanguage
+from testhdl.profiling import PROFILE_REPORT_FILENAME, Profile, parse_questa_profile
+from testhdl.run_config import RunConfig
+from testhdl.simulator_base import SimulatorBase
+from testhdl.source_library import SourceLibrary
+
+import os
+import sys
+import time
+import logging
+
+log = logging.getLogger("fake")
+
+
+def fake_tool(tool: str) -> List[str]:
+    return [sys.executable, Path(fake_tools.__file__).absolute().as_posix(), tool]
+
+
+class SimulatorFake(SimulatorBase):
+    """A simulator backend that runs the stand-ins in `testhdl.fake_tools`
+    instead of a real simulator. Useful to measure the overhead of the
+    harness itself. The output of every test can be tuned with `+fake_*`
+    runtime arguments, see `testhdl.fake_tools` for the full list.
+    """
+
+    verdict_patterns = ["Fatal:"]
+    supports_profiling = True
+
+    def compile(self, library: SourceLibrary, config: RunConfig):
+        utils.run_program(
+            [*fake_tool("vlib"), library.name], cwd=self.workdir, echo=config.verbose
+        )
+
+        log.info("Compiling library %s", library.name)
+        time_start = time.perf_counter()
+
+        for source_list in library.source_lists:
+            if source_list.language == HardwareLanguage.VHDL:
+                args = fake_tool("vcom")
+            else:
+                args = fake_tool("vlog")
+
+            args += source_list.compile_args
+            args += config.compile_args
+
+            for path in source_list.paths:
+                args.append(os.path.relpath(path, self.workdir))
+
+            path_logs = self.logsdir / f"compile_{library.name}.log"
+            with config.tracer.span(
+                f"compile {library.name}",
+                "compile",
+                language=source_list.language.value,
+                files=len(source_list.paths),
+            ):
+                rc = utils.run_program(
+                    args, cwd=self.workdir, stdout_out=path_logs, echo=config.verbose
+                )
+
+            if rc != 0:
+                raise SimulatorError("Compilation Failed", path_logs)
+
+        elapsed = time.perf_counter() - time_start
+        log.info("Done! Took %.2f seconds", elapsed)
+
+    def run_simulation(
+        self,
+        top_entity: str,
+        path_outdir: Path,
+        path_simlogs: Path,
+        extra_args: List[str],
+        config: RunConfig,
+    ):
+        # fmt: off
+        args = [
+            *fake_tool("vsim"), "-c",
+            "-sv_seed", str(config.seed),
+            *extra_args,
+            *config.runtime_args,
+            top_entity,
+        ]
+        # fmt: on
+
+        if config.coverage_enabled:
+            path_coverfile = os.path.relpath(
+                path_outdir / "coverage.ucdb", self.workdir
+            )
+            args += ["-do", f"coverage save -onexit {path_coverfile}"]
+
+        if config.profile:
+            path_report = os.path.relpath(
+                path_outdir / PROFILE_REPORT_FILENAME, self.workdir
+            )
+            args += ["-do", f"profile report -hierarchical -file {path_report}"]
+
+        sim_echo = config.verbose or config.verbose_simulation
+        rc = utils.run_program(
+            args,
+            self.workdir,
+            path_simlogs,
+            echo=sim_echo,
+            log_capture=config.log_capture,
+        )
+
+        if rc != 0:
+            raise SimulatorError(
+                "Simulator exited with nonzero return code", path_simlogs
+            )
+
+    def did_error_happen(self, path_logs: Path) -> bool:
+        with utils.open_log(path_logs) as logfile:
+            for line in logfile:
+                if any(pattern in line for pattern in self.verdict_patterns):
+                    return True
+
+        return False
+
+    def collect_profile(self, path_outdir: Path, path_simlogs: Path) -> Optional[Profile]:
+        path_report = path_outdir / PROFILE_REPORT_FILENAME
+        if not path_report.exists():
+            return None
+
+        return parse_questa_profile(path_report)
+
+    def merge_coverage_files(self, path_dest: Path, path_sources: List[Path]):
+        path_dest_rel = os.path.relpath(path_dest, self.workdir)
+        args = [*fake_tool("vcover"), "merge", path_dest_rel]
+
+        for source in path_sources:
+            args.append(os.path.relpath(source, self.workdir))
+
+        path_vcoverlog = path_dest.with_suffix(".log")
+        rc = utils.run_program(args, self.workdir, path_vcoverlog)
+        if rc != 0:
+            raise SimulatorError(
+                "Vcover exited with nonzero return code", path_vcoverlog
+            )
+
+    def report_coverage(self, path_database: Path, path_report: Path):
+        # fmt: off
+        args = [
+            *fake_tool("vcover"), "report", "-byinstance",
+            "-output", os.path.relpath(path_report, self.workdir),
+            os.path.relpath(path_database, self.workdir),
+        ]
+        # fmt: on
+
+        path_vcoverlog = path_report.with_suffix(".log")
+        rc = utils.run_program(args, self.workdir, path_vcoverlog)
+        if rc != 0:
+            raise SimulatorError(
+                "Vcover exited with nonzero return code", path_vcoverlog
+            )
+
+    def rank_coverage(self, path_sources: List[Path], path_outdir: Path) -> List[Path]:
+        args = [*fake_tool("vcover"), "ranktest"]
+        args += [os.path.relpath(source, self.workdir) for source in path_sources]
+
+        path_vcoverlog = path_outdir / "vcover_ranktest.log"
+        rc = utils.run_program(args, self.workdir, path_vcoverlog)
+        if rc != 0:
+            raise SimulatorError(
+                "Vcover exited with nonzero return code", path_vcoverlog
+            )
+
+        databases = [
+            Path(os.path.relpath(source, self.workdir)) for source in path_sources
+        ]
+        ranked = parse_ranktest_output(path_vcoverlog, databases)
+        return [path_sources[databases.index(database)] for database in ranked]
+
+    def show_waves(self, path_logs: Path, config: RunConfig):
+        _ = path_logs
+        raise UnimplementedError("SimulatorFake show_waves")
+
+    def show_coverage(self, path_logsdir: Path):
+        _ = path_logsdir
+        raise UnimplementedError("SimulatorFake show_coverage")
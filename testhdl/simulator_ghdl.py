@@ -0,0 +1,265 @@
+from pathlib import Path
+from typing import List
+from testhdl import utils
+from testhdl.errors import SimulatorError, UnimplementedError, ValidationError
+from testhdl.models import HardwareLanguage
+from testhdl.run_config import RunConfig
+from testhdl.simulator_base import SimulatorBase
+from testhdl.source_library import SourceLibrary
+
+import os
+import time
+import shutil
+import logging
+import threading
+
+log = logging.getLogger("ghdl")
+
+GHDL = "ghdl"
+
+
+class SimulatorGHDL(SimulatorBase):
+    """Analyzes every source list with `ghdl -a`, then elaborates each top
+    entity once into an executable that every test runs independently.
+
+    Elaborated executables are cached in `path_cachedir`, keyed on a
+    fingerprint of all the sources and arguments. With the mcode backend
+    GHDL cannot produce executables, so tests fall back to `ghdl -r`.
+    """
+
+    verdict_patterns = ["(assertion failure)", "(report failure)"]
+    supports_stop_time = True
+
+    elaborate_lock: threading.Lock
+
+    def __init__(self, workdir: Path, logsdir: Path):
+        super().__init__(workdir, logsdir)
+        self.elaborate_lock = threading.Lock()
+
+    def validate(self):
+        if shutil.which(GHDL) is None:
+            raise ValidationError("Program `ghdl` was not found")
+
+    def _get_library_args(self, config: RunConfig) -> List[str]:
+        args = ["--std=08"]
+        for library in config.libraries:
+            args.append(f"-P{self._get_library_dir(library.name)}")
+
+        return args
+
+    def _get_library_dir(self, library_name: str) -> str:
+        return os.path.relpath(self.workdir / GHDL / library_name, self.workdir)
+
+    def compile(self, library: SourceLibrary, config: RunConfig):
+        (self.workdir / GHDL / library.name).mkdir(parents=True, exist_ok=True)
+
+        log.info("Compiling library %s", library.name)
+        time_start = time.perf_counter()
+
+        for source_list in library.source_lists:
+            if source_list.language != HardwareLanguage.VHDL:
+                raise UnimplementedError("SimulatorGHDL compile Verilog")
+
+            if source_list.coverage_enabled:
+                raise UnimplementedError("SimulatorGHDL compile coverage_enabled")
+
+            # fmt: off
+            args = [
+                GHDL, "-a",
+                f"--work={library.name}",
+                f"--workdir={self._get_library_dir(library.name)}",
+                *self._get_library_args(config),
+            ]
+            # fmt: on
+
+            args += source_list.compile_args
+            args += config.compile_args
+
+            for path in source_list.paths:
+                new_path = os.path.relpath(path, self.workdir)
+                args.append(new_path)
+
+            path_logs = self.logsdir / f"compile_{library.name}.log"
+            with config.tracer.span(
+                f"compile {library.name}",
+                "compile",
+                language=source_list.language.value,
+                files=len(source_list.paths),
+            ):
+                rc = utils.run_program(
+                    args, cwd=self.workdir, stdout_out=path_logs, echo=config.verbose
+                )
+
+            if rc != 0:
+                raise SimulatorError("Compilation Failed", path_logs)
+
+        elapsed = time.perf_counter() - time_start
+        log.info("Done! Took %.2f seconds", elapsed)
+
+    def _get_top_library(self, config: RunConfig) -> str:
+        for library in config.libraries:
+            if library.name == "work":
+                return library.name
+
+        return config.libraries[-1].name
+
+    def _elaborate(self, top_entity: str, config: RunConfig) -> List[str]:
+        """Elaborates the top entity if needed, and returns the command
+        that runs the simulation."""
+
+        top_library = self._get_top_library(config)
+        # fmt: off
+        args = [
+            GHDL, "-e",
+            f"--work={top_library}",
+            f"--workdir={self._get_library_dir(top_library)}",
+            *self._get_library_args(config),
+            *config.compile_args,
+        ]
+        # fmt: on
+
+        # The analysis arguments change the design too, e.g. --ieee=synopsys
+        sources = []
+        extra = args + [top_entity]
+        for library in config.libraries:
+            for source_list in library.source_lists:
+                sources += source_list.paths
+                extra += source_list.compile_args
+
+        elab_id = f"{top_entity}_{utils.fingerprint(sources, extra)}"
+        path_cache = config.path_cachedir / GHDL
+        path_elab = path_cache / elab_id
+        path_executable = path_elab / top_entity.lower()
+
+        with self.elaborate_lock:
+            if not path_elab.exists():
+                log.info("Elaborating %s", top_entity)
+
+                # Elaborate in a temporary folder, so that an interrupted
+                # elaboration never leaves an empty entry in the cache
+                path_partial = path_cache / f"{elab_id}.partial"
+                utils.rmdir_if_exists(path_partial)
+                path_partial.mkdir(parents=True)
+
+                path_output = path_partial / path_executable.name
+                args += ["-o", path_output.absolute().as_posix(), top_entity]
+
+                path_logs = self.logsdir / f"elaborate_{top_entity}.log"
+                with config.tracer.span("elaborate", "elaborate", top=top_entity):
+                    rc = utils.run_program(
+                        args,
+                        cwd=self.workdir,
+                        stdout_out=path_logs,
+                        echo=config.verbose,
+                    )
+
+                if rc != 0:
+                    utils.rmdir_if_exists(path_partial)
+                    raise SimulatorError(
+                        "Elaboration failed, GHDL exited with nonzero return code",
+                        path_logs,
+                    )
+
+                path_partial.rename(path_elab)
+
+                for path_old in utils.find_cache_entries(path_cache, top_entity):
+                    if path_old != path_elab:
+                        utils.rmdir_if_exists(path_old)
+
+        if path_executable.exists():
+            return [path_executable.absolute().as_posix()]
+
+        # The mcode backend only checks the design during elaboration,
+        # the actual elaboration gets done every time the simulation is run.
+        log.debug("No executable was produced, running through ghdl -r")
+        # fmt: off
+        return [
+            GHDL, "-r",
+            f"--work={top_library}",
+            f"--workdir={self._get_library_dir(top_library)}",
+            *self._get_library_args(config),
+            top_entity,
+        ]
+        # fmt: on
+
+    def show_waves(self, path_logs: Path, config: RunConfig):
+        path_wavefile = path_logs / "wave.fst"
+        if not path_wavefile.exists():
+            raise SimulatorError(
+                "Wavefile not found. Make sure you run the simulation first with all waves logged",
+                None,
+            )
+
+        path_config = path_logs / "wave.gtkw"
+
+        if config.wave_config_file_generator is not None:
+            config.wave_config_file_generator(path_wavefile, path_config)
+        elif config.wave_config_file is not None:
+            shutil.copy(config.wave_config_file, path_config)
+
+        args = [
+            "gtkwave",
+            path_wavefile.absolute().as_posix(),
+            path_config.absolute().as_posix(),
+        ]
+        rc = utils.run_program(args, cwd=self.workdir, echo=config.verbose)
+
+        if rc != 0:
+            raise SimulatorError("Could not show waves", None)
+
+    def run_simulation(
+        self,
+        top_entity: str,
+        path_outdir: Path,
+        path_simlogs: Path,
+        extra_args: List[str],
+        config: RunConfig,
+    ):
+        if config.coverage_enabled:
+            raise UnimplementedError("SimulatorGHDL run_simulation coverage_enabled")
+
+        args = self._elaborate(top_entity, config)
+
+        # Generics are given by the test framework as -gNAME=VALUE
+        args += extra_args
+        args += config.runtime_args
+
+        if config.stop_time is not None:
+            args.append(f"--stop-time={config.stop_time.replace(' ', '')}")
+
+        if config.log_all_waves:
+            path_wavefile = os.path.relpath(path_outdir / "wave.fst", self.workdir)
+            args.append(f"--fst={path_wavefile}")
+
+        args += config.runtime_run_args
+
+        sim_echo = config.verbose or config.verbose_simulation
+        rc = utils.run_program(
+            args,
+            self.workdir,
+            path_simlogs,
+            echo=sim_echo,
+            log_capture=config.log_capture,
+        )
+
+        if rc != 0:
+            raise SimulatorError(
+                "Simulator exited with nonzero return code", path_simlogs
+            )
+
+    def did_error_happen(self, path_logs: Path) -> bool:
+        with utils.open_log(path_logs) as logfile:
+            for line in logfile:
+                if any(pattern in line for pattern in self.verdict_patterns):
+                    return True
+
+        return False
+
+    def show_coverage(self, path_logsdir: Path):
+        _ = path_logsdir
+        raise UnimplementedError("SimulatorGHDL show_coverage")
+
+    def merge_coverages(self, path_dest: Path, path_sources: List[Path]):
+        _ = path_dest
+        _ = path_sources
+        raise UnimplementedError("SimulatorGHDL merge_coverages")
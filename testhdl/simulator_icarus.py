@@ -0,0 +1,223 @@
+from pathlib import Path
+from typing import List
+from testhdl import utils
+from testhdl.errors import SimulatorError, UnimplementedError, ValidationError
+from testhdl.models import HardwareLanguage
+from testhdl.run_config import RunConfig
+from testhdl.simulator_base import SimulatorBase
+from testhdl.source_library import SourceLibrary
+
+import time
+import shutil
+import logging
+import threading
+
+log = logging.getLogger("icarus")
+
+IVERILOG = "iverilog"
+VVP = "vvp"
+
+WAVE_FORMAT_ARGS = ["-vcd", "-lxt", "-lxt2", "-fst", "-none"]
+
+
+class SimulatorIcarus(SimulatorBase):
+    """Compiles each top entity once with `iverilog -g2012` into a `.vvp`
+    image, then runs every test as a `vvp` invocation of that image.
+
+    Images are cached in `path_cachedir`, keyed on a fingerprint of all the
+    sources and arguments. When waves are enabled with `set_log_all_waves`,
+    the simulation dumps in FST format (pass `-lxt2` as a runtime argument
+    to use LXT2 instead). The simulation runs inside the test's output
+    folder, so a `$dumpfile("wave.fst")` in the testbench will end up there.
+    The seed is passed as the `+seed=N` plusarg.
+    """
+
+    # did_error_happen matches them at the start of the line only
+    verdict_patterns = ["FATAL:", "ERROR:"]
+
+    build_lock: threading.Lock
+
+    def __init__(self, workdir: Path, logsdir: Path):
+        super().__init__(workdir, logsdir)
+        self.build_lock = threading.Lock()
+
+    def validate(self):
+        if shutil.which(IVERILOG) is None:
+            raise ValidationError("Program `iverilog` was not found")
+        if shutil.which(VVP) is None:
+            raise ValidationError("Program `vvp` was not found")
+
+    def compile(self, library: SourceLibrary, config: RunConfig):
+        # Icarus has no concept of libraries: everything gets compiled
+        # together into an image, once the top entity is known.
+        for source_list in library.source_lists:
+            if source_list.language == HardwareLanguage.VHDL:
+                raise UnimplementedError("SimulatorIcarus compile VHDL")
+
+            if source_list.coverage_enabled:
+                raise UnimplementedError("SimulatorIcarus compile coverage_enabled")
+
+        log.info("Library %s will be compiled with the image", library.name)
+
+    def _get_build_args(self, top_entity: str, config: RunConfig) -> List[str]:
+        # fmt: off
+        args = [
+            IVERILOG, "-g2012",
+            "-s", top_entity,
+        ]
+        # fmt: on
+
+        args += config.compile_args
+
+        for library in config.libraries:
+            for source_list in library.source_lists:
+                args += source_list.compile_args
+
+                for define in source_list.defines:
+                    args.append(f"-D{define}")
+
+                if source_list.incdir is not None:
+                    args.append(f"-I{source_list.incdir.absolute().as_posix()}")
+
+                for path in source_list.paths:
+                    args.append(path.absolute().as_posix())
+
+        return args
+
+    def _build_image(self, top_entity: str, config: RunConfig) -> Path:
+        args = self._get_build_args(top_entity, config)
+
+        sources = []
+        for library in config.libraries:
+            for source_list in library.source_lists:
+                sources += source_list.paths
+                if source_list.incdir is not None:
+                    sources.append(source_list.incdir)
+
+        image_id = f"{top_entity}_{utils.fingerprint(sources, args)}"
+        path_cache = config.path_cachedir / "icarus"
+        path_image = path_cache / f"{image_id}.vvp"
+
+        with self.build_lock:
+            if path_image.exists():
+                log.debug("Reusing cached image %s", image_id)
+                return path_image
+
+            log.info("Compiling image for %s", top_entity)
+            time_start = time.perf_counter()
+
+            path_cache.mkdir(parents=True, exist_ok=True)
+            # Compile to a temporary name, so that an interrupted build
+            # never leaves a broken image in the cache
+            path_partial = path_cache / f"{image_id}.partial"
+            args += ["-o", path_partial.absolute().as_posix()]
+
+            path_logs = self.logsdir / f"compile_{top_entity}.log"
+            with config.tracer.span("elaborate", "elaborate", top=top_entity):
+                rc = utils.run_program(
+                    args, cwd=self.workdir, stdout_out=path_logs, echo=config.verbose
+                )
+
+            if rc != 0 or not path_partial.exists():
+                raise SimulatorError("Compilation Failed", path_logs)
+
+            path_partial.rename(path_image)
+
+            # Images compiled from older sources are never going to be used again
+            for path_old in utils.find_cache_entries(path_cache, top_entity, ".vvp"):
+                if path_old != path_image:
+                    path_old.unlink()
+
+            elapsed = time.perf_counter() - time_start
+            log.info("Done! Took %.2f seconds", elapsed)
+
+        return path_image
+
+    def show_waves(self, path_logs: Path, config: RunConfig):
+        path_wavefile = path_logs / "wave.fst"
+        if not path_wavefile.exists():
+            path_wavefile = path_logs / "wave.lxt2"
+
+        if not path_wavefile.exists():
+            raise SimulatorError(
+                "Wavefile not found. Make sure you run the simulation first with all waves logged",
+                None,
+            )
+
+        path_config = path_logs / "wave.gtkw"
+
+        if config.wave_config_file_generator is not None:
+            config.wave_config_file_generator(path_wavefile, path_config)
+        elif config.wave_config_file is not None:
+            shutil.copy(config.wave_config_file, path_config)
+
+        args = [
+            "gtkwave",
+            path_wavefile.absolute().as_posix(),
+            path_config.absolute().as_posix(),
+        ]
+        rc = utils.run_program(args, cwd=self.workdir, echo=config.verbose)
+
+        if rc != 0:
+            raise SimulatorError("Could not show waves", None)
+
+    def run_simulation(
+        self,
+        top_entity: str,
+        path_outdir: Path,
+        path_simlogs: Path,
+        extra_args: List[str],
+        config: RunConfig,
+    ):
+        if config.coverage_enabled:
+            raise UnimplementedError("SimulatorIcarus run_simulation coverage_enabled")
+
+        path_image = self._build_image(top_entity, config)
+
+        # -n makes $stop behave like $finish, so vvp never waits for input
+        args = [VVP, "-n", path_image.absolute().as_posix()]
+
+        if config.log_all_waves and not any(
+            arg in WAVE_FORMAT_ARGS for arg in config.runtime_args
+        ):
+            args.append("-fst")
+        elif not config.log_all_waves:
+            args.append("-none")
+
+        args += [f"+seed={config.seed}", *extra_args, *config.runtime_args]
+
+        sim_echo = config.verbose or config.verbose_simulation
+        rc = utils.run_program(
+            args,
+            self.get_run_dir(path_outdir),
+            path_simlogs,
+            echo=sim_echo,
+            log_capture=config.log_capture,
+        )
+
+        if rc != 0:
+            raise SimulatorError(
+                "Simulator exited with nonzero return code", path_simlogs
+            )
+
+    def get_run_dir(self, path_outdir: Path) -> Path:
+        return path_outdir
+
+    def did_error_happen(self, path_logs: Path) -> bool:
+        with utils.open_log(path_logs) as logfile:
+            for line in logfile:
+                # Icarus prints $error and $fatal in uppercase, which the
+                # test frameworks wouldn't pick up.
+                if line.startswith("FATAL:") or line.startswith("ERROR:"):
+                    return True
+
+        return False
+
+    def show_coverage(self, path_logsdir: Path):
+        _ = path_logsdir
+        raise UnimplementedError("SimulatorIcarus show_coverage")
+
+    def merge_coverages(self, path_dest: Path, path_sources: List[Path]):
+        _ = path_dest
+        _ = path_sources
+        raise UnimplementedError("SimulatorIcarus merge_coverages")
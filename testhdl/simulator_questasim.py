@@ -1,9 +1,12 @@
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Set, Tuple
 import webbrowser
 from testhdl import utils
+from testhdl.log_capture import LogCapture, open_log_writer
+from testhdl.coverage import parse_ranktest_output
 from testhdl.errors import SimulatorError, ValidationError
-from testhdl.models import HardwareLanguage
+from testhdl.models import HardwareLanguage, Warmup
+from testhdl.profiling import PROFILE_REPORT_FILENAME, Profile, parse_questa_profile
 from testhdl.run_config import RunConfig
 from testhdl.simulator_base import SimulatorBase
 from testhdl.source_library import SourceLibrary
@@ -12,11 +15,121 @@ import os
 import time
 import shutil
 import logging
+import threading
+import subprocess
 
 log = logging.getLogger("questasim")
 
+# Printed by a session when the design could not be loaded
+LOAD_FAILED_MARKER = "@@testhdl_LOADFAILED@@"
+
+
+class QuestaSession:
+    """A `vsim -c` process kept alive across tests, driven through its Tcl
+    prompt. Every test loads the design, runs, and unloads it with
+    `quit -sim`, which saves the startup and licence checkout time."""
+
+    proc: subprocess.Popen
+    tests_run: int
+
+    def __init__(self, workdir: Path):
+        args = ["vsim", "-c"]
+        log.debug("Starting session '%s'", utils.join_args(args))
+
+        self.tests_run = 0
+        self.proc = subprocess.Popen(
+            args,
+            cwd=workdir,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        # $finish would otherwise end the whole session
+        self._send(["onfinish stop"])
+
+    def _send(self, commands: List[str]):
+        assert self.proc.stdin is not None
+        for command in commands:
+            self.proc.stdin.write(command.encode("utf-8") + b"\n")
+        self.proc.stdin.flush()
+
+    @staticmethod
+    def get_load_command(args: List[str]) -> str:
+        """Wraps a `vsim` command loading a design, which only prints an
+        error when it fails, so that the failure can be told apart."""
+        # Built by Tcl like the done marker. The line also matches the
+        # verdict patterns, so the log cap keeps it
+        failed = "@@testhdl_[string toupper loadfailed]@@"
+        fatal = "[string totitle fatal]:"
+        return (
+            f"if {{[catch {{{utils.join_args(args)}}} err]}} "
+            f'{{echo "** {fatal} {failed} $err"}}'
+        )
+
+    def is_alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def run(
+        self,
+        commands: List[str],
+        path_simlogs: Path,
+        echo: bool,
+        log_capture: Optional[LogCapture] = None,
+    ) -> bool:
+        """Runs the commands, copying their output to the log file.
+
+        :return: False if the session died before completing them
+        """
+        assert self.proc.stdout is not None
+        self.tests_run += 1
+
+        # The marker is built by Tcl, so that vsim echoing back the
+        # command itself can't be mistaken for its output
+        marker = f"@@testhdl_DONE_{self.tests_run}@@"
+        done = f"echo @@testhdl_[string toupper done]_{self.tests_run}@@"
+
+        file_out = open_log_writer(path_simlogs, log_capture)
+        try:
+            try:
+                self._send([*commands, done])
+            except BrokenPipeError:
+                return False
+
+            return utils.copy_output(self.proc.stdout, file_out, echo, until=marker)
+        finally:
+            file_out.close()
+
+    def close(self):
+        if self.is_alive():
+            try:
+                self._send(["quit -f"])
+                self.proc.wait(timeout=30)
+            except (BrokenPipeError, subprocess.TimeoutExpired):
+                self.proc.kill()
+                self.proc.wait()
+
 
 class SimulatorQuestaSim(SimulatorBase):
+    verdict_patterns = ["Fatal:"]
+    supports_profiling = True
+    supports_checkpoints = True
+    supports_stop_time = True
+
+    optimize_lock: threading.Lock
+    optimized_designs: Set[str]
+
+    sessions_lock: threading.Lock
+    sessions: List[QuestaSession]
+    worker_sessions: threading.local
+
+    def __init__(self, workdir: Path, logsdir: Path):
+        super().__init__(workdir, logsdir)
+        self.optimize_lock = threading.Lock()
+        self.optimized_designs = set()
+        self.sessions_lock = threading.Lock()
+        self.sessions = []
+        self.worker_sessions = threading.local()
+
     def validate(self):
         if shutil.which("vsim") is None:
             raise ValidationError("Program `vsim` was not found")
@@ -79,9 +192,15 @@ class SimulatorQuestaSim(SimulatorBase):
                 args.append(new_path)
 
             path_logs = self.logsdir / f"compile_{library.name}.log"
-            rc = utils.run_program(
-                args, cwd=self.workdir, stdout_out=path_logs, echo=config.verbose
-            )
+            with config.tracer.span(
+                f"compile {library.name}",
+                "compile",
+                language=source_list.language.value,
+                files=len(source_list.paths),
+            ):
+                rc = utils.run_program(
+                    args, cwd=self.workdir, stdout_out=path_logs, echo=config.verbose
+                )
 
             if rc != 0:
                 raise SimulatorError("Compilation Failed", path_logs)
@@ -124,64 +243,275 @@ class SimulatorQuestaSim(SimulatorBase):
         extra_args: List[str],
         config: RunConfig,
     ):
-        path_wavefile = os.path.relpath(path_outdir / "wave.wlf", self.workdir)
+        if config.use_sessions:
+            self._run_simulation_in_session(
+                top_entity, path_outdir, path_simlogs, extra_args, config
+            )
+            return
 
-        if config.coverage_enabled:
-            extra_args.append("-coverage")
-            extra_args.append("-cvgperinstance")
+        design_args, commands = self._get_simulation_commands(
+            path_outdir, extra_args, config
+        )
+
+        # fmt: off
+        args = [
+            "vsim", "-c",
+            "-vopt", "-voptargs=+acc",
+            *design_args,
+            f"{top_entity}"
+        ]
+        # fmt: on
+
+        for command in commands:
+            args += ["-do", command]
+        args += ["-do", "quit"]
+
+        sim_echo = config.verbose or config.verbose_simulation
+        rc = utils.run_program(
+            args,
+            self.workdir,
+            path_simlogs,
+            echo=sim_echo,
+            log_capture=config.log_capture,
+        )
+
+        if rc != 0:
+            raise SimulatorError(
+                "Simulator exited with nonzero return code", path_simlogs
+            )
+
+    def save_checkpoint(
+        self,
+        top_entity: str,
+        warmup: Warmup,
+        path_checkpoint: Path,
+        path_simlogs: Path,
+        config: RunConfig,
+    ):
+        path_checkpoint_rel = os.path.relpath(path_checkpoint, self.workdir)
 
         # fmt: off
         args = [
             "vsim", "-c",
-            "-wave", path_wavefile,
             "-t", config.resolution,
             "-vopt", "-voptargs=+acc",
+            "-sv_seed", str(warmup.seed),
+            *(["-coverage", "-cvgperinstance"] if config.coverage_enabled else []),
+            *warmup.runtime_args,
+            *config.runtime_args,
+            top_entity,
+            "-do", f"run {warmup.duration}",
+            "-do", f"checkpoint {path_checkpoint_rel}",
+            "-do", "quit",
+        ]
+        # fmt: on
+
+        rc = utils.run_program(
+            args,
+            self.workdir,
+            path_simlogs,
+            echo=config.verbose,
+            log_capture=config.log_capture,
+        )
+
+        if rc != 0 or not path_checkpoint.exists():
+            raise SimulatorError("Could not save the checkpoint", path_simlogs)
+
+    def run_from_checkpoint(
+        self,
+        path_checkpoint: Path,
+        path_outdir: Path,
+        path_simlogs: Path,
+        extra_args: List[str],
+        config: RunConfig,
+    ):
+        design_args, commands = self._get_simulation_commands(
+            path_outdir, extra_args, config
+        )
+
+        path_checkpoint_rel = os.path.relpath(path_checkpoint, self.workdir)
+        args = ["vsim", "-c", "-restore", path_checkpoint_rel, *design_args]
+
+        for command in commands:
+            args += ["-do", command]
+        args += ["-do", "quit"]
+
+        sim_echo = config.verbose or config.verbose_simulation
+        rc = utils.run_program(
+            args,
+            self.workdir,
+            path_simlogs,
+            echo=sim_echo,
+            log_capture=config.log_capture,
+        )
+
+        if rc != 0:
+            raise SimulatorError(
+                "Simulator exited with nonzero return code", path_simlogs
+            )
+
+    def _get_simulation_commands(
+        self, path_outdir: Path, extra_args: List[str], config: RunConfig
+    ) -> Tuple[List[str], List[str]]:
+        """Returns the arguments used to load the design (without the
+        design itself), and the commands to run once it is loaded."""
+
+        path_wavefile = os.path.relpath(path_outdir / "wave.wlf", self.workdir)
+
+        # fmt: off
+        design_args = [
+            "-wave", path_wavefile,
+            "-t", config.resolution,
             "-sv_seed", str(config.seed),
             *extra_args,
             *config.runtime_args,
-            f"{top_entity}"
         ]
         # fmt: on
+        commands = []
 
         if config.coverage_enabled:
+            design_args.append("-coverage")
+            design_args.append("-cvgperinstance")
+
             path_coverfile = os.path.relpath(
                 path_outdir / "coverage.ucdb", self.workdir
             )
-            args += [
-                "-do",
-                f"coverage save -onexit -directive -codeAll -cvg {path_coverfile}",
-            ]
+            commands.append(
+                f"coverage save -onexit -directive -codeAll -cvg {path_coverfile}"
+            )
+            # Used by vcover ranktest to tell the tests apart, as the
+            # databases all have the same file name
+            commands.append(
+                f"coverage attribute -name TESTNAME -value {path_outdir.name}"
+            )
+
+        if config.profile:
+            # Stop at $finish instead of exiting, so that the report can be
+            # written after the run
+            design_args += ["-onfinish", "stop"]
+            commands.append("profile on")
 
         # UVM components don't get instantiated until after the first timestep of the simulation,
         # so we advance the simulation just a little in order to log them in the waveform file.
-        args += ["-do", f"run {config.resolution}"]
+        commands.append(f"run {config.resolution}")
         if config.log_all_waves:
-            args += [
-                "-do",
-                "set WildcardFilter [lsearch -not -all -inline $WildcardFilter Memory]",
-            ]
-            args += ["-do", "log -r /*"]
-        args += config.runtime_run_args
-
-        args += ["-do", "run -all"]
-        args += ["-do", "quit"]
+            commands.append(
+                "set WildcardFilter [lsearch -not -all -inline $WildcardFilter Memory]"
+            )
+            commands.append("log -r /*")
+
+        run_args = iter(config.runtime_run_args)
+        for argument in run_args:
+            if argument == "-do":
+                command = next(run_args, None)
+                if command is None:
+                    raise ValidationError("Runtime run argument -do needs a command")
+                commands.append(command)
+            else:
+                design_args.append(argument)
 
-        sim_echo = config.verbose_simulation or config.verbose_simulation
-        rc = utils.run_program(args, self.workdir, path_simlogs, echo=sim_echo)
+        if config.stop_time is not None:
+            commands.append(f"run {config.stop_time}")
+        else:
+            commands.append("run -all")
 
-        if rc != 0:
-            raise SimulatorError(
-                "Simulator exited with nonzero return code", path_simlogs
+        if config.profile:
+            path_report = os.path.relpath(
+                path_outdir / PROFILE_REPORT_FILENAME, self.workdir
             )
+            commands.append(f"profile report -hierarchical -file {path_report}")
+
+        return design_args, commands
+
+    def _optimize(self, top_entity: str, config: RunConfig) -> str:
+        """Optimizes the top entity once per run, so that sessions can
+        load the optimized design directly."""
+
+        design_name = f"{top_entity}_opt"
+
+        with self.optimize_lock:
+            if top_entity in self.optimized_designs:
+                return design_name
+
+            log.info("Optimizing %s", top_entity)
+            args = ["vopt", "+acc", top_entity, "-o", design_name]
+            path_logs = self.logsdir / f"optimize_{top_entity}.log"
+            with config.tracer.span("elaborate", "elaborate", top=top_entity):
+                rc = utils.run_program(
+                    args, cwd=self.workdir, stdout_out=path_logs, echo=config.verbose
+                )
+            if rc != 0:
+                raise SimulatorError("Optimization failed", path_logs)
+
+            self.optimized_designs.add(top_entity)
+
+        return design_name
+
+    def _run_simulation_in_session(
+        self,
+        top_entity: str,
+        path_outdir: Path,
+        path_simlogs: Path,
+        extra_args: List[str],
+        config: RunConfig,
+    ):
+        design_name = self._optimize(top_entity, config)
+        design_args, commands = self._get_simulation_commands(
+            path_outdir, extra_args, config
+        )
+
+        session = getattr(self.worker_sessions, "session", None)
+        if session is None or not session.is_alive():
+            session = QuestaSession(self.workdir)
+            self.worker_sessions.session = session
+            with self.sessions_lock:
+                self.sessions.append(session)
+
+        commands = [
+            session.get_load_command(["vsim", *design_args, design_name]),
+            *commands,
+            "quit -sim",
+        ]
+
+        sim_echo = config.verbose or config.verbose_simulation
+        completed = session.run(
+            commands,
+            path_simlogs,
+            echo=sim_echo,
+            log_capture=config.log_capture,
+        )
+
+        if not completed:
+            # The next test on this worker will get a fresh session
+            self.worker_sessions.session = None
+            session.close()
+            raise SimulatorError("Simulator session crashed", path_simlogs)
+
+        with utils.open_log(path_simlogs) as logfile:
+            if any(LOAD_FAILED_MARKER in line for line in logfile):
+                raise SimulatorError("Could not load the design", path_simlogs)
+
+    def teardown(self):
+        with self.sessions_lock:
+            for session in self.sessions:
+                session.close()
+            self.sessions = []
 
     def did_error_happen(self, path_logs: Path) -> bool:
-        with open(path_logs, "r") as logfile:
+        with utils.open_log(path_logs) as logfile:
             for line in logfile:
-                if "Fatal:" in line:
+                if any(pattern in line for pattern in self.verdict_patterns):
                     return True
 
         return False
 
+    def collect_profile(self, path_outdir: Path, path_simlogs: Path) -> Optional[Profile]:
+        path_report = path_outdir / PROFILE_REPORT_FILENAME
+        if not path_report.exists():
+            return None
+
+        return parse_questa_profile(path_report)
+
     def show_coverage(self, path_logsdir: Path):
         path_logs = path_logsdir / "coverage.ucdb"
         if not path_logs.exists():
@@ -208,22 +538,55 @@ class SimulatorQuestaSim(SimulatorBase):
 
         webbrowser.open((self.workdir / "html_cov" / "index.html").as_posix())
 
-    def merge_coverages(self, path_dest: Path, path_sources: List[Path]):
-        path_dest_rel = os.path.relpath(
-            (path_dest / "coverage.ucdb").as_posix(), self.workdir
-        )
+    def merge_coverage_files(self, path_dest: Path, path_sources: List[Path]):
+        path_dest_rel = os.path.relpath(path_dest.as_posix(), self.workdir)
         args = ["vcover", "merge", path_dest_rel]
 
         for source in path_sources:
-            path_ucdb = (source / "coverage.ucdb").as_posix()
-            path_rel = os.path.relpath(path_ucdb, self.workdir)
-
+            path_rel = os.path.relpath(source.as_posix(), self.workdir)
             args.append(path_rel)
 
-        path_vcoverlog = self.workdir / "vcover_merge.log"
+        # Merges can run in parallel, so each one gets its own log
+        path_vcoverlog = path_dest.with_suffix(".log")
 
         rc = utils.run_program(args, self.workdir, path_vcoverlog)
         if rc != 0:
             raise SimulatorError(
                 "Vcover exited with nonzero return code", path_vcoverlog
             )
+
+    def report_coverage(self, path_database: Path, path_report: Path):
+        # fmt: off
+        args = [
+            "vcover", "report", "-byinstance",
+            "-output", os.path.relpath(path_report, self.workdir),
+            os.path.relpath(path_database, self.workdir),
+        ]
+        # fmt: on
+
+        path_vcoverlog = path_report.with_suffix(".log")
+        rc = utils.run_program(args, self.workdir, path_vcoverlog)
+        if rc != 0:
+            raise SimulatorError(
+                "Vcover exited with nonzero return code", path_vcoverlog
+            )
+
+    def rank_coverage(self, path_sources: List[Path], path_outdir: Path) -> List[Path]:
+        path_rankfile = os.path.relpath(path_outdir / "coverage.rank", self.workdir)
+        args = ["vcover", "ranktest", "-rankfile", path_rankfile]
+
+        databases = []
+        for source in path_sources:
+            path_rel = Path(os.path.relpath(source.as_posix(), self.workdir))
+            args.append(path_rel.as_posix())
+            databases.append(path_rel)
+
+        path_vcoverlog = path_outdir / "vcover_ranktest.log"
+        rc = utils.run_program(args, self.workdir, path_vcoverlog)
+        if rc != 0:
+            raise SimulatorError(
+                "Vcover exited with nonzero return code", path_vcoverlog
+            )
+
+        ranked = parse_ranktest_output(path_vcoverlog, databases)
+        return [path_sources[databases.index(database)] for database in ranked]
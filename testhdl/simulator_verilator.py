@@ -0,0 +1,217 @@
+from pathlib import Path
+from typing import List
+from testhdl import utils
+from testhdl.cpu_affinity import get_available_cpus
+from testhdl.errors import SimulatorError, UnimplementedError, ValidationError
+from testhdl.models import HardwareLanguage
+from testhdl.run_config import RunConfig
+from testhdl.simulator_base import SimulatorBase
+from testhdl.source_library import SourceLibrary
+
+import time
+import shutil
+import logging
+import threading
+
+log = logging.getLogger("verilator")
+
+VERILATOR = "verilator"
+
+
+class SimulatorVerilator(SimulatorBase):
+    """Builds the design into a native executable with `verilator --binary`,
+    then runs every test as an invocation of that executable.
+
+    Models are cached in `path_cachedir`, keyed on a fingerprint of all the
+    sources and arguments, so they only get rebuilt when something changes.
+
+    When waves are enabled with `set_log_all_waves`, the model is built with
+    FST tracing and the simulation runs inside the test's output folder, so
+    a `$dumpfile("wave.fst")` in the testbench will end up there.
+    """
+
+    verdict_patterns = ["Fatal:"]
+
+    build_lock: threading.Lock
+
+    def __init__(self, workdir: Path, logsdir: Path):
+        super().__init__(workdir, logsdir)
+        self.build_lock = threading.Lock()
+
+    def validate(self):
+        if shutil.which(VERILATOR) is None:
+            raise ValidationError("Program `verilator` was not found")
+
+    def compile(self, library: SourceLibrary, config: RunConfig):
+        # Verilator has no concept of libraries: everything gets built
+        # together into a model, once the top entity is known.
+        for source_list in library.source_lists:
+            if source_list.language == HardwareLanguage.VHDL:
+                raise UnimplementedError("SimulatorVerilator compile VHDL")
+
+            if source_list.coverage_enabled:
+                raise UnimplementedError(
+                    "SimulatorVerilator compile coverage_enabled"
+                )
+
+        log.info("Library %s will be built with the model", library.name)
+
+    def _get_build_args(self, top_entity: str, config: RunConfig) -> List[str]:
+        # fmt: off
+        args = [
+            VERILATOR, "--binary",
+            "-j", str(len(get_available_cpus())),
+            "--threads", str(config.simulator_threads),
+            "--timescale", f"{config.resolution}/{config.resolution}",
+            "--top-module", top_entity,
+            "-Wno-fatal",
+        ]
+        # fmt: on
+
+        if config.log_all_waves:
+            args.append("--trace-fst")
+
+        args += config.compile_args
+
+        for library in config.libraries:
+            for source_list in library.source_lists:
+                args += source_list.compile_args
+
+                for define in source_list.defines:
+                    args.append(f"-D{define}")
+
+                if source_list.incdir is not None:
+                    args.append(f"-I{source_list.incdir.absolute().as_posix()}")
+
+                for path in source_list.paths:
+                    args.append(path.absolute().as_posix())
+
+        return args
+
+    def _build_model(self, top_entity: str, config: RunConfig) -> Path:
+        args = self._get_build_args(top_entity, config)
+
+        sources = []
+        for library in config.libraries:
+            for source_list in library.source_lists:
+                sources += source_list.paths
+                if source_list.incdir is not None:
+                    sources.append(source_list.incdir)
+
+        model_id = f"{top_entity}_{utils.fingerprint(sources, args)}"
+        path_cache = config.path_cachedir / "verilator"
+        path_model = path_cache / model_id
+        path_binary = path_model / f"V{top_entity}"
+
+        with self.build_lock:
+            if path_binary.exists():
+                log.debug("Reusing cached model %s", model_id)
+                return path_binary
+
+            log.info("Building model for %s", top_entity)
+            time_start = time.perf_counter()
+
+            path_model.mkdir(parents=True, exist_ok=True)
+            args += ["--Mdir", path_model.absolute().as_posix()]
+
+            path_logs = self.logsdir / f"build_{top_entity}.log"
+            with config.tracer.span("elaborate", "elaborate", top=top_entity):
+                rc = utils.run_program(
+                    args, cwd=self.workdir, stdout_out=path_logs, echo=config.verbose
+                )
+
+            if rc != 0 or not path_binary.exists():
+                raise SimulatorError("Verilator build failed", path_logs)
+
+            # Models built from older sources are never going to be used again
+            for path_old in utils.find_cache_entries(path_cache, top_entity):
+                if path_old != path_model:
+                    utils.rmdir_if_exists(path_old)
+
+            elapsed = time.perf_counter() - time_start
+            log.info("Done! Took %.2f seconds", elapsed)
+
+        return path_binary
+
+    def show_waves(self, path_logs: Path, config: RunConfig):
+        path_wavefile = path_logs / "wave.fst"
+        if not path_wavefile.exists():
+            raise SimulatorError(
+                "Wavefile not found. Make sure you run the simulation first with all waves logged",
+                None,
+            )
+
+        path_config = path_logs / "wave.gtkw"
+
+        if config.wave_config_file_generator is not None:
+            config.wave_config_file_generator(path_wavefile, path_config)
+        elif config.wave_config_file is not None:
+            shutil.copy(config.wave_config_file, path_config)
+
+        args = [
+            "gtkwave",
+            path_wavefile.absolute().as_posix(),
+            path_config.absolute().as_posix(),
+        ]
+        rc = utils.run_program(args, cwd=self.workdir, echo=config.verbose)
+
+        if rc != 0:
+            raise SimulatorError("Could not show waves", None)
+
+    def run_simulation(
+        self,
+        top_entity: str,
+        path_outdir: Path,
+        path_simlogs: Path,
+        extra_args: List[str],
+        config: RunConfig,
+    ):
+        if config.coverage_enabled:
+            raise UnimplementedError(
+                "SimulatorVerilator run_simulation coverage_enabled"
+            )
+
+        path_binary = self._build_model(top_entity, config)
+
+        # fmt: off
+        args = [
+            path_binary.absolute().as_posix(),
+            f"+verilator+seed+{config.seed}",
+            *extra_args,
+            *config.runtime_args,
+        ]
+        # fmt: on
+
+        sim_echo = config.verbose or config.verbose_simulation
+        rc = utils.run_program(
+            args,
+            self.get_run_dir(path_outdir),
+            path_simlogs,
+            echo=sim_echo,
+            log_capture=config.log_capture,
+        )
+
+        if rc != 0:
+            raise SimulatorError(
+                "Simulator exited with nonzero return code", path_simlogs
+            )
+
+    def get_run_dir(self, path_outdir: Path) -> Path:
+        return path_outdir
+
+    def did_error_happen(self, path_logs: Path) -> bool:
+        with utils.open_log(path_logs) as logfile:
+            for line in logfile:
+                if any(pattern in line for pattern in self.verdict_patterns):
+                    return True
+
+        return False
+
+    def show_coverage(self, path_logsdir: Path):
+        _ = path_logsdir
+        raise UnimplementedError("SimulatorVerilator show_coverage")
+
+    def merge_coverages(self, path_dest: Path, path_sources: List[Path]):
+        _ = path_dest
+        _ = path_sources
+        raise UnimplementedError("SimulatorVerilator merge_coverages")
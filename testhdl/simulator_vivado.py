@@ -1,8 +1,9 @@
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Set
 from testhdl import utils
 from testhdl.errors import SimulatorError, UnimplementedError, ValidationError
 from testhdl.models import HardwareLanguage
+from testhdl.profiling import Profile, parse_xsim_stats
 from testhdl.run_config import RunConfig
 from testhdl.simulator_base import SimulatorBase
 from testhdl.source_library import SourceLibrary
@@ -11,6 +12,7 @@ import os
 import time
 import shutil
 import logging
+import threading
 
 log = logging.getLogger("vivado")
 
@@ -20,6 +22,18 @@ XSIM = "xsim"
 
 
 class SimulatorVivado(SimulatorBase):
+    verdict_patterns = ["Fatal:"]
+    supports_profiling = True
+    supports_stop_time = True
+
+    elaborate_lock: threading.Lock
+    elaborated_designs: Set[str]
+
+    def __init__(self, workdir: Path, logsdir: Path):
+        super().__init__(workdir, logsdir)
+        self.elaborate_lock = threading.Lock()
+        self.elaborated_designs = set()
+
     def validate(self):
         if shutil.which("xsim") is None:
             raise ValidationError("Program `xsim` was not found")
@@ -67,9 +81,15 @@ class SimulatorVivado(SimulatorBase):
                 args.append(new_path)
 
             path_logs = self.logsdir / f"compile_{library.name}.log"
-            rc = utils.run_program(
-                args, cwd=self.workdir, stdout_out=path_logs, echo=config.verbose
-            )
+            with config.tracer.span(
+                f"compile {library.name}",
+                "compile",
+                language=source_list.language.value,
+                files=len(source_list.paths),
+            ):
+                rc = utils.run_program(
+                    args, cwd=self.workdir, stdout_out=path_logs, echo=config.verbose
+                )
 
             if rc != 0:
                 raise SimulatorError("Compilation Failed", path_logs)
@@ -79,6 +99,10 @@ class SimulatorVivado(SimulatorBase):
 
     def show_waves(self, path_logs: Path, config: RunConfig):
         path_wavefile = path_logs / "wave.vcd"
+        if utils.find_log(path_wavefile) == utils.get_compressed_path(path_wavefile):
+            # Compressed by the retention policy
+            utils.decompress_file(path_wavefile)
+
         if not path_wavefile.exists():
             raise SimulatorError(
                 "Wavefile not found. Make sure you run the simulation first", None
@@ -109,33 +133,12 @@ class SimulatorVivado(SimulatorBase):
         extra_args: List[str],
         config: RunConfig,
     ):
-        # Vivado needs to elaborate before simulating
-        path_elaboratelog = path_outdir / f"elaborate_{top_entity}.log"
-        # fmt: off
-        xelab_args = [
-            XELAB,
-            "-debug", "typical",
-            "-timescale", f"{config.resolution}/{config.resolution}",
-            "-override_timeunit", "-override_timeprecision",
-            top_entity,
-        ]
-        # fmt: on
-
-        rc = utils.run_program(
-            xelab_args,
-            self.workdir,
-            path_elaboratelog,
-            echo=config.verbose,
-        )
-        if rc != 0:
-            raise SimulatorError(
-                "Elaboration failed, Vivado exited with nonzero return code",
-                path_elaboratelog,
-            )
+        self._elaborate(top_entity, config)
 
         path_wavefile = os.path.relpath(path_outdir / "wave.vcd", self.workdir)
 
-        path_simscript = self.workdir / "sim.tcl"
+        # The script goes in the output folder, so that tests can run in parallel
+        path_simscript = path_outdir / "sim.tcl"
         with open(path_simscript, "w") as simscript:
             simscript.write(f"open_vcd {path_wavefile}\n")
             simscript.write(f"log_vcd *\n")
@@ -144,7 +147,10 @@ class SimulatorVivado(SimulatorBase):
             for argument in config.runtime_run_args:
                 simscript.write(f"{argument}\n")
 
-            simscript.write(f"run -all\n")
+            if config.stop_time is not None:
+                simscript.write(f"run {config.stop_time}\n")
+            else:
+                simscript.write(f"run -all\n")
             simscript.write(f"close_vcd\n")
             simscript.write(f"exit\n")
 
@@ -154,28 +160,79 @@ class SimulatorVivado(SimulatorBase):
         # fmt: off
         args = [
             "xsim", f"{top_entity}",
-            "-t", "sim.tcl",
+            "-t", os.path.relpath(path_simscript, self.workdir),
             *extra_args,
             *config.runtime_args,
         ]
         # fmt: on
 
-        sim_echo = config.verbose_simulation or config.verbose_simulation
-        rc = utils.run_program(args, self.workdir, path_simlogs, echo=sim_echo)
+        if config.profile:
+            args.append("-stats")
+
+        sim_echo = config.verbose or config.verbose_simulation
+        rc = utils.run_program(
+            args,
+            self.workdir,
+            path_simlogs,
+            echo=sim_echo,
+            log_capture=config.log_capture,
+        )
 
         if rc != 0:
             raise SimulatorError(
                 "Simulator exited with nonzero return code", path_simlogs
             )
 
+    def _elaborate(self, top_entity: str, config: RunConfig):
+        """Elaborates the top entity once per run. Every test of the same
+        top loads the snapshot in `xsim.dir`, which must not be written
+        while other tests are loading it."""
+
+        with self.elaborate_lock:
+            if top_entity in self.elaborated_designs:
+                return
+
+            path_elaboratelog = self.logsdir / f"elaborate_{top_entity}.log"
+            # fmt: off
+            xelab_args = [
+                XELAB,
+                "-debug", "typical",
+                "-timescale", f"{config.resolution}/{config.resolution}",
+                "-override_timeunit", "-override_timeprecision",
+                top_entity,
+            ]
+            # fmt: on
+
+            with config.tracer.span("elaborate", "elaborate", top=top_entity):
+                rc = utils.run_program(
+                    xelab_args,
+                    self.workdir,
+                    path_elaboratelog,
+                    echo=config.verbose,
+                )
+            if rc != 0:
+                raise SimulatorError(
+                    "Elaboration failed, Vivado exited with nonzero return code",
+                    path_elaboratelog,
+                )
+
+            self.elaborated_designs.add(top_entity)
+
     def did_error_happen(self, path_logs: Path) -> bool:
-        with open(path_logs, "r") as logfile:
+        with utils.open_log(path_logs) as logfile:
             for line in logfile:
-                if "Fatal:" in line:
+                if any(pattern in line for pattern in self.verdict_patterns):
                     return True
 
         return False
 
+    def collect_profile(self, path_outdir: Path, path_simlogs: Path) -> Optional[Profile]:
+        profile = parse_xsim_stats(path_simlogs)
+        if len(profile.statistics) == 0:
+            return None
+
+        return profile
+
     def show_coverage(self, path_logsdir: Path):
         _ = path_logsdir
         raise UnimplementedError("SimulatorVivado show_coverage")
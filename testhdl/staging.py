@@ -0,0 +1,108 @@
+from pathlib import Path
+from typing import Dict, List, Set
+
+from testhdl import utils
+from testhdl.errors import TestRunError
+
+import threading
+
+
+class StagingArea:
+    """Stages the files of the tests running at the same time in the folders
+    their simulations run in, see `utils.stage_file`.
+
+    When that folder is shared by all the tests, e.g. the working directory,
+    a file is staged once for all the tests using it. The files of a test
+    are claimed before it starts, and a test that needs a different file
+    under the same name can only start once no running test uses it
+    anymore. The files given to `add_file` are staged for the whole run.
+    """
+
+    # Source of every claimed file, how many tests use it and whether it
+    # was staged yet
+    staged: Dict[Path, List]
+    # Staged for the whole run
+    permanent: Set[Path]
+
+    def __init__(self, path_workdir: Path, additional_files: List[Path]):
+        self.staged = {}
+        self.permanent = set()
+        for file in additional_files:
+            self.staged[path_workdir / file.name] = [file.absolute(), 1, True]
+            self.permanent.add(path_workdir / file.name)
+
+        self.condition = threading.Condition()
+
+    def _check(self, path_dir: Path, files: List[Path]):
+        names = [file.name for file in files]
+        if len(set(names)) != len(names):
+            raise TestRunError(f"Several files to stage have the same name: {names}")
+
+        for file in files:
+            path_dst = path_dir / file.name
+            if path_dst in self.permanent and not self._is_free(path_dst, file):
+                raise TestRunError(
+                    f"File {file.as_posix()} conflicts with a file staged "
+                    "for the whole run"
+                )
+
+    def _is_free(self, path_dst: Path, file: Path) -> bool:
+        entry = self.staged.get(path_dst)
+        return entry is None or entry[0] == file.absolute()
+
+    def _claim(self, path_dir: Path, files: List[Path]):
+        for file in files:
+            path_dst = path_dir / file.name
+            entry = self.staged.get(path_dst)
+            if entry is not None:
+                entry[1] += 1
+            else:
+                self.staged[path_dst] = [file.absolute(), 1, False]
+
+    def try_acquire(self, path_dir: Path, files: List[Path]) -> bool:
+        """Claims the files in the folder if no other test uses different
+        files under the same names, without waiting.
+
+        :return: whether they were claimed
+        """
+        with self.condition:
+            self._check(path_dir, files)
+            if not all(self._is_free(path_dir / file.name, file) for file in files):
+                return False
+
+            self._claim(path_dir, files)
+            return True
+
+    def acquire(self, path_dir: Path, files: List[Path]):
+        """Waits until the files can be claimed in the folder, and claims
+        them."""
+        with self.condition:
+            self._check(path_dir, files)
+            while not all(self._is_free(path_dir / file.name, file) for file in files):
+                self.condition.wait()
+
+            self._claim(path_dir, files)
+
+    def stage(self, path_dir: Path, files: List[Path]):
+        """Stages claimed files that are not in the folder yet, e.g. once
+        they were generated."""
+        with self.condition:
+            for file in files:
+                entry = self.staged[path_dir / file.name]
+                if not entry[2]:
+                    utils.stage_file(file, path_dir / file.name)
+                    entry[2] = True
+
+    def release(self, path_dir: Path, files: List[Path]):
+        """Removes the files from the folder once no test uses them."""
+        with self.condition:
+            for file in files:
+                path_dst = path_dir / file.name
+                entry = self.staged[path_dst]
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.staged[path_dst]
+                    if entry[2]:
+                        path_dst.unlink(missing_ok=True)
+
+            self.condition.notify_all()
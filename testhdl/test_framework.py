@@ -1,11 +1,23 @@
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
+from testhdl import utils
+from testhdl.log_capture import LogSites, get_sites_path
 from testhdl.models import TestCase
 
+import os
+import re
+
 
 class TestFrameworkBase(ABC):
+    # Text of the log lines get_number_of_errors looks for. The log cap
+    # never drops lines containing any of them
+    verdict_patterns: List[str] = []
+
+    # Start of the summary printed at the end of the log, if any
+    summary_pattern: Optional[str] = None
+
     @abstractmethod
     def get_top_entity(self, test: TestCase) -> str:
         return ""
@@ -19,7 +31,17 @@ class TestFrameworkBase(ABC):
         return 0
 
 
+# Severity error reports, as printed by the supported simulators
+VHDL_ERROR_PATTERNS = [
+    "Error:",
+    "(assertion error)",
+    "(report error)",
+]
+
+
 class TestFrameworkVHDL(TestFrameworkBase):
+    verdict_patterns = VHDL_ERROR_PATTERNS
+
     def get_top_entity(self, test: TestCase) -> str:
         return test.name
 
@@ -29,21 +51,44 @@ class TestFrameworkVHDL(TestFrameworkBase):
     def get_number_of_errors(self, test: TestCase, path_logfile: Path) -> int:
         errors = 0
 
-        with open(path_logfile, "r") as logfile:
+        with utils.open_log(path_logfile) as logfile:
             for line in logfile:
-                if "Error:" in line:
+                if any(pattern in line for pattern in VHDL_ERROR_PATTERNS):
                     errors += 1
 
         return errors
 
 
+UVM_ERROR_PATTERNS = [
+    "UVM_ERROR",
+    "UVM_FATAL",
+    "ERROR-",
+    "FATAL-",
+]
+UVM_SUMMARY_HEADER = "UVM Report Summary"
+
+# Severity counts in the report summary, e.g. "UVM_ERROR :    3"
+re_uvm_summary_count = re.compile(r"(UVM_ERROR|UVM_FATAL)\s*:\s*([0-9]+)\s*$")
+
+# How far from the end of the log the report summary is looked for
+SUMMARY_SEARCH_BYTES = 1024 * 1024
+SUMMARY_BLOCK_BYTES = 64 * 1024
+
+
 class TestFrameworkUVM(TestFrameworkBase):
+    verdict_patterns = [*UVM_ERROR_PATTERNS, UVM_SUMMARY_HEADER]
+    summary_pattern = UVM_SUMMARY_HEADER
+
     top_entity: str
     max_quit_count: int
+    summary_verdict: bool
 
-    def __init__(self, top_entity: str, max_quit_count: int = 0):
+    def __init__(
+        self, top_entity: str, max_quit_count: int = 0, summary_verdict: bool = False
+    ):
         self.top_entity = top_entity
         self.max_quit_count = max_quit_count
+        self.summary_verdict = summary_verdict
 
     def get_top_entity(self, test: TestCase) -> str:
         return self.top_entity
@@ -57,18 +102,80 @@ class TestFrameworkUVM(TestFrameworkBase):
         return args + test.runtime_args
 
     def get_number_of_errors(self, test: TestCase, path_logfile: Path) -> int:
+        if self.summary_verdict:
+            errors = get_summary_errors(path_logfile)
+            if errors is not None:
+                return errors
+
+        return self._count_errors(path_logfile)
+
+    def _count_errors(self, path_logfile: Path) -> int:
         errors = 0
 
-        with open(path_logfile, "r") as logfile:
+        with utils.open_log(path_logfile) as logfile:
             for line in logfile:
-                if "UVM Report Summary" in line:
+                if UVM_SUMMARY_HEADER in line:
                     break
-                if (
-                    "UVM_ERROR" in line
-                    or "UVM_FATAL" in line
-                    or "ERROR-" in line
-                    or "FATAL-" in line
-                ):
+                if any(pattern in line for pattern in UVM_ERROR_PATTERNS):
                     errors += 1
 
         return errors
+
+
+def _find_summary(path_logfile: Path) -> Optional[int]:
+    """Returns the offset of the UVM report summary in a log, looking for it
+    backwards from the end of the file."""
+    path_sites = get_sites_path(path_logfile)
+    if path_sites.exists():
+        # Recorded while the simulation ran
+        return LogSites.load(path_sites).summary
+
+    if not path_logfile.exists():
+        # Compressed logs cannot be read backwards
+        return None
+
+    header = UVM_SUMMARY_HEADER.encode("utf-8")
+    with open(path_logfile, "rb") as logfile:
+        end = logfile.seek(0, os.SEEK_END)
+        position = end
+        # Kept from the previous block, in case the header is split
+        overlap = b""
+
+        while position > 0 and end - position < SUMMARY_SEARCH_BYTES:
+            start = max(0, position - SUMMARY_BLOCK_BYTES)
+            logfile.seek(start)
+            block = logfile.read(position - start) + overlap
+
+            index = block.rfind(header)
+            if index >= 0:
+                return start + index
+
+            overlap = block[: len(header)]
+            position = start
+
+    return None
+
+
+def get_summary_errors(path_logfile: Path) -> Optional[int]:
+    """Returns the number of UVM_ERROR and UVM_FATAL reported by the UVM
+    report summary at the end of a log, or None if there is no summary."""
+    offset = _find_summary(path_logfile)
+    if offset is None:
+        return None
+
+    errors = 0
+    found = set()
+    with utils.open_log(path_logfile, "rb") as logfile:
+        logfile.seek(offset)
+        for line in logfile:
+            match = re_uvm_summary_count.search(line.decode("utf-8", errors="replace"))
+            if match is None:
+                continue
+
+            found.add(match.group(1))
+            errors += int(match.group(2))
+            if len(found) == 2:
+                return errors
+
+    # Truncated summary
+    return None
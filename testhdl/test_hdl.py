@@ -1,17 +1,26 @@
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from collections.abc import Callable
 from pathlib import Path
 
 import random
 import logging
+import dataclasses
 import argparse
 
 from testhdl.hooks import TestHook
-from testhdl import utils
 from testhdl.linter_verilator import LinterVerilator
 from testhdl.linter_frontend import Linter
 from testhdl.logging import setup_logging
-from testhdl.models import RunAction, TestCase
+from testhdl.log_capture import LogCapture
+from testhdl.log_excerpt import print_failure_excerpt
+from testhdl.models import (
+    CpuAffinity,
+    RetentionPolicy,
+    RunAction,
+    ScratchPolicy,
+    TestCase,
+    Warmup,
+)
 from testhdl.errors import (
     SimulatorError,
     TestRunError,
@@ -20,9 +29,17 @@ from testhdl.errors import (
 )
 from testhdl.simulator_questasim import SimulatorQuestaSim
 from testhdl.simulator_vivado import SimulatorVivado
+from testhdl.simulator_verilator import SimulatorVerilator
+from testhdl.simulator_ghdl import SimulatorGHDL
+from testhdl.simulator_icarus import SimulatorIcarus
+from testhdl.simulator_fake import SimulatorFake
 from testhdl.source_library import SourceLibrary
+from testhdl.selection import load_selection
 from testhdl.runner import Runner
+from testhdl.resource_pools import MEMORY_POOL, RESOURCE_STEPS
 from testhdl.run_config import RunConfig
+from testhdl.scratch import ScratchArea
+from testhdl.tracing import Tracer
 from testhdl.test_framework import (
     TestFrameworkBase,
     TestFrameworkVHDL,
@@ -35,6 +52,10 @@ SUPPORTED_SIMULATORS = {
     "questasim": SimulatorQuestaSim,
     "modelsim": SimulatorQuestaSim,
     "vivado": SimulatorVivado,
+    "verilator": SimulatorVerilator,
+    "ghdl": SimulatorGHDL,
+    "icarus": SimulatorIcarus,
+    "fake": SimulatorFake,
 }
 
 SUPPORTED_LINTERS = {
@@ -45,12 +66,14 @@ SUPPORTED_LINTERS = {
 class TestHDL:
     workdir: Path
     logsdir: Path
+    cachedir: Path
     default_seed: Optional[int]
 
     test_framework: TestFrameworkBase
     simulator: str
     libraries: List[SourceLibrary]
     tests: List[TestCase]
+    warmups: List[Warmup]
 
     compile_args: List[str]
     runtime_args: List[str]
@@ -61,6 +84,8 @@ class TestHDL:
     linters: List[Linter]
 
     coverage_enabled: bool
+    coverage_export: bool
+    message_index: bool
 
     wave_config_file: Path | None
     wave_config_file_generator: Callable[[Path, Path], None] | None
@@ -68,21 +93,49 @@ class TestHDL:
     flags: List[str]
 
     resolution: str
+    stop_time: Optional[str]
+
+    simulator_threads: int
+    use_sessions: bool
+
+    scratch: Optional[ScratchPolicy]
+    retention: Optional[RetentionPolicy]
+    log_cap: Optional[Tuple[int, int]]
+    cpu_affinity: Optional[CpuAffinity]
+    resource_pools: Dict[str, float]
+    step_resources: Dict[str, Dict[str, float]]
+    excerpt_sites: int
+    excerpt_context: int
 
     def __init__(self, args, logdir):
         self.args = args
         self.workdir = Path("build")
         self.logsdir = logdir
+        self.cachedir = Path(".testhdl_cache")
         self.libraries = []
         self.tests = []
+        self.warmups = []
         self.test_framework = TestFrameworkVHDL()
         self.resolution = "100ps"
+        self.stop_time = None
         self.simulator = ""
         self.default_seed = None
         self.coverage_enabled = False
+        self.coverage_export = False
+        self.message_index = False
         self.log_all_waves = False
         self.verbose_simulation = True
         self.additional_files = []
+        self.simulator_threads = 1
+        self.use_sessions = False
+        self.scratch = None
+        self.retention = None
+        self.log_cap = None
+        self.cpu_affinity = None
+        self.resource_pools = {}
+        self.step_resources = {}
+        self.excerpt_sites = 5
+        self.excerpt_context = 3
 
         self.wave_config_file = None
         self.wave_config_file_generator = None
@@ -99,6 +152,14 @@ class TestHDL:
         if logging_enabled:
             setup_logging(logdir)
 
+        args = TestHDL.get_argument_parser().parse_args()
+
+        return TestHDL(args, logdir)
+
+    @staticmethod
+    def get_argument_parser() -> argparse.ArgumentParser:
+        """Returns the parser for the command line arguments understood by
+        TestHDL. Useful to build a TestHDL from a custom list of arguments."""
         parser = argparse.ArgumentParser()
 
         parser.add_argument(
@@ -116,7 +177,10 @@ class TestHDL:
         )
 
         parser.add_argument(
-            "--clean", help="clean all temporary files", action="store_true"
+            "--clean",
+            help="clean all temporary files, except the history kept across runs: coverage, "
+            "selections, test statistics, message index and archived runs",
+            action="store_true",
         )
 
         parser.add_argument(
@@ -125,10 +189,39 @@ class TestHDL:
             action="store_true",
         )
 
+        parser.add_argument(
+            "--coverage-diff",
+            help="compare the merged coverage of two runs in the coverage database. "
+            "Negative numbers count from the latest run (-1 is the latest)",
+            nargs=2,
+            type=int,
+            metavar=("RUN_A", "RUN_B"),
+        )
+
         parser.add_argument(
             "-a", "--all", help="run all available tests", action="store_true"
         )
 
+        parser.add_argument(
+            "--selection",
+            help="with --all, run only the tests in a selection saved by --rank-coverage",
+            metavar="NAME",
+        )
+
+        parser.add_argument(
+            "--rank-coverage",
+            help="compute the minimal set of tests that reaches the same coverage, "
+            "and save it as a selection. Requires to have run the tests with coverage enabled",
+            metavar="NAME",
+        )
+
+        parser.add_argument(
+            "--reverdict",
+            help="re-evaluate the verdict of every test from its existing log, "
+            "without simulating again",
+            action="store_true",
+        )
+
         parser.add_argument(
             "-c",
             "--compile-only",
@@ -159,6 +252,28 @@ class TestHDL:
             "-f", "--flag", help="add build flags", action="append", default=[]
         )
 
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            help="number of tests to run in parallel",
+            default=1,
+        )
+
+        parser.add_argument(
+            "--profile",
+            help="run the simulations with the simulator's profiler, and save "
+            "where the time goes in profile.json next to the logs of every test",
+            action="store_true",
+        )
+
+        parser.add_argument(
+            "--trace",
+            help="record the phases of the run in logs/trace.json, "
+            "to open with Perfetto or chrome://tracing",
+            action="store_true",
+        )
+
         parser.add_argument("--seed", type=int, help="set a fixed seed for simulation")
 
         parser.add_argument(
@@ -168,9 +283,7 @@ class TestHDL:
             default=False,
         )
 
-        args = parser.parse_args()
-
-        return TestHDL(args, logdir)
+        return parser
 
     def is_flag_enabled(self, flag: str) -> bool:
         """Check if a compile time flag is enabled or not.
@@ -218,6 +331,15 @@ class TestHDL:
         """
         self.resolution = resolution
 
+    def set_stop_time(self, stop_time: str):
+        """Stop every simulation at the given time instead of running until
+        the testbench finishes. Only supported by QuestaSim, Vivado and GHDL,
+        the other simulators warn and ignore it.
+
+        :param stop_time: the time at which to stop, e.g. "10us"
+        """
+        self.stop_time = stop_time
+
     def set_default_seed(self, seed: int):
         """Set the default seed that will be used by the simulation if arguments
         relating to seeds are not given. If not given, the seed will default
@@ -231,6 +353,20 @@ class TestHDL:
         """Enables coverage collection"""
         self.coverage_enabled = True
 
+    def enable_coverage_export(self):
+        """Export a summary of the coverage of every test, and of the merged
+        coverage, into the coverage database (`coverage.db` in the logs
+        folder) after every run. Runs can then be compared with --coverage-diff.
+        Requires coverage to be enabled."""
+        self.coverage_export = True
+
+    def enable_message_index(self):
+        """Index the UVM messages and VHDL reports of every test as it
+        finishes into `messages.db` in the logs folder. The index can then be
+        queried with `python -m testhdl search`, e.g. to find which tests hit
+        a message ID."""
+        self.message_index = True
+
     def set_workdir(self, workdir: str | Path):
         """Set the directory where the simulator will get called. Defaults to 'build'
 
@@ -238,6 +374,169 @@ class TestHDL:
         """
         self.workdir = Path(workdir)
 
+    def set_cachedir(self, cachedir: str | Path):
+        """Set the directory where build artifacts that can be reused across
+        runs (e.g. simulation models) are stored. Defaults to '.testhdl_cache'
+
+        :param cachedir: path to the directory
+        """
+        self.cachedir = Path(cachedir)
+
+    def set_scratchdir(
+        self, scratchdir: str | Path = "/dev/shm", keep_passing_waves: bool = False
+    ):
+        """Build and simulate in a folder on a fast local disk or a RAM disk
+        instead of the work directory, e.g. when it is on NFS. Every test
+        runs in a scratch folder of its own, whose artefacts are moved to the
+        logs folder when it finishes. The cache is mirrored in the scratch
+        area and synced back to the cache folder at the end of the run.
+
+        :param scratchdir: path to the directory, e.g. a tmpfs or a local SSD
+        :param keep_passing_waves: also keep the waves of passing tests. By
+                                   default only the waves of failing tests are
+                                   moved to the logs folder
+        """
+        path_scratchdir = Path(scratchdir)
+        if not path_scratchdir.is_dir():
+            raise ValidationError(
+                f"Scratch folder {path_scratchdir.as_posix()} not found"
+            )
+
+        self.scratch = ScratchPolicy(
+            path=path_scratchdir, keep_passing_waves=keep_passing_waves
+        )
+
+    def set_simulator_threads(self, threads: int):
+        """Set the number of threads a single simulation can use, for
+        simulators that support multithreading (e.g. verilator). Defaults to 1
+
+        :param threads: the number of threads
+        """
+        if threads < 1:
+            raise ValidationError("Simulator threads must be at least 1")
+        self.simulator_threads = threads
+
+    def set_cpu_affinity(self, reserved_cores: int = 1, background_nice: int = 10):
+        """Pin every simulation to its own set of cores, as many as its
+        simulator threads (see set_simulator_threads). When the tests running
+        in parallel would need more cores than there are, the sets of every
+        simulation are reduced to fit. Their threads are not, so that the
+        models built don't depend on -j.
+
+        :param reserved_cores: cores left out of the sets, for testhdl itself
+        :param background_nice: how much to lower the priority of background
+                                work, e.g. coverage merges and log compression
+        """
+        if reserved_cores < 0:
+            raise ValidationError("Reserved cores cannot be negative")
+
+        self.cpu_affinity = CpuAffinity(
+            reserved_cores=reserved_cores, background_nice=background_nice
+        )
+
+    def enable_simulator_sessions(self):
+        """Keep one simulator process alive per worker, and run successive
+        tests in it instead of starting the simulator for every test. Only
+        supported by QuestaSim. A session that crashes is restarted
+        automatically for the next test."""
+        self.use_sessions = True
+
+    def set_retention(
+        self,
+        keep_runs: int = 0,
+        disk_budget_gb: Optional[float] = None,
+        compress_passing: bool = True,
+    ):
+        """Limit how much disk the logs folder takes over many runs.
+
+        :param keep_runs: how many previous runs of every test to keep in
+                          `history` in the logs folder. Older runs are deleted,
+                          except for failures
+        :param disk_budget_gb: maximum size of the logs folder. When it is
+                               exceeded, the oldest runs in the history are
+                               evicted first
+        :param compress_passing: compress the logs and VCDs of passing tests in
+                                 the background
+        """
+        if keep_runs < 0:
+            raise ValidationError("The number of runs to keep cannot be negative")
+
+        disk_budget_bytes = None
+        if disk_budget_gb is not None:
+            disk_budget_bytes = int(disk_budget_gb * 1024**3)
+
+        self.retention = RetentionPolicy(
+            compress_passing=compress_passing,
+            keep_runs=keep_runs,
+            disk_budget_bytes=disk_budget_bytes,
+        )
+
+    def set_log_cap(self, head_mb: float, tail_mb: float):
+        """Limit the size of simulation logs. Only the first `head_mb` and the
+        last `tail_mb` megabytes of the output are written, plus every line
+        that the simulator or the test framework need for the verdict, so
+        that tests pass or fail as they would with the full log.
+
+        :param head_mb: megabytes kept from the start of the output
+        :param tail_mb: megabytes kept from the end of the output
+        """
+        if head_mb < 0 or tail_mb < 0:
+            raise ValidationError("Log cap sizes cannot be negative")
+
+        self.log_cap = (int(head_mb * 1024 * 1024), int(tail_mb * 1024 * 1024))
+
+    def add_resource_pool(self, name: str, capacity: float):
+        """Declare a pool of a limited resource shared by the work that runs
+        at the same time, e.g. licence seats or gigabytes of memory. Tests
+        are only started when what they use fits in every pool, and compile
+        steps and coverage merges wait for what they use to be available.
+        See add_test and set_step_resources.
+
+        :param name: the name of the pool, e.g. "questa_sim"
+        :param capacity: how much of the resource there is
+        """
+        if capacity <= 0:
+            raise ValidationError(f"The capacity of pool {name} must be positive")
+
+        self.resource_pools[name] = capacity
+
+    def set_step_resources(self, step: str, resources: Dict[str, float]):
+        """Declare what a step of the run uses from the resource pools.
+
+        :param step: "test" (the default of every test, added to by the
+                     resources given to add_test), "compile" (every library)
+                     or "coverage_merge"
+        :param resources: how much it uses of every pool, e.g.
+                          {"questa_sim": 1}
+        """
+        if step not in RESOURCE_STEPS:
+            raise ValidationError(
+                f"Unknown step {step}, must be one of {', '.join(RESOURCE_STEPS)}"
+            )
+
+        self.step_resources[step] = dict(resources)
+
+    def set_memory_budget(self, budget_gb: float):
+        """Limit the memory used by the tests running in parallel, as a
+        resource pool named "mem_gb". Tests that don't declare how much
+        memory they use are expected to use the peak memory of their
+        previous run. Tests that never ran are assumed to need no memory.
+
+        :param budget_gb: memory available to the simulations, in gigabytes
+        """
+        self.add_resource_pool(MEMORY_POOL, budget_gb)
+
+    def set_failure_excerpt(self, sites: int = 5, context_lines: int = 3):
+        """Configure what is printed of the log of a failed test when not
+        running with --verbose. Defaults to the first 5 errors, with 3 lines
+        of context each, followed by the report summary.
+
+        :param sites: how many errors to print
+        :param context_lines: lines printed before and after every error
+        """
+        self.excerpt_sites = sites
+        self.excerpt_context = context_lines
+
     def add_library(self, name: str) -> SourceLibrary:
         """Add a new design library
 
@@ -255,14 +554,22 @@ class TestHDL:
 
         self.test_framework = framework
 
-    def set_framework_uvm(self, top_entity: str, max_quit_count: int = 0):
+    def set_framework_uvm(
+        self, top_entity: str, max_quit_count: int = 0, summary_verdict: bool = False
+    ):
         """Set UVM as the test framework
 
         :param top_entity: the top entity to use for UVM simulations
         :param max_quit_count: the maximum amount of errors before quitting earl
+        :param summary_verdict: count the errors from the UVM report summary,
+                                read from the end of the log, instead of
+                                scanning the whole log. Logs without a summary
+                                are still scanned
         """
         self.test_framework = TestFrameworkUVM(
-            top_entity, max_quit_count=max_quit_count
+            top_entity,
+            max_quit_count=max_quit_count,
+            summary_verdict=summary_verdict,
         )
 
     def set_simulator(self, simulator_name: str):
@@ -302,16 +609,21 @@ class TestHDL:
         self.runtime_run_args += arguments
 
     def add_file(self, file: str):
-        """Copies a file in the working directory. Useful for managing testvectors.
+        """Makes a file available in the working directory. Useful for managing testvectors.
+        The file is hardlinked or symlinked where possible instead of copied, so it must
+        not be modified by the simulation, and it is only staged again when it changes.
 
-        :param file: the path for the file to copy
+        :param file: the path for the file to stage
         """
 
+        self.additional_files.append(self._find_file(file))
+
+    def _find_file(self, file: str | Path) -> Path:
         path_file = Path(file)
         if not path_file.exists():
             raise ValidationError(f"File {path_file.as_posix()} not found")
 
-        self.additional_files.append(path_file)
+        return path_file
 
     def add_linter(self, linter_name: str) -> Linter:
         """Add a linter
@@ -330,6 +642,33 @@ class TestHDL:
 
         return linter
 
+    def add_warmup(
+        self,
+        name: str,
+        duration: str,
+        *,
+        runtime_args: Optional[List[str]] = None,
+        seed: int = 0,
+    ) -> Warmup:
+        """Declare a warmup phase (e.g. reset and boot sequence) shared by a
+        group of tests. The warmup is simulated once, and every test using it
+        starts from a checkpoint saved at its end, with its own seed and
+        arguments. The checkpoint is reused across runs until the design
+        changes. Simulators without checkpoint support just run every test
+        from the start.
+
+        :param name: the name of the warmup
+        :param duration: the simulation time the warmup lasts, e.g. "50us"
+        :param runtime_args: optional list of arguments to add to the simulator for the warmup
+        :param seed: the seed used to simulate the warmup
+        """
+        if runtime_args is None:
+            runtime_args = []
+
+        warmup = Warmup(name, duration, runtime_args, seed)
+        self.warmups.append(warmup)
+        return warmup
+
     def add_test(
         self,
         test_name: str,
@@ -337,11 +676,26 @@ class TestHDL:
         runtime_args: Optional[List[str]] = None,
         pre_hooks: Optional[List[TestHook]] = None,
         post_hooks: Optional[List[TestHook]] = None,
+        warmup: Optional[str | Warmup] = None,
+        resources: Optional[Dict[str, float]] = None,
+        files: Optional[List[str | Path]] = None,
     ):
         """Add a test to the tests list.
 
         :param test_name: the name of the test to add
         :param runtime_args: optional list of arguments to add to the simulator for this test
+        :param pre_hooks: optional hooks run before the test, see GeneratorHook for
+                          generated files that are cached and made in parallel
+        :param warmup: optional warmup phase, declared with add_warmup, the test starts from
+        :param resources: optional amount used of every resource pool while the test
+                          runs, e.g. {"mem_gb": 30}, see add_resource_pool
+        :param files: optional files only this test uses, e.g. testvectors, staged like
+                      add_file in the folder the simulation runs in when the test starts,
+                      and removed when it ends, so the testbench opens them by name. The
+                      folder is the working directory, except with Verilator and Icarus
+                      which run in the output folder of the test. Tests that run at the
+                      same time and stage different files of the same name in the
+                      working directory wait for each other
         """
         if runtime_args is None:
             runtime_args = []
@@ -352,7 +706,27 @@ class TestHDL:
         if post_hooks is None:
             post_hooks = []
 
-        self.tests.append(TestCase(test_name, runtime_args, pre_hooks, post_hooks))
+        if isinstance(warmup, str):
+            warmup = self._find_warmup(warmup)
+
+        self.tests.append(
+            TestCase(
+                test_name,
+                runtime_args,
+                pre_hooks,
+                post_hooks,
+                warmup,
+                resources=dict(resources) if resources is not None else {},
+                files=[self._find_file(file) for file in files or []],
+            )
+        )
+
+    def _find_warmup(self, name: str) -> Warmup:
+        for warmup in self.warmups:
+            if warmup.name == name:
+                return warmup
+
+        raise ValidationError(f"Cannot find warmup {name}")
 
     def _validate(self):
         if len(self.tests) <= 0:
@@ -369,6 +743,20 @@ class TestHDL:
             if test.name == test_name:
                 return test
 
+    def _get_selected_tests(self, selection_name: str) -> List[TestCase]:
+        selection = load_selection(self.logsdir, selection_name)
+
+        tests = []
+        for entry in selection.entries:
+            test = self._find_test(entry.name)
+            if test is None:
+                raise ValidationError(
+                    f"Cannot find test {entry.name} from selection {selection_name}"
+                )
+            tests.append(dataclasses.replace(test, seed=entry.seed))
+
+        return tests
+
     def _run_impl(self, action):
         test_to_run = None
         self._validate()
@@ -379,6 +767,10 @@ class TestHDL:
             if test_to_run is None:
                 raise ValidationError(f"Cannot find test {self.args.test_name}")
 
+        tests = self.tests
+        if self.args.selection is not None:
+            tests = self._get_selected_tests(self.args.selection)
+
         if self.args.seed is None:
             if self.default_seed is not None and not self.args.seed_random:
                 seed = self.default_seed
@@ -387,18 +779,35 @@ class TestHDL:
         else:
             seed = self.args.seed
 
-        simulator = SUPPORTED_SIMULATORS[self.simulator](self.workdir, self.logsdir)
+        workdir = self.workdir
+        cachedir = self.cachedir
+        scratch = None
+        if self.scratch is not None:
+            scratch = ScratchArea(self.scratch, self.workdir, self.cachedir)
+            workdir = scratch.path_workdir
+            cachedir = scratch.path_cachedir
+
+        simulator = SUPPORTED_SIMULATORS[self.simulator](workdir, self.logsdir)
 
         simulator.validate()
 
+        log_capture = LogCapture(
+            patterns=simulator.verdict_patterns + self.test_framework.verdict_patterns,
+            summary_pattern=self.test_framework.summary_pattern,
+        )
+        if self.log_cap is not None:
+            log_capture.head_bytes, log_capture.tail_bytes = self.log_cap
+
         config = RunConfig(
-            path_workdir=self.workdir,
+            path_workdir=workdir,
             path_logsdir=self.logsdir,
+            path_cachedir=cachedir,
             test_to_run=test_to_run,
-            tests=self.tests,
+            tests=tests,
             seed=seed,
             linters=self.linters,
             resolution=self.resolution,
+            stop_time=self.stop_time,
             compile_args=self.compile_args,
             runtime_args=self.runtime_args,
             runtime_run_args=self.runtime_run_args,
@@ -411,7 +820,22 @@ class TestHDL:
             wave_config_file_generator=self.wave_config_file_generator,
             verbose=self.args.verbose,
             coverage_enabled=self.coverage_enabled,
+            coverage_export=self.coverage_export and self.coverage_enabled,
+            coverage_diff=self.args.coverage_diff,
+            message_index=self.message_index,
+            profile=self.args.profile,
             additional_files=self.additional_files,
+            selection_name=self.args.rank_coverage,
+            jobs=max(1, self.args.jobs),
+            use_sessions=self.use_sessions,
+            simulator_threads=self.simulator_threads,
+            cpu_affinity=self.cpu_affinity,
+            scratch=scratch,
+            retention=self.retention,
+            log_capture=log_capture,
+            resource_pools=self.resource_pools,
+            step_resources=self.step_resources,
+            tracer=Tracer(enabled=self.args.trace),
         )
 
         runner = Runner(config)
@@ -422,6 +846,12 @@ class TestHDL:
 
         if self.args.coverage:
             action = RunAction.SHOW_COVERAGE
+        elif self.args.rank_coverage is not None:
+            action = RunAction.RANK_COVERAGE
+        elif self.args.coverage_diff is not None:
+            action = RunAction.COVERAGE_DIFF
+        elif self.args.reverdict:
+            action = RunAction.REVERDICT
         elif self.args.show_waves:
             action = RunAction.SHOW_WAVES
         elif self.args.clean:
@@ -449,13 +879,17 @@ class TestHDL:
             exit(-1)
         except TestRunError as e:
             if not self.args.verbose and e.logs_file is not None:
-                utils.print_file(e.logs_file)
+                print_failure_excerpt(
+                    e.logs_file, self.excerpt_sites, self.excerpt_context
+                )
 
             log.error("%s", e.message)
             exit(-1)
         except SimulatorError as e:
             if not self.args.verbose and e.logs_file is not None:
-                utils.print_file(e.logs_file)
+                print_failure_excerpt(
+                    e.logs_file, self.excerpt_sites, self.excerpt_context
+                )
 
             log.critical("%s", e.message)
             exit(-1)
@@ -0,0 +1,96 @@
+from pathlib import Path
+from typing import Dict, Iterator, List
+from contextlib import contextmanager
+
+import os
+import json
+import time
+import threading
+
+TRACE_FILENAME = "trace.json"
+
+
+class Tracer:
+    """Records the phases of a run as spans, and saves them in the Chrome
+    trace format, which can be opened with Perfetto (ui.perfetto.dev) or
+    chrome://tracing.
+
+    Every thread that records a span gets a worker id, shown as a track of
+    its own, so that idle workers can be spotted. When disabled, spans cost
+    next to nothing.
+    """
+
+    enabled: bool
+    events: List[Dict]
+    workers: Dict[int, int]
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.events = []
+        self.workers = {}
+        self.lock = threading.Lock()
+        self.time_origin = time.perf_counter()
+
+    def _get_worker(self) -> int:
+        """Returns the worker id of the current thread. Must be called with
+        the lock held."""
+        thread = threading.current_thread()
+        worker = self.workers.get(thread.ident or 0)
+        if worker is not None:
+            return worker
+
+        worker = len(self.workers)
+        self.workers[thread.ident or 0] = worker
+        self.events.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": worker,
+                "args": {"name": thread.name},
+            }
+        )
+        return worker
+
+    def _timestamp(self, time_value: float) -> float:
+        return (time_value - self.time_origin) * 1e6
+
+    @contextmanager
+    def span(self, name: str, category: str, **args) -> Iterator[None]:
+        """Records the time spent in the block as a span. `args` are shown
+        as its attributes. A span ended by an exception gets its type as
+        the `error` attribute."""
+        if not self.enabled:
+            yield
+            return
+
+        time_start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            args["error"] = type(e).__name__
+            raise
+        finally:
+            time_end = time.perf_counter()
+            with self.lock:
+                self.events.append(
+                    {
+                        "name": name,
+                        "cat": category,
+                        "ph": "X",
+                        "ts": self._timestamp(time_start),
+                        "dur": (time_end - time_start) * 1e6,
+                        "pid": os.getpid(),
+                        "tid": self._get_worker(),
+                        "args": args,
+                    }
+                )
+
+    def save(self, path: Path):
+        with self.lock:
+            events = list(self.events)
+
+        with open(path, "w") as outfile:
+            json.dump(
+                {"traceEvents": events, "displayTimeUnit": "ms"}, outfile, default=str
+            )
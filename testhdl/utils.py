@@ -1,10 +1,20 @@
 from pathlib import Path
-from typing import List, Optional
+from typing import IO, Callable, Deque, Iterator, List, Optional, Set, Union
+from collections import deque
+from contextlib import contextmanager
+
+from testhdl.log_capture import LogCapture, LogWriter, open_log_writer
+from testhdl.resource_usage import ProcessSampler, get_tracked_usage
+from testhdl.sim_progress import get_tracked_progress
 
 import re
+import os
 import sys
+import gzip
 import shutil
+import hashlib
 import logging
+import threading
 import subprocess
 
 log = logging.getLogger("testhdl")
@@ -15,9 +25,110 @@ def join_args(args: List[str]) -> str:
     return " ".join(cleaned_args)
 
 
-def print_file(file: Path):
-    with open(file, "r") as infile:
-        print(infile.read())
+PRINT_HEAD_BYTES = 256 * 1024
+PRINT_TAIL_BYTES = 256 * 1024
+
+
+def print_file(
+    file: Path,
+    head_bytes: int = PRINT_HEAD_BYTES,
+    tail_bytes: int = PRINT_TAIL_BYTES,
+):
+    """Prints a file line by line. Of big files only the first `head_bytes`
+    and the last `tail_bytes` are printed."""
+    tail: Deque[str] = deque()
+    tail_size = 0
+    skipped = 0
+
+    with open_log(file) as infile:
+        for line in infile:
+            if head_bytes > 0:
+                head_bytes -= len(line)
+                sys.stdout.write(line)
+                continue
+
+            tail.append(line)
+            tail_size += len(line)
+            while tail_size > tail_bytes:
+                tail_size -= len(tail.popleft())
+                skipped += 1
+
+    if skipped > 0:
+        sys.stdout.write(f"... {skipped} lines skipped, see {file.as_posix()} ...\n")
+    sys.stdout.writelines(tail)
+    sys.stdout.flush()
+
+
+COMPRESSED_SUFFIX = ".gz"
+
+
+def get_compressed_path(path: Path) -> Path:
+    return path.with_name(path.name + COMPRESSED_SUFFIX)
+
+
+def find_log(path: Path) -> Optional[Path]:
+    """Returns the path of a log file as it is on disk, which is the
+    compressed copy if the original was compressed, or None."""
+    if path.exists():
+        return path
+
+    path_compressed = get_compressed_path(path)
+    if path_compressed.exists():
+        return path_compressed
+
+    return None
+
+
+def open_log(path: Path, mode: str = "r") -> IO:
+    """Opens a log file for reading, transparently reading its compressed
+    copy if the original was compressed.
+
+    :param mode: "r" for text, "rb" for bytes
+    """
+    if not path.exists():
+        path_compressed = get_compressed_path(path)
+        if path_compressed.exists():
+            return gzip.open(path_compressed, "rt" if mode == "r" else mode)
+
+    return open(path, mode)
+
+
+def compress_file(path: Path, level: int = 6) -> Path:
+    """Compresses a file with gzip, replacing it with `<name>.gz`. The
+    original is only removed once the compressed copy is complete."""
+    path_compressed = get_compressed_path(path)
+    path_partial = path_compressed.with_name(path_compressed.name + ".partial")
+
+    with open(path, "rb") as infile:
+        with gzip.open(path_partial, "wb", compresslevel=level) as outfile:
+            shutil.copyfileobj(infile, outfile, 1024 * 1024)
+
+    os.replace(path_partial, path_compressed)
+    path.unlink()
+    return path_compressed
+
+
+def decompress_file(path: Path) -> Path:
+    """Restores a file compressed with `compress_file`, for the tools that
+    cannot read compressed files."""
+    path_compressed = get_compressed_path(path)
+    path_partial = path.with_name(path.name + ".partial")
+
+    with gzip.open(path_compressed, "rb") as infile:
+        with open(path_partial, "wb") as outfile:
+            shutil.copyfileobj(infile, outfile, 1024 * 1024)
+
+    os.replace(path_partial, path)
+    path_compressed.unlink()
+    return path
+
+
+def get_size(path: Path) -> int:
+    """Total size in bytes of a file or of everything in a folder."""
+    if path.is_file():
+        return path.stat().st_size
+
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
 
 
 def rmdir_if_exists(dir: Path):
@@ -25,54 +136,328 @@ def rmdir_if_exists(dir: Path):
         shutil.rmtree(dir)
 
 
+def clear_dir(path: Path, keep: Set[str]):
+    """Creates the folder, or empties it except for the entries named in
+    `keep`."""
+    if not path.exists():
+        path.mkdir(parents=True)
+        return
+
+    for entry in path.iterdir():
+        if entry.name in keep:
+            continue
+        if entry.is_dir() and not entry.is_symlink():
+            shutil.rmtree(entry)
+        else:
+            entry.unlink()
+
+
+# ioctl cloning a file on copy on write filesystems, e.g. Btrfs or XFS
+FICLONE = 0x40049409
+
+
+def _reflink(path_src: Path, path_dst: Path):
+    if not sys.platform.startswith("linux"):
+        raise OSError("Reflinks are only supported on Linux")
+
+    import fcntl
+
+    with open(path_src, "rb") as infile, open(path_dst, "wb") as outfile:
+        try:
+            fcntl.ioctl(outfile.fileno(), FICLONE, infile.fileno())
+        except OSError:
+            outfile.close()
+            path_dst.unlink()
+            raise
+
+
+def _is_staged(path_src: Path, path_dst: Path) -> bool:
+    if not path_dst.exists():
+        return False
+
+    if os.path.samefile(path_src, path_dst):
+        return True
+
+    if path_dst.is_symlink():
+        return False
+
+    # A copy from a previous run, see sync_dir
+    stat_src = path_src.stat()
+    stat_dst = path_dst.stat()
+    same_size = stat_dst.st_size == stat_src.st_size
+    same_time = int(stat_dst.st_mtime) == int(stat_src.st_mtime)
+    return same_size and same_time
+
+
+def stage_file(path_src: Path, path_dst: Path) -> Optional[str]:
+    """Makes a file available at another path without copying it where
+    possible: as a hardlink, else a symlink (e.g. across filesystems), else
+    a reflink, else a copy. Hardlinks and symlinks share the content of the
+    file, so it must not be written to through `path_dst`.
+
+    :return: how the file was staged, None if `path_dst` already was the
+             same file, or an unchanged copy of it
+    """
+    if _is_staged(path_src, path_dst):
+        return None
+
+    if path_dst.exists() or path_dst.is_symlink():
+        path_dst.unlink()
+
+    try:
+        os.link(path_src, path_dst)
+        return "hardlink"
+    except OSError:
+        pass
+
+    try:
+        os.symlink(path_src.absolute(), path_dst)
+        return "symlink"
+    except OSError:
+        pass
+
+    try:
+        _reflink(path_src, path_dst)
+        shutil.copystat(path_src, path_dst)
+        return "reflink"
+    except OSError:
+        pass
+
+    shutil.copy2(path_src, path_dst)
+    return "copy"
+
+
+def stage_files(paths: List[Path], path_dir: Path):
+    for path in paths:
+        method = stage_file(path, path_dir / path.name)
+        if method is None:
+            log.debug("%s already staged", path.as_posix())
+        else:
+            log.debug("Staged %s as a %s", path.as_posix(), method)
+
+
+def sync_dir(path_src: Path, path_dst: Path) -> int:
+    """Makes `path_dst` a copy of `path_src`. Like rsync, files with the
+    same size and modification time (to the second) are assumed unchanged
+    and not copied again, and files no longer in `path_src` are deleted.
+
+    :return: how many files were copied
+    """
+    copied = 0
+    kept = set()
+    path_dst.mkdir(parents=True, exist_ok=True)
+
+    for path in path_src.rglob("*"):
+        path_rel = path.relative_to(path_src)
+        target = path_dst / path_rel
+        kept.add(path_rel)
+        if path.is_dir():
+            target.mkdir(parents=True, exist_ok=True)
+            continue
+
+        stat = path.stat()
+        if target.exists():
+            target_stat = target.stat()
+            same_size = target_stat.st_size == stat.st_size
+            same_time = int(target_stat.st_mtime) == int(stat.st_mtime)
+            if same_size and same_time:
+                continue
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(path, target)
+        copied += 1
+
+    # Deepest first, so that folders are empty once their files are gone
+    for path in sorted(path_dst.rglob("*"), reverse=True):
+        if path.relative_to(path_dst) in kept:
+            continue
+        if path.is_dir() and not path.is_symlink():
+            shutil.rmtree(path)
+        else:
+            path.unlink()
+
+    return copied
+
+
+def fingerprint(paths: List[Path], extra: Optional[List[str]] = None) -> str:
+    """Hashes the content of the given files, together with some extra
+    strings (typically arguments), into a short hex digest. Directories
+    are hashed recursively."""
+    digest = hashlib.sha1()
+
+    for arg in extra or []:
+        digest.update(arg.encode("utf-8"))
+        digest.update(b"\0")
+
+    for path in paths:
+        if path.is_dir():
+            files = sorted(p for p in path.rglob("*") if p.is_file())
+        else:
+            files = [path]
+
+        for file in files:
+            digest.update(file.as_posix().encode("utf-8"))
+            digest.update(b"\0")
+            with open(file, "rb") as infile:
+                while True:
+                    chunk = infile.read(1024 * 64)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+
+    return digest.hexdigest()[:16]
+
+
+def find_cache_entries(path_cache: Path, name: str, suffix: str = "") -> List[Path]:
+    """Entries of a cache folder named `<name>_<fingerprint><suffix>`. Entries
+    of other names sharing the prefix, e.g. `alu_ops_<fingerprint>` for
+    `alu`, don't match."""
+    pattern = re.compile(re.escape(name) + r"_[0-9a-f]{16}" + re.escape(suffix))
+    if not path_cache.exists():
+        return []
+
+    return [path for path in path_cache.iterdir() if pattern.fullmatch(path.name)]
+
+
 READ_CHUNK_SIZE = 1024 * 4
 
 re_progress = r"{([0-9\.]+) ns}"
 
 
+def copy_output(
+    stream: IO[bytes],
+    file_out: Optional[Union[IO[bytes], LogWriter]],
+    echo: bool,
+    until: Optional[str] = None,
+) -> bool:
+    """Copies the output of a program line by line into a log file, and
+    optionally to stdout, until the stream is closed.
+
+    If `until` is given, it stops at the first line that contains it. That
+    line is not copied, and the stream is left open so it can be read again.
+
+    :return: whether the `until` line was found
+    """
+    found_timestamp = False
+    progress = get_tracked_progress()
+
+    try:
+        while True:
+            # chunk = proc.stdout.read(READ_CHUNK_SIZE)
+            chunk = stream.readline()
+            if not chunk:
+                return False
+
+            decoded = chunk.decode("utf-8", errors="replace")
+
+            if until is not None and until in decoded:
+                return True
+
+            if "run -all" in decoded:
+                log.info("Simulation Started!")
+
+            match = re.search(re_progress, decoded)
+            if match:
+                status = "Last timestamp: " + match.group(0)
+                if progress is not None:
+                    status = progress.update(float(match.group(1)))
+                if not echo:
+                    print("\r" + status, end="")
+                found_timestamp = True
+
+            if echo:
+                # Better redirection
+                sys.stdout.buffer.write(chunk)
+            if file_out is not None:
+                file_out.write(chunk)
+    finally:
+        if found_timestamp:
+            print()
+
+
+_process_context = threading.local()
+
+
+@contextmanager
+def process_context(cpus: Optional[List[int]] = None) -> Iterator[None]:
+    """Programs started by `run_program` from the current thread within the
+    block only run on the given CPUs."""
+    previous = getattr(_process_context, "cpus", None)
+    _process_context.cpus = cpus
+    try:
+        yield
+    finally:
+        _process_context.cpus = previous
+
+
+def _get_preexec() -> Optional[Callable[[], None]]:
+    cpus = getattr(_process_context, "cpus", None)
+    if cpus is None or not hasattr(os, "sched_setaffinity"):
+        return None
+
+    def preexec():
+        # Runs in the child between fork and exec, so only a system call
+        os.sched_setaffinity(0, cpus)
+
+    return preexec
+
+
+def set_thread_nice(nice: int):
+    """Lowers the priority of the current thread by `nice`, and so of the
+    programs it starts, which inherit it. Meant as the initializer of the
+    threads doing background work. Only done on Linux, where every thread
+    has a niceness of its own."""
+    if nice <= 0 or not sys.platform.startswith("linux"):
+        return
+
+    thread_id = threading.get_native_id()
+    try:
+        current = os.getpriority(os.PRIO_PROCESS, thread_id)
+        os.setpriority(os.PRIO_PROCESS, thread_id, current + nice)
+    except OSError:
+        log.debug("Could not lower the priority of a background thread")
+
+
 def run_program(
-    args: List[str], cwd: Path, stdout_out: Optional[Path] = None, echo: bool = False
+    args: List[str],
+    cwd: Path,
+    stdout_out: Optional[Path] = None,
+    echo: bool = False,
+    log_capture: Optional[LogCapture] = None,
 ) -> int:
     log.debug("Running '%s'", join_args(args))
-    found_timestamp = False
 
     file_out = None
     if stdout_out is not None:
-        file_out = open(stdout_out, "wb")
+        file_out = open_log_writer(stdout_out, log_capture)
+
+    # Only sampled when the caller is tracking the usage, see
+    # resource_usage.track_usage
+    usage = get_tracked_usage()
 
     try:
-        with subprocess.Popen(args, cwd=cwd, stdout=subprocess.PIPE) as proc:
+        with subprocess.Popen(
+            args, cwd=cwd, stdout=subprocess.PIPE, preexec_fn=_get_preexec()
+        ) as proc:
             assert proc.stdout is not None
 
-            while True:
-                # chunk = proc.stdout.read(READ_CHUNK_SIZE)
-                chunk = proc.stdout.readline()
-                if not chunk:
-                    break
-
-                decoded = chunk.decode("utf-8")
-
-                if "run -all" in decoded:
-                    log.info("Simulation Started!")
-
-                match = re.search(re_progress, decoded)
-                if match:
-                    if not echo:
-                        print("\rLast timestamp: " + match.group(0), end="")
-                    found_timestamp = True
-
-                if echo:
-                    # Better redirection
-                    sys.stdout.buffer.write(chunk)
-                if file_out is not None:
-                    file_out.write(chunk)
+            sampler = ProcessSampler(proc.pid) if usage is not None else None
+            try:
+                copy_output(proc.stdout, file_out, echo)
+            except BaseException:
+                if sampler is not None:
+                    sampler.stop()
+                raise
 
             # TODO: Adding a timeout here could be important
-            rc = proc.wait()
+            if sampler is None:
+                return proc.wait()
+
+            rc, program_usage = sampler.wait(proc)
+            assert usage is not None
+            usage.add(program_usage)
             return rc
 
     finally:
-        if found_timestamp:
-            print()
         if file_out is not None:
             file_out.close()
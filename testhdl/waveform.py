@@ -0,0 +1,435 @@
+"""Compact, indexed storage for VCD waveforms.
+
+A VCD file is converted once into a folder holding an index (`index.json`)
+and the value changes of every signal, stored contiguously as arrays of
+unsigned 64 bit words (`data.bin`). Queries then memory map only the signals
+they need, instead of parsing the whole text file again.
+
+For every value change the store keeps the time, the value and a mask of
+the bits that are X or Z. Where the mask is set, the value bit tells them
+apart: 0 for X, 1 for Z. Signals wider than 64 bits use several words per
+change, least significant word first. Real variables store the bits of a
+double in the value word.
+
+Converting only needs the standard library. Queries need NumPy:
+
+    store = load_waveform(Path("logs/Test/wave.vcd"))
+    times, values, masks = store.changes("top.dut.valid", 0, 1000)
+"""
+
+from pathlib import Path
+from array import array
+from dataclasses import dataclass
+from typing import IO, Dict, List, Optional, Sequence, Tuple
+
+from testhdl import utils
+
+import os
+import json
+import struct
+import logging
+import tempfile
+
+log = logging.getLogger("waveform")
+
+STORE_VERSION = 2
+STORE_SUFFIX = ".wdb"
+
+# Buffered changes are spilled to disk once they take more than this
+SPILL_THRESHOLD_BYTES = 64 * 1024 * 1024
+
+MASK_64 = (1 << 64) - 1
+
+
+@dataclass
+class SignalInfo:
+    name: str
+    code: str
+    kind: str
+    width: int
+    words: int
+    count: int
+
+
+def _words_for_width(width: int) -> int:
+    return max(1, (width + 63) // 64)
+
+
+def _split_words(value: int, words: int) -> List[int]:
+    return [(value >> (64 * i)) & MASK_64 for i in range(words)]
+
+
+def _parse_vector(text: str, width: int) -> Tuple[int, int]:
+    """Parses the digits of a VCD vector into (value, xz mask). Z bits are
+    set in the value too."""
+    if len(text) < width:
+        # Vectors are left extended with their leftmost digit when it is
+        # X or Z, with zeroes otherwise
+        fill = text[0] if text[0] in "xXzZ" else "0"
+        text = fill * (width - len(text)) + text
+
+    value = 0
+    mask = 0
+    for digit in text:
+        value <<= 1
+        mask <<= 1
+        if digit == "1":
+            value |= 1
+        elif digit in "zZ":
+            value |= 1
+            mask |= 1
+        elif digit != "0":
+            mask |= 1
+
+    return value, mask
+
+
+class _SignalBuffer:
+    words: int
+    times: array
+    values: array
+    masks: array
+    spilled: List[Tuple[int, int]]
+    count: int
+
+    def __init__(self, words: int):
+        self.words = words
+        self.times = array("Q")
+        self.values = array("Q")
+        self.masks = array("Q")
+        # (offset in the spill file, number of changes) of every spilled chunk
+        self.spilled = []
+        self.count = 0
+
+    def append(self, time: int, value: int, mask: int):
+        self.times.append(time)
+        if self.words == 1:
+            self.values.append(value & MASK_64)
+            self.masks.append(mask & MASK_64)
+        else:
+            self.values.extend(_split_words(value, self.words))
+            self.masks.extend(_split_words(mask, self.words))
+        self.count += 1
+
+    def spill(self, spill_file: IO[bytes]):
+        if len(self.times) == 0:
+            return
+
+        self.spilled.append((spill_file.tell(), len(self.times)))
+        self.times.tofile(spill_file)
+        self.values.tofile(spill_file)
+        self.masks.tofile(spill_file)
+
+        self.times = array("Q")
+        self.values = array("Q")
+        self.masks = array("Q")
+
+
+def convert_vcd(path_vcd: Path, path_store: Path):
+    """Converts a VCD file into an indexed store in the `path_store` folder."""
+
+    signals: Dict[str, Dict] = {}
+    buffers: Dict[str, _SignalBuffer] = {}
+    widths: Dict[str, int] = {}
+    scope: List[str] = []
+    timescale = ""
+    time = 0
+    end_time = 0
+    buffered = 0
+
+    path_store.mkdir(parents=True, exist_ok=True)
+
+    with utils.open_log(path_vcd) as vcd, tempfile.TemporaryFile(
+        dir=path_store
+    ) as spill_file:
+        in_header = True
+        tokens: List[str] = []
+        # Vector and real values are followed by the identifier as a
+        # separate token
+        pending_vector: Optional[str] = None
+        pending_real: Optional[float] = None
+        # Comments can also appear between value changes
+        in_comment = False
+
+        for line in vcd:
+            if in_header:
+                tokens += line.split()
+
+                while in_header and "$end" in tokens:
+                    end = tokens.index("$end")
+                    command = tokens[:end]
+                    tokens = tokens[end + 1 :]
+
+                    if command[0] == "$scope":
+                        scope.append(command[2])
+                    elif command[0] == "$upscope":
+                        scope.pop()
+                    elif command[0] == "$timescale":
+                        timescale = "".join(command[1:])
+                    elif command[0] == "$var":
+                        kind, width, code = command[1], int(command[2]), command[3]
+                        full_name = ".".join(scope + [command[4]])
+                        signals[full_name] = {"code": code, "kind": kind, "width": width}
+                        # Several variables may share an identifier
+                        if code not in buffers:
+                            words = 1 if kind == "real" else _words_for_width(width)
+                            buffers[code] = _SignalBuffer(words)
+                            widths[code] = width
+                    elif command[0] == "$enddefinitions":
+                        in_header = False
+
+                if in_header:
+                    continue
+                line = " ".join(tokens)
+
+            for token in line.split():
+                first = token[0]
+
+                if in_comment:
+                    in_comment = token != "$end"
+                    continue
+                if token == "$comment":
+                    in_comment = True
+                    continue
+
+                if pending_vector is not None or pending_real is not None:
+                    buffer = buffers[token]
+                    if pending_vector is not None:
+                        value, mask = _parse_vector(pending_vector, widths[token])
+                        buffer.append(time, value, mask)
+                    else:
+                        bits = struct.unpack("<Q", struct.pack("<d", pending_real))[0]
+                        buffer.append(time, bits, 0)
+                    pending_vector = None
+                    pending_real = None
+                    buffered += 8 + 16 * buffer.words
+                elif first == "#":
+                    time = int(token[1:])
+                    end_time = max(end_time, time)
+                elif first in "01xXzZ":
+                    buffer = buffers[token[1:]]
+                    if first == "1":
+                        buffer.append(time, 1, 0)
+                    elif first == "0":
+                        buffer.append(time, 0, 0)
+                    elif first in "zZ":
+                        buffer.append(time, 1, 1)
+                    else:
+                        buffer.append(time, 0, 1)
+                    buffered += 8 + 16 * buffer.words
+                elif first in "bB":
+                    pending_vector = token[1:]
+                elif first in "rR":
+                    pending_real = float(token[1:])
+                # Anything else is $dumpvars, $dumpon, $end... which only
+                # wrap value changes
+
+                if buffered > SPILL_THRESHOLD_BYTES:
+                    for buffer in buffers.values():
+                        buffer.spill(spill_file)
+                    buffered = 0
+
+        _write_store(path_store, signals, buffers, timescale, end_time, spill_file)
+
+
+def _write_store(
+    path_store: Path,
+    signals: Dict[str, Dict],
+    buffers: Dict[str, "_SignalBuffer"],
+    timescale: str,
+    end_time: int,
+    spill_file: IO[bytes],
+):
+    data_index = {}
+    path_data = path_store / "data.bin"
+
+    with open(path_data, "wb") as data:
+        for code, buffer in buffers.items():
+            entry = {"count": buffer.count, "words": buffer.words}
+            parts: Dict[str, List[array]] = {"times": [], "values": [], "masks": []}
+
+            for offset, count in buffer.spilled:
+                spill_file.seek(offset)
+                for part, length in [
+                    ("times", count),
+                    ("values", count * buffer.words),
+                    ("masks", count * buffer.words),
+                ]:
+                    chunk = array("Q")
+                    chunk.fromfile(spill_file, length)
+                    parts[part].append(chunk)
+
+            parts["times"].append(buffer.times)
+            parts["values"].append(buffer.values)
+            parts["masks"].append(buffer.masks)
+
+            for part in ["times", "values", "masks"]:
+                entry[part] = data.tell()
+                for chunk in parts[part]:
+                    chunk.tofile(data)
+
+            data_index[code] = entry
+
+    index = {
+        "version": STORE_VERSION,
+        "timescale": timescale,
+        "end_time": end_time,
+        "byteorder": "little" if array("H", [1]).tobytes()[0] == 1 else "big",
+        "signals": signals,
+        "data": data_index,
+    }
+
+    # The index is written last, a store without it is incomplete
+    path_index = path_store / "index.json"
+    with open(path_store / "index.json.tmp", "w") as outfile:
+        json.dump(index, outfile)
+    os.replace(path_store / "index.json.tmp", path_index)
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError(
+            "NumPy is required to query waveforms, install it with `pip install numpy`"
+        ) from e
+
+    return numpy
+
+
+class WaveformStore:
+    """Read access to a store created by `convert_vcd`."""
+
+    path: Path
+    timescale: str
+    end_time: int
+
+    def __init__(self, path_store: Path):
+        self.np = _import_numpy()
+        self.path = path_store
+
+        with open(path_store / "index.json", "r") as infile:
+            index = json.load(infile)
+
+        if index["version"] != STORE_VERSION:
+            raise ValueError(f"Unsupported waveform store version {index['version']}")
+
+        self.timescale = index["timescale"]
+        self.end_time = index["end_time"]
+        self._signals = index["signals"]
+        self._data = index["data"]
+
+        dtype = "<u8" if index["byteorder"] == "little" else ">u8"
+        size = (path_store / "data.bin").stat().st_size
+        if size > 0:
+            self._words = self.np.memmap(
+                path_store / "data.bin", dtype=dtype, mode="r"
+            )
+        else:
+            self._words = self.np.zeros(0, dtype=dtype)
+
+    def signals(self, prefix: str = "") -> List[str]:
+        """Lists the names of all signals, optionally only those starting
+        with `prefix` (e.g. a scope like "top.dut.")."""
+        return sorted(name for name in self._signals if name.startswith(prefix))
+
+    def signal_info(self, name: str) -> SignalInfo:
+        signal = self._signals[name]
+        data = self._data[signal["code"]]
+        return SignalInfo(
+            name=name,
+            code=signal["code"],
+            kind=signal["kind"],
+            width=signal["width"],
+            words=data["words"],
+            count=data["count"],
+        )
+
+    def _arrays(self, name: str):
+        data = self._data[self._signals[name]["code"]]
+        count, words = data["count"], data["words"]
+
+        # Offsets are in bytes, the memory map is in 64 bit words
+        times = self._words[data["times"] // 8 : data["times"] // 8 + count]
+        values = self._words[data["values"] // 8 : data["values"] // 8 + count * words]
+        masks = self._words[data["masks"] // 8 : data["masks"] // 8 + count * words]
+
+        if words > 1:
+            values = values.reshape(count, words)
+            masks = masks.reshape(count, words)
+
+        return times, values, masks
+
+    def changes(
+        self,
+        name: str,
+        t_start: Optional[int] = None,
+        t_end: Optional[int] = None,
+    ):
+        """Returns the value changes of a signal with `t_start <= t <= t_end`,
+        as (times, values, masks) arrays. Bits set in the mask are X, or Z
+        if they are also set in the value."""
+        times, values, masks = self._arrays(name)
+
+        start = 0 if t_start is None else self.np.searchsorted(times, t_start, "left")
+        end = len(times) if t_end is None else self.np.searchsorted(times, t_end, "right")
+
+        return times[start:end], values[start:end], masks[start:end]
+
+    def sample(self, names: Sequence[str], timestamps) -> Dict[str, Tuple]:
+        """Samples many signals at the given timestamps. Returns, for each
+        signal, the (values, masks) it had at every timestamp. Before the
+        first change of a signal every bit is reported as unknown."""
+        np = self.np
+        timestamps = np.asarray(timestamps, dtype=np.uint64)
+        result = {}
+
+        for name in names:
+            times, values, masks = self._arrays(name)
+            indices = np.searchsorted(times, timestamps, "right") - 1
+            before_start = indices < 0
+            indices = np.maximum(indices, 0)
+
+            if len(times) == 0:
+                shape = (len(timestamps),) + values.shape[1:]
+                sampled_values = np.zeros(shape, dtype=np.uint64)
+                sampled_masks = np.full(shape, MASK_64, dtype=np.uint64)
+            else:
+                sampled_values = np.array(values[indices])
+                sampled_masks = np.array(masks[indices])
+                sampled_values[before_start] = 0
+                sampled_masks[before_start] = MASK_64
+
+            result[name] = (sampled_values, sampled_masks)
+
+        return result
+
+
+def get_store_path(path_vcd: Path) -> Path:
+    return path_vcd.with_suffix(STORE_SUFFIX)
+
+
+def _is_store_current(path_index: Path, path_vcd: Path) -> bool:
+    if not path_index.exists() or path_index.stat().st_mtime < path_vcd.stat().st_mtime:
+        return False
+
+    # Stores written by older versions are converted again
+    with open(path_index, "r") as infile:
+        return json.load(infile)["version"] == STORE_VERSION
+
+
+def load_waveform(path_vcd: Path) -> WaveformStore:
+    """Opens the store of a VCD file, converting it first if the store is
+    missing or older than the VCD. Compressed VCDs are read transparently."""
+    path_store = get_store_path(path_vcd)
+    path_index = path_store / "index.json"
+
+    path_found = utils.find_log(path_vcd)
+    if path_found is None:
+        raise FileNotFoundError(path_vcd)
+
+    if not _is_store_current(path_index, path_found):
+        log.info("Indexing waveform %s", path_vcd.as_posix())
+        convert_vcd(path_vcd, path_store)
+
+    return WaveformStore(path_store)
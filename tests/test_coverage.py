@@ -0,0 +1,64 @@
+from pathlib import Path
+
+import textwrap
+
+from testhdl.coverage import parse_ranktest_output
+from testhdl.coverage_db import CoverageMetric, parse_coverage_report
+
+
+def test_parse_coverage_report(tmp_path: Path):
+    path_report = tmp_path / "report.txt"
+    path_report.write_text(
+        textwrap.dedent(
+            """\
+            Coverage Report by instance with details
+
+            =================================================================================
+            === Instance: /top
+            === Design Unit: work.top
+            =================================================================================
+                Enabled Coverage              Bins      Hits    Misses  Coverage
+                ----------------              ----      ----    ------  --------
+                Statements                      10        10         0   100.00%
+
+            =================================================================================
+            === Instance: /top/dut
+            === Design Unit: work.dut
+            =================================================================================
+                Enabled Coverage              Bins      Hits    Misses  Coverage
+                ----------------              ----      ----    ------  --------
+                Branches                        10         8         2    80.00%
+                Toggle Bins                      4         1         3    25.00%
+
+            Branch Coverage:
+                Enabled Coverage              Bins      Hits    Misses  Coverage
+                ----------------              ----      ----    ------  --------
+                Branches                        10         8         2    80.00%
+            """
+        )
+    )
+
+    assert parse_coverage_report(path_report) == [
+        CoverageMetric("/top", "Statements", 10, 10),
+        CoverageMetric("/top/dut", "Branches", 10, 8),
+        CoverageMetric("/top/dut", "Toggle Bins", 4, 1),
+    ]
+
+
+def test_parse_ranktest_output(tmp_path: Path):
+    databases = [tmp_path / test / "coverage.ucdb" for test in ["a", "b", "c", "d"]]
+    path_report = tmp_path / "rank.txt"
+    path_report.write_text(
+        textwrap.dedent(
+            f"""\
+            Ranking of contributing tests:
+               1  c     62.50
+               2  {databases[0].as_posix()}  75.00
+               3  c     75.00
+            Non-contributing tests:
+               b
+            """
+        )
+    )
+
+    assert parse_ranktest_output(path_report, databases) == [databases[2], databases[0]]
@@ -0,0 +1,37 @@
+from testhdl.cpu_affinity import CpuAllocator, get_available_cpus, get_thread_budget
+
+
+def test_get_thread_budget():
+    assert get_thread_budget(cores=16, jobs=4, threads=2) == 2
+    assert get_thread_budget(cores=16, jobs=4, threads=8) == 4
+    assert get_thread_budget(cores=4, jobs=8, threads=2) == 1
+    assert get_thread_budget(cores=8, jobs=0, threads=4) == 4
+
+
+def test_get_available_cpus():
+    cpus = get_available_cpus()
+    assert len(cpus) > 0
+    assert cpus == sorted(cpus)
+
+
+def test_allocator_spreads_sets():
+    allocator = CpuAllocator([2, 3, 4, 5])
+
+    first = allocator.allocate(2)
+    second = allocator.allocate(2)
+    assert first == [2, 3]
+    assert second == [4, 5]
+
+    # All busy, the least used are shared
+    third = allocator.allocate(1)
+    assert third == [2]
+
+    allocator.release(second)
+    assert allocator.allocate(3) == [3, 4, 5]
+
+
+def test_allocator_clamps_count():
+    allocator = CpuAllocator([0, 1])
+
+    assert allocator.allocate(8) == [0, 1]
+    assert allocator.allocate(0) == [0]
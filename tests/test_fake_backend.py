@@ -0,0 +1,250 @@
+"""Smoke tests of whole runs over the fake simulator backend.
+
+Every test writes a small run script in a temporary project, as a user of
+testhdl would, and runs it in a subprocess with the command line arguments
+under test.
+"""
+
+from pathlib import Path
+from typing import List
+
+import os
+import sys
+import json
+import textwrap
+import subprocess
+
+import pytest
+
+from testhdl.message_index import MessageIndex
+
+ROOT = Path(__file__).absolute().parent.parent
+
+HEADER = """\
+from pathlib import Path
+from testhdl import TestHDL, GeneratorHook
+
+th = TestHDL.from_args()
+th.set_simulator("fake")
+th.add_library("work").add_systemverilog_sources("t.sv")
+"""
+
+
+@pytest.fixture
+def project(tmp_path: Path) -> Path:
+    (tmp_path / "t.sv").write_text("module t; endmodule\n")
+    return tmp_path
+
+
+def write_script(project: Path, body: str):
+    script = HEADER + textwrap.dedent(body) + "th.run()\n"
+    (project / "run.py").write_text(script)
+
+
+def run(project: Path, *args: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [ROOT.as_posix(), *filter(None, [env.get("PYTHONPATH")])]
+    )
+    return subprocess.run(
+        [sys.executable, "run.py", *args],
+        cwd=project,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        timeout=120,
+    )
+
+
+def read_result(project: Path, test: str) -> dict:
+    return json.loads((project / "logs" / test / "result.json").read_text())
+
+
+def history(project: Path, test: str) -> List[Path]:
+    return sorted((project / "logs" / "history" / test).iterdir())
+
+
+def test_parallel_run(project: Path):
+    write_script(
+        project,
+        """
+        for i in range(4):
+            th.add_test(f"T{i}", runtime_args=["+fake_lines=20", "+fake_duration=0.2"])
+        """,
+    )
+
+    result = run(project, "-a", "-j", "2")
+
+    assert result.returncode == 0, result.stdout
+    assert "Running 4 tests on 2 workers" in result.stdout
+    for i in range(4):
+        assert read_result(project, f"T{i}")["passed"]
+
+
+def test_failure_excerpt(project: Path):
+    write_script(
+        project,
+        """
+        th.add_test("F", runtime_args=["+fake_lines=5", "+fake_error_rate=1"])
+        """,
+    )
+
+    result = run(project, "F")
+
+    assert result.returncode != 0
+    assert "First 5 of 5 error sites in logs/F/simulator.log:" in result.stdout
+    assert "> # ** Error: fake error at 40 ns" in result.stdout
+    assert "Full log:" in result.stdout
+    assert not read_result(project, "F")["passed"]
+
+
+def test_retention_and_message_index(project: Path):
+    write_script(
+        project,
+        """
+        th.enable_message_index()
+        th.set_retention(keep_runs=1)
+        th.add_test("A", runtime_args=["+fake_lines=5", "+fake_style=uvm"])
+        th.add_test("F", runtime_args=["+fake_lines=5", "+fake_error_rate=1"])
+        """,
+    )
+
+    for _ in range(3):
+        run(project, "-a", "-j", "2")
+
+    # Passing runs are pruned, failures are kept
+    assert len(history(project, "A")) == 1
+    assert len(history(project, "F")) == 2
+    assert (project / "logs" / "A" / "simulator.log.gz").exists()
+    assert (project / "logs" / "F" / "simulator.log").exists()
+
+    index = MessageIndex(project / "logs" / "messages.db")
+    messages = index.search(index.resolve_run(-1), message_id="FAKE")
+    assert [m.test for m in messages] == ["A"] * 5
+
+
+def test_reverdict(project: Path):
+    write_script(
+        project,
+        """
+        th.add_test("A", runtime_args=["+fake_lines=5"])
+        th.add_test("F", runtime_args=["+fake_lines=5", "+fake_error_rate=1"])
+        """,
+    )
+    run(project, "-a")
+
+    result = run(project, "--reverdict")
+    assert result.returncode != 0
+    assert "1/2 tests passed" in result.stdout
+
+    (project / "logs" / "F" / "simulator.log").write_text("# all good\n")
+
+    result = run(project, "--reverdict")
+    assert result.returncode == 0, result.stdout
+    assert "2/2 tests passed" in result.stdout
+    assert read_result(project, "F")["passed"]
+
+
+def test_scratch(project: Path):
+    (project / "scratch").mkdir()
+    write_script(
+        project,
+        """
+        th.set_scratchdir("scratch")
+        th.add_test("A", runtime_args=["+fake_lines=5"])
+        th.add_test("F", runtime_args=["+fake_lines=5", "+fake_error_rate=1"])
+        """,
+    )
+
+    result = run(project, "-a", "-j", "2")
+
+    assert result.returncode != 0
+    assert "Full log:" in result.stdout
+    assert not (project / "build").exists()
+    assert (project / "logs" / "A" / "simulator.log").exists()
+    assert (project / "logs" / "F" / "simulator.log").exists()
+
+    (area,) = (project / "scratch").iterdir()
+    assert (area / "build" / "work").is_dir()
+    assert list((area / "tests").iterdir()) == []
+
+
+def test_generators(project: Path):
+    write_script(
+        project,
+        """
+        class Broken(GeneratorHook):
+            def generate(self, path_outdir: Path, seed: int):
+                raise ValueError("model crashed")
+
+        th.add_test("X", runtime_args=["+fake_lines=5"], pre_hooks=[Broken(["a.txt"])])
+        """,
+    )
+
+    result = run(project, "X")
+
+    assert result.returncode != 0
+    assert "Generator Broken failed: model crashed" in result.stdout
+
+    (project / "model.py").write_text("")
+    write_script(
+        project,
+        """
+        class Vectors(GeneratorHook):
+            def generate(self, path_outdir: Path, seed: int):
+                (path_outdir / "stim.txt").write_text(f"{self.parameters}\\n")
+
+        for i in range(3):
+            th.add_test(
+                f"G{i}",
+                runtime_args=["+fake_lines=5"],
+                pre_hooks=[Vectors(["stim.txt"], scripts=["model.py"], parameters={"n": i % 2})],
+            )
+        """,
+    )
+
+    # G1 stages a different stim.txt in the working directory, so it only
+    # starts once G0 and G2 are done
+    result = run(project, "-a", "-j", "3")
+
+    assert result.returncode == 0, result.stdout
+    for i in range(3):
+        assert read_result(project, f"G{i}")["passed"]
+
+    entries = sorted((project / ".testhdl_cache" / "generators").iterdir())
+    assert len(entries) == 2
+    assert {(e / "stim.txt").read_text() for e in entries} == {
+        "{'n': 0}\n",
+        "{'n': 1}\n",
+    }
+
+    # Editing the hook invalidates its outputs
+    path_script = project / "run.py"
+    path_script.write_text(path_script.read_text().replace("\\n", " v2\\n"))
+    run(project, "-a")
+
+    entries = sorted((project / ".testhdl_cache" / "generators").iterdir())
+    assert len(entries) == 4
+
+
+def test_clean_keeps_cross_run_logs(project: Path):
+    write_script(
+        project,
+        """
+        th.enable_message_index()
+        th.set_retention(keep_runs=1)
+        th.add_test("A", runtime_args=["+fake_lines=5"])
+        """,
+    )
+    run(project, "-a")
+    run(project, "-a")
+
+    result = run(project, "--clean")
+
+    assert result.returncode == 0, result.stdout
+    path_logs = project / "logs"
+    assert not (path_logs / "A").exists()
+    assert (path_logs / "messages.db").exists()
+    assert (path_logs / "test_stats.json").exists()
+    assert len(history(project, "A")) == 1
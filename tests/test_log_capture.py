@@ -0,0 +1,48 @@
+from pathlib import Path
+from typing import List
+
+from testhdl.log_capture import LogCapture, LogSites, get_sites_path, open_log_writer
+
+
+def write_lines(path_log: Path, capture: LogCapture, lines: List[bytes]):
+    writer = open_log_writer(path_log, capture)
+    for line in lines:
+        writer.write(line)
+    writer.close()
+
+
+def test_sites(tmp_path: Path):
+    path_log = tmp_path / "simulator.log"
+    lines = [b"start\n", b"Error: one\n", b"ok\n", b"Error: two\n", b"Errors: 2\n"]
+    write_lines(
+        path_log, LogCapture(patterns=["Error"], summary_pattern="Errors:"), lines
+    )
+
+    assert path_log.read_bytes() == b"".join(lines)
+    sites = LogSites.load(get_sites_path(path_log))
+    assert sites.sites == [6, 20]
+    assert sites.total_sites == 2
+    assert sites.summary == 31
+
+
+def test_cap_keeps_verdict_lines(tmp_path: Path):
+    path_log = tmp_path / "simulator.log"
+    lines = [f"line {i}\n".encode() for i in range(100)]
+    lines[50] = b"Error: in the middle\n"
+    capture = LogCapture(patterns=["Error"], head_bytes=14, tail_bytes=16)
+    write_lines(path_log, capture, lines)
+
+    def gap(dropped: List[bytes]) -> bytes:
+        size = sum(len(line) for line in dropped)
+        gap = f"[testhdl] ... {len(dropped)} lines ({size} bytes) dropped by the log cap ...\n"
+        return gap.encode("utf-8")
+
+    content = path_log.read_bytes()
+    assert content == b"".join(
+        [*lines[:2], gap(lines[2:50]), lines[50], gap(lines[51:98]), *lines[98:]]
+    )
+
+    # Offsets in the capped log
+    sites = LogSites.load(get_sites_path(path_log))
+    assert sites.total_sites == 1
+    assert content[sites.sites[0] :].startswith(b"Error: in the middle")
@@ -0,0 +1,66 @@
+from pathlib import Path
+
+from testhdl.message_index import LogMessage, MessageIndex, parse_log_messages
+
+LOG = b"""\
+# UVM_INFO @ 0: reporter [RNTST] Running test base_test...
+# UVM_ERROR /src/env.sv(12) @ 1500: uvm_test_top.env.sb [MISMATCH] expected 1, got 0
+# ** Error: value out of range
+#    Time: 100 ns  Iteration: 0  Instance: /top/dut
+# ** Warning: no location
+tb.vhd:12:5:@250ns:(assertion error): checker failed
+plain line
+"""
+
+
+def write_log(tmp_path: Path) -> Path:
+    path_log = tmp_path / "simulator.log"
+    path_log.write_bytes(LOG)
+    return path_log
+
+
+def test_parse_log_messages(tmp_path: Path):
+    messages = list(parse_log_messages(write_log(tmp_path)))
+    starts = [b"# UVM_INFO", b"# UVM_ERROR", b"# ** Error", b"# ** Warning", b"tb.vhd"]
+    offsets = [LOG.index(start) for start in starts]
+
+    assert messages == [
+        LogMessage(
+            "UVM_INFO",
+            "RNTST",
+            "reporter",
+            0.0,
+            None,
+            offsets[0],
+            "Running test base_test...",
+        ),
+        LogMessage(
+            "UVM_ERROR",
+            "MISMATCH",
+            "uvm_test_top.env.sb",
+            1500.0,
+            None,
+            offsets[1],
+            "expected 1, got 0",
+        ),
+        LogMessage(
+            "Error", None, "/top/dut", 100.0, "ns", offsets[2], "value out of range"
+        ),
+        LogMessage("Warning", None, None, None, None, offsets[3], "no location"),
+        LogMessage("Error", None, "tb.vhd", 250.0, "ns", offsets[4], "checker failed"),
+    ]
+
+
+def test_search(tmp_path: Path):
+    path_log = write_log(tmp_path)
+    index = MessageIndex(tmp_path / "messages.db")
+
+    index.add_log(index.new_run("old"), "t0", path_log)
+    run = index.new_run("new")
+    index.add_log(run, "t1", path_log)
+    index.add_log(run, "t2", path_log)
+
+    assert index.resolve_run(-1) == run
+    assert [m.test for m in index.search(run, message_id="MISMATCH")] == ["t1", "t2"]
+    assert len(index.search(run, severity="error", test="t1")) == 3
+    assert index.count_by_test(run, component="/top") == [("t1", 1), ("t2", 1)]
@@ -0,0 +1,48 @@
+import threading
+
+from testhdl.resource_pools import ResourcePools
+
+
+def test_try_acquire():
+    pools = ResourcePools({"licence": 2, "mem_gb": 8})
+
+    assert pools.try_acquire({"licence": 1, "mem_gb": 6})
+    assert not pools.try_acquire({"licence": 1, "mem_gb": 4})
+    assert pools.try_acquire({"licence": 1, "mem_gb": 2})
+    assert not pools.try_acquire({"licence": 1})
+
+    pools.release({"licence": 1, "mem_gb": 6})
+    assert pools.used == {"licence": 1, "mem_gb": 2}
+    assert pools.try_acquire({"licence": 1})
+
+
+def test_unknown_and_oversized_requests():
+    pools = ResourcePools({"licence": 1})
+
+    # Not in any pool
+    assert pools.try_acquire({"gpu": 100})
+    # Bigger than the pool, granted once it is free
+    assert pools.try_acquire({"licence": 3})
+    assert not pools.try_acquire({"licence": 3})
+    pools.release({"licence": 3})
+    assert pools.used == {"licence": 0}
+
+
+def test_acquire_waits_for_release():
+    pools = ResourcePools({"licence": 1})
+    pools.acquire({"licence": 1})
+
+    acquired = threading.Event()
+
+    def worker():
+        with pools.use({"licence": 1}):
+            acquired.set()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    assert not acquired.wait(0.1)
+
+    pools.release({"licence": 1})
+    thread.join(5)
+    assert acquired.is_set()
+    assert pools.used == {"licence": 0}
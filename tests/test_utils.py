@@ -0,0 +1,52 @@
+from pathlib import Path
+
+from testhdl import utils
+
+FINGERPRINT = "0123456789abcdef"
+
+
+def test_find_cache_entries(tmp_path: Path):
+    names = [
+        f"alu_{FINGERPRINT}",
+        f"alu_{FINGERPRINT[::-1]}",
+        # Other entries sharing the prefix
+        f"alu_ops_{FINGERPRINT}",
+        f"alu_{FINGERPRINT}_old",
+        f"alu_{FINGERPRINT}.partial",
+        f"alu_{FINGERPRINT}.partial1234",
+        f"xalu_{FINGERPRINT}",
+        "alu_1234",
+    ]
+    for name in names:
+        (tmp_path / name).mkdir()
+
+    entries = utils.find_cache_entries(tmp_path, "alu")
+    assert sorted(path.name for path in entries) == sorted(names[:2])
+
+    assert utils.find_cache_entries(tmp_path / "missing", "alu") == []
+
+
+def test_find_cache_entries_suffix(tmp_path: Path):
+    names = [
+        f"top_{FINGERPRINT}.vvp",
+        f"top_{FINGERPRINT}.vvp.partial",
+        f"top_{FINGERPRINT}",
+    ]
+    for name in names:
+        (tmp_path / name).touch()
+
+    entries = utils.find_cache_entries(tmp_path, "top", ".vvp")
+    assert [path.name for path in entries] == [f"top_{FINGERPRINT}.vvp"]
+
+
+def test_fingerprint(tmp_path: Path):
+    path_source = tmp_path / "a.sv"
+    path_source.write_text("module a; endmodule\n")
+
+    before = utils.fingerprint([path_source], ["-O2"])
+    assert len(before) == len(FINGERPRINT)
+    assert utils.fingerprint([path_source], ["-O2"]) == before
+    assert utils.fingerprint([path_source], ["-O3"]) != before
+
+    path_source.write_text("module a(); endmodule\n")
+    assert utils.fingerprint([path_source], ["-O2"]) != before
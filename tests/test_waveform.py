@@ -0,0 +1,173 @@
+from array import array
+from pathlib import Path
+from typing import List, Tuple
+
+import json
+import struct
+import textwrap
+
+import pytest
+
+from testhdl.waveform import MASK_64, WaveformStore, convert_vcd, load_waveform
+
+HEADER = """\
+$date today $end
+$timescale 1ns $end
+$scope module top $end
+$var wire 1 ! clk $end
+$var wire 4 " nibble $end
+$var reg 70 # wide $end
+$var real 64 $ temp $end
+$upscope $end
+$enddefinitions $end
+"""
+
+
+def convert(tmp_path: Path, body: str) -> Path:
+    path_vcd = tmp_path / "wave.vcd"
+    path_vcd.write_text(HEADER + textwrap.dedent(body))
+    path_store = tmp_path / "wave.wdb"
+    convert_vcd(path_vcd, path_store)
+    return path_store
+
+
+def read_changes(path_store: Path, name: str) -> List[Tuple[int, List, List]]:
+    """The (time, value words, mask words) of every change of a signal,
+    read without NumPy."""
+    index = json.loads((path_store / "index.json").read_text())
+    data = index["data"][index["signals"][name]["code"]]
+    count, words = data["count"], data["words"]
+
+    raw = array("Q")
+    raw.frombytes((path_store / "data.bin").read_bytes())
+
+    def part(offset: int, length: int) -> List[int]:
+        return list(raw[offset // 8 : offset // 8 + length])
+
+    times = part(data["times"], count)
+    values = part(data["values"], count * words)
+    masks = part(data["masks"], count * words)
+    return [
+        (
+            times[i],
+            values[i * words : (i + 1) * words],
+            masks[i * words : (i + 1) * words],
+        )
+        for i in range(count)
+    ]
+
+
+def test_scalars(tmp_path: Path):
+    path_store = convert(
+        tmp_path,
+        """
+        #0
+        $dumpvars
+        x!
+        $end
+        #5
+        1!
+        #10
+        0!
+        #15
+        z!
+        """,
+    )
+
+    assert read_changes(path_store, "top.clk") == [
+        (0, [0], [1]),
+        (5, [1], [0]),
+        (10, [0], [0]),
+        (15, [1], [1]),
+    ]
+
+
+def test_padded_vectors(tmp_path: Path):
+    path_store = convert(
+        tmp_path,
+        """
+        #0
+        b1 "
+        #1
+        bx1 "
+        #2
+        bz "
+        #3
+        b10x0 "
+        """,
+    )
+
+    assert read_changes(path_store, "top.nibble") == [
+        # Zero extended
+        (0, [0b0001], [0b0000]),
+        # X and Z extended
+        (1, [0b0001], [0b1110]),
+        (2, [0b1111], [0b1111]),
+        (3, [0b1000], [0b0010]),
+    ]
+
+
+def test_wide_vector(tmp_path: Path):
+    path_store = convert(
+        tmp_path,
+        """
+        #0
+        b1""" + "0" * 69 + """ #
+        """,
+    )
+
+    assert read_changes(path_store, "top.wide") == [(0, [0, 1 << 5], [0, 0])]
+
+
+def test_real(tmp_path: Path):
+    path_store = convert(
+        tmp_path,
+        """
+        #0
+        r1.5 $
+        """,
+    )
+
+    ((time, (bits,), masks),) = read_changes(path_store, "top.temp")
+    assert time == 0
+    assert struct.unpack("<d", struct.pack("<Q", bits))[0] == 1.5
+    assert masks == [0]
+
+
+def test_comments(tmp_path: Path):
+    path_store = convert(
+        tmp_path,
+        """
+        #0
+        0!
+        $comment 1! b1111 " #7 $end
+        #10 $comment inline $end 1!
+        """,
+    )
+
+    assert read_changes(path_store, "top.clk") == [(0, [0], [0]), (10, [1], [0])]
+    assert read_changes(path_store, "top.nibble") == []
+
+    index = json.loads((path_store / "index.json").read_text())
+    assert index["end_time"] == 10
+    assert index["timescale"] == "1ns"
+
+
+def test_store_queries(tmp_path: Path):
+    pytest.importorskip("numpy")
+    path_vcd = tmp_path / "wave.vcd"
+    path_vcd.write_text(HEADER + "#0\n0!\n#5\n1!\n#10\nz!\n")
+
+    store = load_waveform(path_vcd)
+    assert isinstance(store, WaveformStore)
+    assert store.signals("top.n") == ["top.nibble"]
+
+    times, values, masks = store.changes("top.clk", 5, 10)
+    assert list(times) == [5, 10]
+    assert list(values) == [1, 1]
+    assert list(masks) == [0, 1]
+
+    sampled = store.sample(["top.clk", "top.nibble"], [0, 7])
+    assert list(sampled["top.clk"][0]) == [0, 1]
+    # Never assigned
+    assert list(sampled["top.nibble"][1]) == [MASK_64, MASK_64]